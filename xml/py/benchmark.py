@@ -0,0 +1,469 @@
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+
+from circuit_model import (
+    Circuito,
+    Punto,
+    Tramo,
+    circuit_from_root,
+    document_namespace,
+    element_text,
+    punto_from_element,
+)
+
+PY_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_SIZES = (10, 1000, 100000, 1000000)
+DEFAULT_THRESHOLD = 0.10
+
+# Casos medidos: script generador, nombre del fichero de salida y si el
+# generador lee los tramos del fichero binario (tramo_cache) junto al XML
+CASES = {
+    "kml": ("xml2kml.py", "circuito.kml", True),
+    "altimetria": ("xml2altimetria.py", "altimetria.svg", True),
+    "html": ("xml2html.py", "circuito.html", False),
+}
+
+
+def generate_circuit(path, tramos, pilotos=20, fotos=50, videos=20, seed=0):
+    """Escribe un circuito sintético válido según circuito.xsd.
+
+    El trazado es un lazo cerrado con ruido alrededor de Misano y un perfil
+    de altitud sinusoidal. Los tramos se escriben uno a uno, así que se pueden
+    generar ficheros de millones de tramos sin cargarlos en memoria. Como el
+    esquema limita posicion a 1..20, en clasificaciones más largas la
+    posición se repite cíclicamente.
+    """
+    rnd = random.Random(seed)
+    lon0, lat0, radio = 12.684167, 43.961944, 0.006
+    # Distancia de cada tramo (entera, entre 1 y 1000 m según el esquema)
+    distancia = max(1, min(1000, round(2 * math.pi * 500 / tramos)))
+
+    with open(path, "w", encoding="utf-8", buffering=1 << 16) as f:
+        f.write(
+            f"""<?xml version="1.0" encoding="UTF-8"?>
+<circuito xmlns="http://www.uniovi.es/circuito" id="circuito-sintetico-{tramos}" version="1.0">
+  <nombre>Circuito sintético de {tramos} tramos</nombre>
+  <medidas>
+    <longitud unidades="m">{min(10000, distancia * tramos)}</longitud>
+    <anchuraMedia unidades="m">14</anchuraMedia>
+  </medidas>
+  <evento>
+    <fecha>2025-09-14</fecha>
+    <horaInicio>14:00:00</horaInicio>
+    <numeroVueltas>27</numeroVueltas>
+  </evento>
+  <ubicacion>
+    <localidadProxima>Misano Adriatico</localidadProxima>
+    <pais>Italia</pais>
+  </ubicacion>
+  <patrocinio>
+    <patrocinadorPrincipal>Patrocinador &amp; Co</patrocinadorPrincipal>
+  </patrocinio>
+  <referencias>
+    <referencia>Referencia sintética &amp; generada</referencia>
+  </referencias>
+  <galeriaFotos>
+"""
+        )
+        for i in range(1, fotos + 1):
+            f.write(
+                f'    <foto archivo="../multimedia/img/foto{i}.jpg" descripcion="Foto {i}"/>\n'
+            )
+        f.write("  </galeriaFotos>\n  <galeriaVideos>\n")
+        for i in range(1, videos + 1):
+            f.write(
+                f'    <video archivo="../multimedia/video/video{i}.webm" '
+                f'descripcion="Video {i}" duracion="PT{i}S"/>\n'
+            )
+        f.write(
+            f"""  </galeriaVideos>
+  <geografia>
+    <origen>
+      <longitud unidades="deg">{lon0 + radio:.6f}</longitud>
+      <latitud unidades="deg">{lat0:.6f}</latitud>
+      <altitud unidades="m">25.00</altitud>
+    </origen>
+  </geografia>
+  <tramos>
+"""
+        )
+        for i in range(1, tramos + 1):
+            angulo = 2 * math.pi * i / tramos
+            ruido = rnd.uniform(-1, 1) * radio * 0.01
+            lon = lon0 + (radio + ruido) * math.cos(angulo)
+            lat = lat0 + (radio + ruido) * 0.7 * math.sin(angulo)
+            alt = 25 + 5 * math.sin(3 * angulo) + rnd.uniform(-0.1, 0.1)
+            sector = min(3, 1 + 3 * (i - 1) // tramos)
+            f.write(
+                f"""    <tramo>
+      <distancia unidades="m">{distancia}</distancia>
+      <puntoFinal>
+        <longitud unidades="deg">{lon:.6f}</longitud>
+        <latitud unidades="deg">{lat:.6f}</latitud>
+        <altitud unidades="m">{alt:.2f}</altitud>
+      </puntoFinal>
+      <sector>{sector}</sector>
+    </tramo>
+"""
+            )
+        f.write(
+            """  </tramos>
+  <resultado>
+    <vencedor>Piloto 1</vencedor>
+    <tiempoTotal>00:41:20.898</tiempoTotal>
+  </resultado>
+  <clasificacionMundial>
+"""
+        )
+        for i in range(1, pilotos + 1):
+            f.write(
+                f"""    <piloto posicion="{(i - 1) % 20 + 1}">
+      <nombrePiloto>Piloto {i}</nombrePiloto>
+      <equipo>Equipo {i % 11}</equipo>
+      <puntos>{max(0, 1000 - i) % 1001}</puntos>
+    </piloto>
+"""
+            )
+        f.write("  </clasificacionMundial>\n</circuito>\n")
+
+
+def run_case(caso, in_xml, out_dir, stages=False, sidecar=False):
+    """Ejecuta un generador en un proceso nuevo y mide tiempo, RSS y tamaño.
+
+    Con stages se activa --profile para obtener además los tiempos por etapa
+    (tracemalloc ralentiza la ejecución, así que se mide en otra pasada).
+    Sin sidecar los generadores se lanzan con --no-sidecar y cada ejecución
+    mide la extracción desde el XML; con sidecar miden la carga del fichero
+    binario, que run_benchmark crea antes de medir.
+    """
+    script, salida, usa_sidecar = CASES[caso]
+    out_path = os.path.join(out_dir, salida)
+    cmd = [sys.executable, os.path.join(PY_DIR, script), in_xml, out_path]
+    if usa_sidecar and not sidecar:
+        cmd.append("--no-sidecar")
+
+    resultado = _run(cmd)
+    resultado["output_bytes"] = os.path.getsize(out_path)
+
+    if stages:
+        profile_path = os.path.join(out_dir, f"{caso}.profile.json")
+        _run(cmd + [f"--profile={profile_path}"])
+        with open(profile_path, encoding="utf-8") as f:
+            resultado["stages"] = {
+                name: datos["ms"] for name, datos in json.load(f)["stages"].items()
+            }
+    return resultado
+
+
+def _run(cmd):
+    """Lanza cmd y devuelve su tiempo de pared y el pico de RSS del proceso hijo"""
+    # stderr va a un fichero temporal y no a un pipe: con wait4 nadie lee el
+    # pipe mientras el hijo se ejecuta y, si se llenara, el hijo se bloquearía
+    with tempfile.TemporaryFile() as errores:
+        inicio = time.perf_counter()
+        proceso = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=errores)
+        _, status, rusage = os.wait4(proceso.pid, 0)
+        wall = time.perf_counter() - inicio
+        proceso.returncode = os.waitstatus_to_exitcode(status)
+        if proceso.returncode != 0:
+            errores.seek(0)
+            raise RuntimeError(
+                f"{' '.join(cmd)} terminó con código {proceso.returncode}: "
+                f"{errores.read().decode(errors='replace')}"
+            )
+    # ru_maxrss está en KiB en Linux
+    return {"wall_s": wall, "peak_rss_kb": rusage.ru_maxrss}
+
+
+def legacy_circuit_from_root(root):
+    """Extracción anterior con búsquedas .// de descendientes (sólo para comparar)"""
+    nsmap = document_namespace(root)
+    circuito = Circuito(
+        element_text(root.find(".//c:nombre", namespaces=nsmap), "Circuito")
+    )
+
+    longitud = root.find(".//c:medidas//c:longitud", namespaces=nsmap)
+    if longitud is not None:
+        circuito.longitud = element_text(longitud)
+        circuito.longitud_unidades = longitud.get("unidades", "m")
+    anchura = root.find(".//c:medidas//c:anchuraMedia", namespaces=nsmap)
+    if anchura is not None:
+        circuito.anchura = element_text(anchura)
+        circuito.anchura_unidades = anchura.get("unidades", "m")
+
+    circuito.fecha = element_text(root.find(".//c:evento//c:fecha", namespaces=nsmap))
+    circuito.hora = element_text(
+        root.find(".//c:evento//c:horaInicio", namespaces=nsmap)
+    )
+    circuito.vueltas = element_text(
+        root.find(".//c:evento//c:numeroVueltas", namespaces=nsmap)
+    )
+    circuito.localidad = element_text(
+        root.find(".//c:ubicacion//c:localidadProxima", namespaces=nsmap)
+    )
+    circuito.pais = element_text(root.find(".//c:ubicacion//c:pais", namespaces=nsmap))
+    circuito.patrocinador = element_text(
+        root.find(".//c:patrocinio//c:patrocinadorPrincipal", namespaces=nsmap)
+    )
+    circuito.referencias = [
+        ref.text.strip()
+        for ref in root.findall(".//c:referencias//c:referencia", namespaces=nsmap)
+        if ref.text
+    ]
+    circuito.fotos = [
+        {"archivo": f.get("archivo", ""), "descripcion": f.get("descripcion", "")}
+        for f in root.findall(".//c:galeriaFotos//c:foto", namespaces=nsmap)
+    ]
+    circuito.videos = [
+        {
+            "archivo": v.get("archivo", ""),
+            "descripcion": v.get("descripcion", ""),
+            "duracion": v.get("duracion", ""),
+        }
+        for v in root.findall(".//c:galeriaVideos//c:video", namespaces=nsmap)
+    ]
+
+    origen = root.find(".//c:geografia//c:origen", namespaces=nsmap)
+    if origen is not None:
+        circuito.origen = punto_from_element(origen, nsmap)
+    for tramo in root.findall(".//c:tramos//c:tramo", namespaces=nsmap):
+        punto_final = tramo.find(".//c:puntoFinal", namespaces=nsmap)
+        if punto_final is None:
+            continue
+        lon_e = punto_final.find(".//c:longitud", namespaces=nsmap)
+        lat_e = punto_final.find(".//c:latitud", namespaces=nsmap)
+        alt_e = punto_final.find(".//c:altitud", namespaces=nsmap)
+        if lon_e is None or lat_e is None or not lon_e.text or not lat_e.text:
+            continue
+        altitud = float(alt_e.text.strip()) if alt_e is not None and alt_e.text else 0.0
+        distancia = tramo.find(".//c:distancia", namespaces=nsmap)
+        sector = tramo.find(".//c:sector", namespaces=nsmap)
+        circuito.tramos.append(
+            Tramo(
+                float(distancia.text.strip()) if element_text(distancia) else None,
+                Punto(float(lon_e.text.strip()), float(lat_e.text.strip()), altitud),
+                int(sector.text.strip()) if element_text(sector) else None,
+            )
+        )
+
+    circuito.vencedor = element_text(
+        root.find(".//c:resultado//c:vencedor", namespaces=nsmap)
+    )
+    circuito.tiempo = element_text(
+        root.find(".//c:resultado//c:tiempoTotal", namespaces=nsmap)
+    )
+    for piloto in root.findall(".//c:clasificacionMundial//c:piloto", namespaces=nsmap):
+        circuito.clasificacion.append(
+            {
+                "posicion": piloto.get("posicion", ""),
+                "nombre": element_text(piloto.find("c:nombrePiloto", namespaces=nsmap)),
+                "equipo": element_text(piloto.find("c:equipo", namespaces=nsmap)),
+                "puntos": element_text(piloto.find("c:puntos", namespaces=nsmap)),
+            }
+        )
+    return circuito
+
+
+def _snapshot(circuito):
+    """Contenido comparable de un Circuito (los modelos no definen __eq__)"""
+    datos = {name: getattr(circuito, name) for name in Circuito.__slots__}
+    datos["origen"] = repr(circuito.origen)
+    datos["tramos"] = list(circuito.registros())
+    return datos
+
+
+def benchmark_extraction(sizes, repeat=3, workdir=None):
+    """Compara la extracción por despachador con la antigua basada en .//
+
+    Ambas se ejecutan sobre el mismo árbol ya parseado, así que sólo se mide
+    la extracción; además se comprueba que el modelo resultante es idéntico.
+    """
+    resultados = []
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for tramos in sizes:
+            in_xml = os.path.join(tmp, f"circuito_{tramos}.xml")
+            generate_circuit(in_xml, tramos, pilotos=max(20, tramos // 100))
+            root = ET.parse(in_xml).getroot()
+
+            tiempos = {}
+            modelos = {}
+            for nombre, extraer in (
+                ("legacy_s", legacy_circuit_from_root),
+                ("dispatch_s", circuit_from_root),
+            ):
+                mejor = None
+                for _ in range(repeat):
+                    inicio = time.perf_counter()
+                    modelos[nombre] = extraer(root)
+                    transcurrido = time.perf_counter() - inicio
+                    mejor = transcurrido if mejor is None else min(mejor, transcurrido)
+                tiempos[nombre] = mejor
+
+            if _snapshot(modelos["legacy_s"]) != _snapshot(modelos["dispatch_s"]):
+                raise RuntimeError(f"La extracción difiere con {tramos} tramos")
+
+            speedup = tiempos["legacy_s"] / tiempos["dispatch_s"]
+            resultados.append({"tramos": tramos, **tiempos, "speedup": speedup})
+            print(
+                f"extraccion  {tramos:>8} tramos  .// {tiempos['legacy_s']:8.3f} s  "
+                f"despachador {tiempos['dispatch_s']:8.3f} s  x{speedup:.2f}"
+            )
+    return resultados
+
+
+def run_benchmark(sizes, cases, repeat=1, stages=False, workdir=None, sidecar=False):
+    """Genera los circuitos sintéticos y mide todos los casos para cada tamaño.
+
+    Con sidecar se mide la carga en caliente desde el fichero binario de
+    tramos; el modo queda anotado en el informe.
+    """
+    resultados = []
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for tramos in sizes:
+            in_xml = os.path.join(tmp, f"circuito_{tramos}.xml")
+            # Clasificación y galerías crecen también con el tamaño del circuito
+            generate_circuit(
+                in_xml,
+                tramos,
+                pilotos=max(20, tramos // 100),
+                fotos=max(50, tramos // 1000),
+                videos=max(20, tramos // 2000),
+            )
+            if sidecar:
+                # Una ejecución fuera de la medida escribe el fichero binario
+                caso = next((c for c in cases if CASES[c][2]), None)
+                if caso is not None:
+                    run_case(caso, in_xml, tmp, sidecar=True)
+            for caso in cases:
+                # Se conserva la repetición más rápida (menos ruido del sistema)
+                mejor = min(
+                    (
+                        run_case(caso, in_xml, tmp, stages, sidecar)
+                        for _ in range(repeat)
+                    ),
+                    key=lambda r: r["wall_s"],
+                )
+                mejor.update({"caso": caso, "tramos": tramos})
+                resultados.append(mejor)
+                print(
+                    f"{caso:<11} {tramos:>8} tramos  {mejor['wall_s']:8.3f} s  "
+                    f"{mejor['peak_rss_kb'] / 1024:8.1f} MiB  "
+                    f"{mejor['output_bytes'] / 1024:10.1f} KiB"
+                )
+    return {
+        "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "sidecar": sidecar,
+        "resultados": resultados,
+    }
+
+
+def compare(antes, despues, threshold=DEFAULT_THRESHOLD):
+    """Compara dos ejecuciones e imprime las diferencias; devuelve las regresiones"""
+    if antes.get("sidecar") != despues.get("sidecar"):
+        print(
+            "Aviso: las ejecuciones no usan el mismo modo de fichero binario de "
+            f"tramos (sidecar {antes.get('sidecar')} -> {despues.get('sidecar')})"
+        )
+    previos = {(r["caso"], r["tramos"]): r for r in antes["resultados"]}
+    regresiones = []
+    for r in despues["resultados"]:
+        clave = (r["caso"], r["tramos"])
+        if clave not in previos:
+            continue
+        for metrica in ("wall_s", "peak_rss_kb", "output_bytes"):
+            viejo, nuevo = previos[clave][metrica], r[metrica]
+            cambio = (nuevo - viejo) / viejo if viejo else 0.0
+            marca = ""
+            if cambio > threshold:
+                marca = "  REGRESIÓN"
+                regresiones.append((clave, metrica, cambio))
+            print(
+                f"{r['caso']:<11} {r['tramos']:>8} {metrica:<12} "
+                f"{viejo:14.3f} -> {nuevo:14.3f} ({cambio:+7.1%}){marca}"
+            )
+    return regresiones
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog="benchmark.py",
+        description="Mide los generadores con circuitos sintéticos de tamaño creciente",
+    )
+    parser.add_argument(
+        "--sizes",
+        default=",".join(str(n) for n in DEFAULT_SIZES),
+        help="número de tramos separados por comas",
+    )
+    parser.add_argument(
+        "--cases", default=",".join(CASES), help="casos separados por comas"
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="repeticiones por caso")
+    parser.add_argument(
+        "--stages", action="store_true", help="mide también los tiempos por etapa"
+    )
+    parser.add_argument(
+        "--sidecar",
+        action="store_true",
+        help="mide la carga desde el fichero binario de tramos en vez del XML",
+    )
+    parser.add_argument(
+        "--extraction",
+        action="store_true",
+        help="compara la extracción por despachador con las búsquedas .//",
+    )
+    parser.add_argument("-o", "--output", help="fichero JSON de resultados")
+    parser.add_argument("--workdir", help="directorio para los ficheros temporales")
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("ANTES", "DESPUES"),
+        help="compara dos ficheros de resultados",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="empeoramiento relativo que se considera regresión",
+    )
+    args = parser.parse_args(argv[1:])
+
+    if args.compare:
+        with open(args.compare[0], encoding="utf-8") as f:
+            antes = json.load(f)
+        with open(args.compare[1], encoding="utf-8") as f:
+            despues = json.load(f)
+        regresiones = compare(antes, despues, args.threshold)
+        print(f"{len(regresiones)} regresiones (umbral {args.threshold:.0%})")
+        sys.exit(1 if regresiones else 0)
+
+    sizes = [int(n) for n in args.sizes.split(",")]
+    cases = [caso for caso in args.cases.split(",") if caso]
+    informe = run_benchmark(
+        sizes, cases, args.repeat, args.stages, args.workdir, args.sidecar
+    )
+    if args.extraction:
+        informe["extraccion"] = benchmark_extraction(
+            sizes, max(3, args.repeat), args.workdir
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(informe, f, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,68 @@
+import hashlib
+import json
+import os
+
+from output import write_atomic
+
+# Fichero de caché que se guarda en el directorio de salida
+CACHE_FILENAME = ".xml2cache.json"
+
+
+def file_digest(path):
+    """Calcula el SHA-256 del contenido de un fichero"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_key(input_digest, generator, version, **options):
+    """Clave de una salida: hash del XML, generador, versión y opciones"""
+    payload = json.dumps([input_digest, generator, version, options], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class BuildCache:
+    """Caché en disco que asocia cada fichero generado con la clave que lo produjo"""
+
+    def __init__(self, path=None, entries=None):
+        self.path = path
+        self.entries = dict(entries or {})
+
+    @classmethod
+    def load(cls, path):
+        """Carga la caché; si no existe o está corrupta se empieza vacía"""
+        try:
+            with open(path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = {}
+        return cls(path, entries)
+
+    def is_fresh(self, output, key):
+        """Indica si output existe y se generó con la misma clave"""
+        return self.entries.get(output) == key and os.path.exists(output)
+
+    def update(self, output, key):
+        """Registra la clave con la que se ha generado output"""
+        self.entries[output] = key
+
+    def subset(self, outputs):
+        """Copia con sólo las entradas de outputs (para enviarla a otro proceso)"""
+        return BuildCache(
+            None, {o: self.entries[o] for o in outputs if o in self.entries}
+        )
+
+    def merge(self, other):
+        """Incorpora las entradas actualizadas por otra caché"""
+        self.entries.update(other.entries)
+
+    def save(self):
+        """Guarda la caché de forma atómica (ver output.write_atomic).
+
+        El temporal tiene un nombre único, así que dos builds que comparten
+        directorio de salida no se pisan el fichero antes del renombrado.
+        """
+        texto = json.dumps(self.entries, indent=2, sort_keys=True)
+        write_atomic(self.path, texto.encode("utf-8"))
@@ -0,0 +1,462 @@
+import functools
+import hashlib
+import xml.etree.ElementTree as ET
+
+import xml_backend
+from xml_backend import InvalidDocumentError
+
+DEFAULT_NS = "http://www.uniovi.es/circuito"
+
+
+class Punto:
+    """Punto geográfico (grados WGS84 y altitud en metros)"""
+
+    __slots__ = ("longitud", "latitud", "altitud")
+
+    def __init__(self, longitud: float, latitud: float, altitud: float = 0.0):
+        self.longitud = longitud
+        self.latitud = latitud
+        self.altitud = altitud
+
+    def __repr__(self):
+        return f"Punto({self.longitud}, {self.latitud}, {self.altitud})"
+
+
+class Tramo:
+    """Tramo del circuito: distancia recorrida hasta su punto final"""
+
+    __slots__ = ("distancia", "punto", "sector")
+
+    def __init__(self, distancia: float | None, punto: Punto, sector: int | None):
+        self.distancia = distancia
+        self.punto = punto
+        self.sector = sector
+
+    def __repr__(self):
+        return f"Tramo({self.distancia}, {self.punto!r}, {self.sector!r})"
+
+
+class Circuito:
+    """Modelo completo de un circuito, obtenido de un único parseo del XML"""
+
+    __slots__ = (
+        "nombre",
+        "longitud",
+        "longitud_unidades",
+        "anchura",
+        "anchura_unidades",
+        "fecha",
+        "hora",
+        "vueltas",
+        "localidad",
+        "pais",
+        "patrocinador",
+        "referencias",
+        "fotos",
+        "videos",
+        "vencedor",
+        "tiempo",
+        "clasificacion",
+        "origen",
+        "tramos",
+    )
+
+    def __init__(self, nombre: str = "Circuito"):
+        self.nombre = nombre
+        self.longitud: str | None = None
+        self.longitud_unidades = "m"
+        self.anchura: str | None = None
+        self.anchura_unidades = "m"
+        self.fecha = ""
+        self.hora = ""
+        self.vueltas = ""
+        self.localidad = ""
+        self.pais = ""
+        self.patrocinador = ""
+        self.referencias: list[str] = []
+        self.fotos: list[dict] = []
+        self.videos: list[dict] = []
+        self.vencedor = ""
+        self.tiempo = ""
+        self.clasificacion: list[dict] = []
+        self.origen: Punto | None = None
+        self.tramos: list[Tramo] = []
+
+    def coordenadas(self) -> list[Punto]:
+        """Devuelve el origen (si existe) seguido de los puntos finales de cada tramo"""
+        puntos = [self.origen] if self.origen is not None else []
+        puntos.extend(tramo.punto for tramo in self.tramos)
+        return puntos
+
+    def registros(self):
+        """Genera los registros (distancia, lon, lat, alt, sector) de cada tramo"""
+        for tramo in self.tramos:
+            punto = tramo.punto
+            yield (
+                tramo.distancia,
+                punto.longitud,
+                punto.latitud,
+                punto.altitud,
+                tramo.sector,
+            )
+
+
+def document_namespace(root) -> dict:
+    """Detecta el namespace del documento y devuelve el mapa de prefijos"""
+    if root.tag.startswith("{"):
+        doc_ns = root.tag[1 : root.tag.index("}")]
+    else:
+        doc_ns = DEFAULT_NS
+    return {"c": doc_ns}
+
+
+def _local(tag):
+    """Nombre local de una etiqueta sin el namespace"""
+    return tag[tag.index("}") + 1 :] if tag.startswith("{") else tag
+
+
+def element_text(elem, default=""):
+    """Texto de elem sin espacios alrededor; default si no hay elemento o texto"""
+    if elem is None or elem.text is None:
+        return default
+    return elem.text.strip()
+
+
+def _number(elem, convert=float):
+    """Convierte el texto de elem con convert; un valor no numérico es un documento no válido"""
+    try:
+        return convert(elem.text.strip())
+    except ValueError as e:
+        raise InvalidDocumentError(
+            f"Valor no numérico en {_local(elem.tag)}: {elem.text.strip()!r}"
+        ) from e
+
+
+@functools.lru_cache(maxsize=None)
+def _qnames(ns):
+    """Etiquetas cualificadas {ns}nombre, calculadas una vez por namespace"""
+    return {
+        name: ET.QName(ns, name).text
+        for name in (
+            "nombre",
+            "medidas",
+            "longitud",
+            "anchuraMedia",
+            "evento",
+            "fecha",
+            "horaInicio",
+            "numeroVueltas",
+            "ubicacion",
+            "localidadProxima",
+            "pais",
+            "patrocinio",
+            "patrocinadorPrincipal",
+            "referencias",
+            "referencia",
+            "galeriaFotos",
+            "foto",
+            "galeriaVideos",
+            "video",
+            "geografia",
+            "origen",
+            "latitud",
+            "altitud",
+            "tramos",
+            "tramo",
+            "distancia",
+            "puntoFinal",
+            "sector",
+            "resultado",
+            "vencedor",
+            "tiempoTotal",
+            "clasificacionMundial",
+            "piloto",
+            "nombrePiloto",
+            "equipo",
+            "puntos",
+        )
+    }
+
+
+def _children(elem):
+    """Primer hijo directo de cada etiqueta (como find() de cada una, en un recorrido)"""
+    hijos = {}
+    for hijo in elem:
+        hijos.setdefault(hijo.tag, hijo)
+    return hijos
+
+
+def punto_from_element(elem, nsmap):
+    """Construye un Punto a partir de un elemento con longitud/latitud/altitud"""
+    q = _qnames(nsmap["c"])
+    hijos = _children(elem)
+    lon_e = hijos.get(q["longitud"])
+    lat_e = hijos.get(q["latitud"])
+    alt_e = hijos.get(q["altitud"])
+    if lon_e is None or lat_e is None or not lon_e.text or not lat_e.text:
+        return None
+    altitud = _number(alt_e) if alt_e is not None and alt_e.text else 0.0
+    return Punto(_number(lon_e), _number(lat_e), altitud)
+
+
+def _registro(tramo, nsmap):
+    """Registro (distancia, lon, lat, alt, sector) de un elemento tramo"""
+    q = _qnames(nsmap["c"])
+    hijos = _children(tramo)
+    punto_final = hijos.get(q["puntoFinal"])
+    punto = punto_from_element(punto_final, nsmap) if punto_final is not None else None
+    if punto is None:
+        return None
+    distancia = hijos.get(q["distancia"])
+    sector = hijos.get(q["sector"])
+    return (
+        _number(distancia) if element_text(distancia) else None,
+        punto.longitud,
+        punto.latitud,
+        punto.altitud,
+        _number(sector, int) if element_text(sector) else None,
+    )
+
+
+# Lectores de cada sección de primer nivel: (circuito, elemento, nsmap)
+
+
+def _read_nombre(circuito, elem, nsmap):
+    circuito.nombre = element_text(elem, "Circuito")
+
+
+def _read_medidas(circuito, elem, nsmap):
+    q = _qnames(nsmap["c"])
+    hijos = _children(elem)
+    longitud = hijos.get(q["longitud"])
+    if longitud is not None:
+        circuito.longitud = element_text(longitud)
+        circuito.longitud_unidades = longitud.get("unidades", "m")
+
+    anchura = hijos.get(q["anchuraMedia"])
+    if anchura is not None:
+        circuito.anchura = element_text(anchura)
+        circuito.anchura_unidades = anchura.get("unidades", "m")
+
+
+def _read_evento(circuito, elem, nsmap):
+    q = _qnames(nsmap["c"])
+    hijos = _children(elem)
+    circuito.fecha = element_text(hijos.get(q["fecha"]))
+    circuito.hora = element_text(hijos.get(q["horaInicio"]))
+    circuito.vueltas = element_text(hijos.get(q["numeroVueltas"]))
+
+
+def _read_ubicacion(circuito, elem, nsmap):
+    q = _qnames(nsmap["c"])
+    hijos = _children(elem)
+    circuito.localidad = element_text(hijos.get(q["localidadProxima"]))
+    circuito.pais = element_text(hijos.get(q["pais"]))
+
+
+def _read_patrocinio(circuito, elem, nsmap):
+    q = _qnames(nsmap["c"])
+    circuito.patrocinador = element_text(
+        _children(elem).get(q["patrocinadorPrincipal"])
+    )
+
+
+def _read_referencias(circuito, elem, nsmap):
+    tag = _qnames(nsmap["c"])["referencia"]
+    circuito.referencias = [
+        ref.text.strip() for ref in elem if ref.tag == tag and ref.text
+    ]
+
+
+def _read_fotos(circuito, elem, nsmap):
+    tag = _qnames(nsmap["c"])["foto"]
+    circuito.fotos = [
+        {
+            "archivo": foto.get("archivo", ""),
+            "descripcion": foto.get("descripcion", ""),
+        }
+        for foto in elem
+        if foto.tag == tag
+    ]
+
+
+def _read_videos(circuito, elem, nsmap):
+    tag = _qnames(nsmap["c"])["video"]
+    circuito.videos = [
+        {
+            "archivo": video.get("archivo", ""),
+            "descripcion": video.get("descripcion", ""),
+            "duracion": video.get("duracion", ""),
+        }
+        for video in elem
+        if video.tag == tag
+    ]
+
+
+def _read_geografia(circuito, elem, nsmap):
+    origen = _children(elem).get(_qnames(nsmap["c"])["origen"])
+    if origen is not None:
+        circuito.origen = punto_from_element(origen, nsmap)
+
+
+def _read_tramos(circuito, elem, nsmap):
+    tag = _qnames(nsmap["c"])["tramo"]
+    for tramo in elem:
+        if tramo.tag != tag:
+            continue
+        registro = _registro(tramo, nsmap)
+        if registro is None:
+            continue
+        distancia, lon, lat, alt, sector = registro
+        circuito.tramos.append(Tramo(distancia, Punto(lon, lat, alt), sector))
+
+
+def _read_resultado(circuito, elem, nsmap):
+    q = _qnames(nsmap["c"])
+    hijos = _children(elem)
+    circuito.vencedor = element_text(hijos.get(q["vencedor"]))
+    circuito.tiempo = element_text(hijos.get(q["tiempoTotal"]))
+
+
+def _read_clasificacion(circuito, elem, nsmap):
+    q = _qnames(nsmap["c"])
+    for piloto in elem:
+        if piloto.tag != q["piloto"]:
+            continue
+        hijos = _children(piloto)
+        circuito.clasificacion.append(
+            {
+                "posicion": piloto.get("posicion", ""),
+                "nombre": element_text(hijos.get(q["nombrePiloto"])),
+                "equipo": element_text(hijos.get(q["equipo"])),
+                "puntos": element_text(hijos.get(q["puntos"])),
+            }
+        )
+
+
+# Despachador: etiqueta local de la sección -> lector
+_SECTION_READERS = {
+    "nombre": _read_nombre,
+    "medidas": _read_medidas,
+    "evento": _read_evento,
+    "ubicacion": _read_ubicacion,
+    "patrocinio": _read_patrocinio,
+    "referencias": _read_referencias,
+    "galeriaFotos": _read_fotos,
+    "galeriaVideos": _read_videos,
+    "geografia": _read_geografia,
+    "tramos": _read_tramos,
+    "resultado": _read_resultado,
+    "clasificacionMundial": _read_clasificacion,
+}
+
+
+def circuit_from_root(root) -> Circuito:
+    """Rellena un Circuito a partir del elemento raíz ya parseado.
+
+    Se recorren una sola vez las secciones de primer nivel y cada una se
+    despacha por su etiqueta al lector correspondiente, que sólo visita sus
+    hijos directos; no hay búsquedas de descendientes (.//) sobre todo el árbol.
+    Si una sección se repite, cuenta la primera, como hacía find().
+    """
+    nsmap = document_namespace(root)
+    q = _qnames(nsmap["c"])
+    lectores = {q[name]: lector for name, lector in _SECTION_READERS.items()}
+
+    circuito = Circuito()
+    for seccion in root:
+        lector = lectores.pop(seccion.tag, None)
+        if lector is not None:
+            lector(circuito, seccion, nsmap)
+    return circuito
+
+
+def section_digests(root) -> dict:
+    """Hash del contenido de cada sección de primer nivel (nombre, tramos...)"""
+    return {
+        _local(child.tag): hashlib.sha256(xml_backend.tostring(child)).hexdigest()
+        for child in root
+    }
+
+
+def parse_circuit(xml_file) -> Circuito:
+    """Parsea (y, con lxml, valida) el XML del circuito una sola vez y devuelve el modelo"""
+    return circuit_from_root(xml_backend.parse(xml_file))
+
+
+def read_header(xml_file):
+    """Lee nombre y origen del circuito deteniéndose al llegar a los tramos"""
+    nombre = "Circuito"
+    origen = None
+    nsmap = None
+
+    for event, elem in xml_backend.iterparse(xml_file, events=("start", "end")):
+        tag = _local(elem.tag)
+        if event == "start":
+            if nsmap is None:
+                nsmap = document_namespace(elem)
+            elif tag == "tramos":
+                break
+            continue
+        if tag == "nombre" and nombre == "Circuito" and elem.text:
+            nombre = elem.text.strip()
+        elif tag == "origen":
+            origen = punto_from_element(elem, nsmap)
+
+    return nombre, origen
+
+
+def read_event(xml_file):
+    """Lee fecha, hora de inicio y número de vueltas del evento sin parsear el resto.
+
+    Devuelve un diccionario con las claves fecha, hora y vueltas (texto; ""
+    si falta el elemento).
+    """
+    evento = {"fecha": "", "hora": "", "vueltas": ""}
+    campos = {"fecha": "fecha", "horaInicio": "hora", "numeroVueltas": "vueltas"}
+
+    for event, elem in xml_backend.iterparse(xml_file, events=("end",), validate=False):
+        tag = _local(elem.tag)
+        if tag in campos:
+            evento[campos[tag]] = element_text(elem)
+        elif tag == "evento":
+            break
+
+    return evento
+
+
+def iter_tramos(xml_file):
+    """Genera registros (distancia, lon, lat, alt, sector) con iterparse.
+
+    Cada tramo se libera tras procesarse, de modo que la memoria usada no
+    depende del número de tramos del documento.
+    """
+    nsmap = None
+    tramos = None
+    tramo_tag = tramos_tag = None
+
+    for event, elem in xml_backend.iterparse(xml_file, events=("start", "end")):
+        if event == "start":
+            if nsmap is None:
+                nsmap = document_namespace(elem)
+                tramo_tag = ET.QName(nsmap["c"], "tramo").text
+                tramos_tag = ET.QName(nsmap["c"], "tramos").text
+            elif elem.tag == tramos_tag:
+                tramos = elem
+            continue
+
+        if elem.tag == tramo_tag:
+            registro = _registro(elem, nsmap)
+            if registro is not None:
+                yield registro
+            elem.clear()
+            if tramos is not None:
+                tramos.remove(elem)
+        elif elem.tag == tramos_tag:
+            # El resto del documento no contiene tramos; con lxml se sigue
+            # leyendo (sin retener nada) para que la validación llegue al final
+            if xml_backend.backend() == "etree":
+                break
+            tramos = None
+        elif tramos is None:
+            elem.clear()
@@ -0,0 +1,55 @@
+import os
+import sys
+
+
+def _usage_error(argv, mensaje, uso):
+    programa = os.path.basename(argv[0]) if argv else ""
+    print(f"Error: {mensaje}")
+    print(f"Uso: {programa} [opciones] {uso}")
+    sys.exit(1)
+
+
+def pop_flag(argv, name):
+    """Extrae de argv una opción booleana (--nombre); devuelve (presente, argv)"""
+    return name in argv, [arg for arg in argv if arg != name]
+
+
+def pop_option(argv, name, default=None, type=str):
+    """Extrae de argv una opción con valor; devuelve (valor, argv).
+
+    Se admiten --nombre=valor y --nombre valor. Si falta el valor o type no
+    lo acepta (p. ej. --page-size=x con int) se informa del error con el uso
+    de la opción y se termina con código 1.
+    """
+    prefijo = f"{name}="
+    valor = default
+    resto = []
+    argumentos = iter(argv)
+    for arg in argumentos:
+        if arg == name:
+            texto = next(argumentos, None)
+            if texto is None:
+                _usage_error(argv, f"falta el valor de {name}", f"{name}=VALOR")
+        elif arg.startswith(prefijo):
+            texto = arg[len(prefijo) :]
+        else:
+            resto.append(arg)
+            continue
+        try:
+            valor = type(texto)
+        except ValueError:
+            _usage_error(
+                argv, f"valor no válido para {name}: {texto!r}", f"{name}=VALOR"
+            )
+    return valor, resto
+
+
+def reject_unknown_options(argv, uso):
+    """Termina con el uso si quedan en argv opciones (--algo) no reconocidas.
+
+    Se llama tras extraer todas las opciones conocidas con pop_flag y
+    pop_option, para que una opción mal escrita no se tome por una ruta.
+    """
+    for arg in argv[1:]:
+        if arg.startswith("--"):
+            _usage_error(argv, f"opción no reconocida: {arg}", uso)
@@ -0,0 +1,60 @@
+# Decimales por defecto de cada tipo de valor: 1 en píxeles SVG (0,1 px no
+# se aprecia), 6 en grados WGS84 (~11 cm) y 2 en metros (altitudes)
+PIXEL_DIGITS = 1
+DEGREE_DIGITS = 6
+METER_DIGITS = 2
+
+
+def format_number(value: float) -> str:
+    """Formatea un número sin decimales superfluos (230.0 -> '230')"""
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def format_fixed(value, digits=None):
+    """Formatea value con digits decimales como máximo, sin ceros finales.
+
+    Con digits None el valor se formatea completo (format_number).
+    """
+    if digits is None:
+        return format_number(float(value))
+    texto = f"{value:.{digits}f}"
+    if digits:
+        texto = texto.rstrip("0").rstrip(".")
+    return "0" if texto == "-0" else texto
+
+
+def fixed_formatter(digits=None, zeros=False):
+    """Función que formatea un valor como format_fixed con los digits dados.
+
+    Con zeros se conservan los ceros finales (siempre digits decimales), que
+    es como escribe las coordenadas el XML de los circuitos.
+    """
+    if digits is None:
+        return lambda value: format_number(float(value))
+    if zeros:
+        return f"%.{digits}f".__mod__
+    return lambda value: format_fixed(value, digits)
+
+
+def pair_template(digits=None):
+    """Plantilla "%" para pares x,y con digits decimales fijos.
+
+    Es la forma más rápida de formatear los bucles calientes (una operación
+    de formato por par); a diferencia de format_fixed conserva los ceros
+    finales. Con digits None devuelve None: los pares se formatean completos.
+    """
+    if digits is None:
+        return None
+    return f"%.{digits}f,%.{digits}f"
+
+
+def parse_digits(texto):
+    """Valor de una opción --precision: un número de decimales o "full" (None)"""
+    if texto == "full":
+        return None
+    digits = int(texto)
+    if digits < 0:
+        raise ValueError(f"Número de decimales no válido: {texto}")
+    return digits
@@ -0,0 +1,195 @@
+import contextlib
+import gzip
+import io
+import os
+import re
+import secrets
+import sys
+import zipfile
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él sólo se escriben copias .gz
+    brotli = None
+
+# Tamaño del buffer de escritura de los ficheros generados
+OUTPUT_BUFFER = 1 << 16
+
+# Decimales que se conservan al minificar cada tipo de salida (píxeles en
+# SVG, grados WGS84 en KML: 7 decimales son ~1 cm); el HTML no se redondea
+MINIFY_DIGITS = {".svg": 2, ".kml": 7, ".kmz": 7}
+# Datos de coordenadas en los que se redondea al minificar: el contenido de
+# <coordinates> y <gx:coord> en KML y los atributos geométricos en SVG. Los
+# grupos son la apertura, los datos y el cierre
+_KML_COORDINATES = re.compile(r"(<coordinates>|<gx:coord>)([^<]*)(</)")
+_SVG_GEOMETRY = re.compile(
+    r'(\s(?:points|d|x|y|x1|y1|x2|y2|cx|cy|r|width|height)=")([^"]*)(")'
+)
+COORDINATE_PATTERNS = {
+    ".svg": _SVG_GEOMETRY,
+    ".kml": _KML_COORDINATES,
+    ".kmz": _KML_COORDINATES,
+}
+COMMENT_PATTERN = re.compile(r"<!--.*?-->", re.DOTALL)
+BETWEEN_TAGS_PATTERN = re.compile(r">\s+<")
+# Número decimal aislado (no parte de un nombre, color o fecha)
+DECIMAL_PATTERN = re.compile(r"(?<![\w.#:-])-?\d+\.\d+(?![\w.])")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+# Fecha fija de las entradas de los KMZ, para que sean reproducibles
+KMZ_DATE = (1980, 1, 1, 0, 0, 0)
+
+
+def _temp_path(path):
+    """Nombre temporal único junto a path para escribirlo de forma atómica"""
+    directorio, nombre = os.path.split(path)
+    return os.path.join(directorio, f".{nombre}.{secrets.token_hex(8)}.tmp")
+
+
+@contextlib.contextmanager
+def open_output(filename):
+    """Abre el destino de un generador: un fichero o la salida estándar ("-").
+
+    El fichero se escribe en un temporal que sólo sustituye al destino si el
+    bloque termina sin errores; si no, se borra y el destino anterior se
+    conserva (un error a mitad del parseo no deja una salida truncada).
+    """
+    if filename == "-":
+        yield sys.stdout
+        sys.stdout.flush()
+        return
+    tmp = _temp_path(filename)
+    try:
+        # Se crea con open (y no mkstemp) para que tenga los permisos habituales
+        with open(tmp, "x", encoding="utf-8", buffering=OUTPUT_BUFFER) as f:
+            yield f
+        os.replace(tmp, filename)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp)
+        raise
+
+
+def message_stream(filename):
+    """Flujo para los mensajes informativos: stderr si la salida va a stdout"""
+    return sys.stderr if filename == "-" else sys.stdout
+
+
+def _round_decimal(match, digits):
+    texto = match.group()
+    if len(texto) - texto.index(".") - 1 <= digits:
+        return texto
+    redondeado = f"{float(texto):.{digits}f}".rstrip("0").rstrip(".")
+    return "0" if redondeado == "-0" else redondeado
+
+
+def _minify_coordinates(match, digits):
+    """Redondea los números de unos datos de coordenadas y une sus espacios.
+
+    En estas listas de números el espacio sólo separa valores, así que los
+    saltos de línea y sangrías se reducen a un espacio.
+    """
+    apertura, datos, cierre = match.groups()
+    datos = DECIMAL_PATTERN.sub(lambda m: _round_decimal(m, digits), datos)
+    return apertura + WHITESPACE_PATTERN.sub(" ", datos).strip() + cierre
+
+
+def minify_markup(texto, extension):
+    """Elimina comentarios y espacios entre etiquetas y acorta los decimales.
+
+    En SVG y KML el espacio entre etiquetas no tiene significado y se elimina;
+    en HTML se reduce a un espacio para no juntar elementos en línea. El
+    texto de los elementos (descripciones, estilos...) no se modifica. Los
+    números con más decimales de los indicados en MINIFY_DIGITS se redondean
+    sólo en los datos de coordenadas (COORDINATE_PATTERNS).
+    """
+    texto = COMMENT_PATTERN.sub("", texto)
+    if extension in (".html", ".htm"):
+        texto = BETWEEN_TAGS_PATTERN.sub("> <", texto)
+    else:
+        texto = BETWEEN_TAGS_PATTERN.sub("><", texto)
+    digits = MINIFY_DIGITS.get(extension)
+    if digits is not None:
+        texto = COORDINATE_PATTERNS[extension].sub(
+            lambda m: _minify_coordinates(m, digits), texto
+        )
+    return texto.strip() + "\n"
+
+
+def kmz_bytes(kml):
+    """Contenido de un KMZ: el KML (bytes) comprimido como doc.kml"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as kmz:
+        entrada = zipfile.ZipInfo("doc.kml", date_time=KMZ_DATE)
+        entrada.compress_type = zipfile.ZIP_DEFLATED
+        kmz.writestr(entrada, kml, compresslevel=9)
+    return buffer.getvalue()
+
+
+def write_atomic(path, datos):
+    """Escribe datos (bytes) de forma atómica: fichero temporal y renombrado.
+
+    El temporal tiene un nombre único en el mismo directorio, de modo que
+    escrituras concurrentes no se pisan y un lector nunca ve el fichero a
+    medio escribir.
+    """
+    tmp = _temp_path(path)
+    try:
+        with open(tmp, "xb") as f:
+            f.write(datos)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp)
+        raise
+
+
+def write_precompressed(path, datos):
+    """Escribe junto a path sus copias path.gz y, si hay brotli, path.br.
+
+    Las copias no guardan fecha ni nombre, de modo que el mismo contenido
+    produce siempre los mismos bytes. Devuelve las rutas escritas.
+    """
+    escritos = [f"{path}.gz"]
+    write_atomic(escritos[0], gzip.compress(datos, compresslevel=9, mtime=0))
+    if brotli is not None:
+        escritos.append(f"{path}.br")
+        write_atomic(escritos[1], brotli.compress(datos, quality=11))
+    return escritos
+
+
+def write_artifact(path, texto, minify=False, precompress=False):
+    """Escribe texto en path como artefacto listo para servir.
+
+    Con minify se minifica según la extensión; si la extensión es .kmz se
+    escribe el KML comprimido en un KMZ; con precompress se escriben además
+    las copias .gz/.br (salvo para KMZ, que ya está comprimido).
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if minify:
+        texto = minify_markup(texto, extension)
+    datos = texto.encode("utf-8")
+    if extension == ".kmz":
+        write_atomic(path, kmz_bytes(datos))
+        return
+    write_atomic(path, datos)
+    if precompress:
+        write_precompressed(path, datos)
+
+
+@contextlib.contextmanager
+def open_artifact(filename, minify=False, precompress=False):
+    """open_output con minificación, copias precomprimidas y salida KMZ.
+
+    Si no se pide ninguna transformación (o la salida es "-") equivale a
+    open_output; si no, el documento se acumula en memoria y se escribe al
+    salir con write_artifact. En ambos casos un error dentro del bloque no
+    modifica el fichero de destino.
+    """
+    kmz = filename.lower().endswith(".kmz")
+    if filename == "-" or not (minify or precompress or kmz):
+        with open_output(filename) as sink:
+            yield sink
+        return
+    buffer = io.StringIO()
+    yield buffer
+    write_artifact(filename, buffer.getvalue(), minify, precompress)
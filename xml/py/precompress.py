@@ -0,0 +1,39 @@
+import os
+import sys
+
+from cli import pop_flag
+from output import write_artifact
+
+
+def precompress_file(path, minify=False):
+    """Minifica (opcional) y escribe las copias .gz/.br de un fichero ya generado.
+
+    Devuelve (bytes originales, bytes del fichero resultante).
+    """
+    with open(path, encoding="utf-8") as f:
+        texto = f.read()
+    original = os.path.getsize(path)
+    write_artifact(path, texto, minify=minify, precompress=True)
+    return original, os.path.getsize(path)
+
+
+def main(argv):
+    # Uso: precompress.py [--minify] fichero...
+    # Prepara salidas ya generadas (SVG, KML, HTML) para servirlas comprimidas
+    minify, argv = pop_flag(argv, "--minify")
+    if len(argv) < 2:
+        print("Uso: precompress.py [--minify] fichero...")
+        sys.exit(1)
+
+    for path in argv[1:]:
+        try:
+            original, final = precompress_file(path, minify)
+        except FileNotFoundError:
+            print(f"Error: No se encuentra el archivo {path}")
+            sys.exit(1)
+        gz = os.path.getsize(f"{path}.gz")
+        print(f"{path}: {original} -> {final} bytes (gzip: {gz} bytes)")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
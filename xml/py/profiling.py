@@ -0,0 +1,166 @@
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+# Variable de entorno equivalente a --profile (valor: fichero JSON o "-")
+PROFILE_ENV = "XML2_PROFILE"
+
+
+class Profiler:
+    """Cronómetro por etapas con tiempo exclusivo y pico de memoria (tracemalloc).
+
+    Las etapas pueden anidarse: el tiempo de una etapa no incluye el de las
+    etapas abiertas dentro de ella, así que ningún tiempo se cuenta dos veces.
+    Desactivado, stage() no hace nada y no tiene coste apreciable.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.script = None
+        self.target = None
+        self.stages = {}
+        self._stack = []
+        self._inicio = None
+        self._pico = 0
+
+    def enable(self, script, target="-"):
+        """Activa la medición; el informe irá a target (fichero o "-" para stderr)"""
+        self.enabled = True
+        self.script = script
+        self.target = target
+        self.stages = {}
+        self._stack = []
+        self._pico = 0
+        tracemalloc.start()
+        self._inicio = time.perf_counter_ns()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Mide el bloque como la etapa name (las repeticiones se acumulan)"""
+        if not self.enabled:
+            yield
+            return
+
+        if self._stack:
+            # Conservar el pico de la etapa padre antes de reiniciarlo
+            padre = self._stack[-1]
+            padre[3] = max(padre[3], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        # [nombre, inicio, tiempo de hijas, pico de hijas]
+        marco = [name, time.perf_counter_ns(), 0, 0]
+        self._stack.append(marco)
+        try:
+            yield
+        finally:
+            transcurrido = time.perf_counter_ns() - marco[1]
+            pico = max(tracemalloc.get_traced_memory()[1], marco[3])
+            self._stack.pop()
+
+            datos = self.stages.setdefault(name, {"ns": 0, "calls": 0, "peak_bytes": 0})
+            datos["ns"] += transcurrido - marco[2]
+            datos["calls"] += 1
+            datos["peak_bytes"] = max(datos["peak_bytes"], pico)
+            self._pico = max(self._pico, pico)
+
+            if self._stack:
+                padre = self._stack[-1]
+                padre[2] += transcurrido
+                padre[3] = max(padre[3], pico)
+
+    def timed_iter(self, name, iterable):
+        """Envuelve un iterable perezoso para contabilizar en name el tiempo de next().
+
+        Sirve para flujos (iter_tramos) que se consumen dentro de otra etapa:
+        el tiempo de producir cada elemento se suma a name y se descuenta de
+        la etapa que lo consume. A cambio de no abrir una etapa por elemento,
+        sólo se mide el tiempo: el pico de memoria de name es el de todo el
+        recorrido, compartido con la etapa consumidora.
+        """
+        if not self.enabled:
+            return iterable
+        return self._timed_iter(name, iterable)
+
+    def _timed_iter(self, name, iterable):
+        datos = self.stages.setdefault(name, {"ns": 0, "calls": 0, "peak_bytes": 0})
+        datos["calls"] += 1
+        iterator = iter(iterable)
+        reloj = time.perf_counter_ns
+        try:
+            while True:
+                inicio = reloj()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    transcurrido = reloj() - inicio
+                    datos["ns"] += transcurrido
+                    if self._stack:
+                        # Tiempo de una "hija": no cuenta en la etapa consumidora
+                        self._stack[-1][2] += transcurrido
+                yield item
+        finally:
+            pico = tracemalloc.get_traced_memory()[1]
+            datos["peak_bytes"] = max(datos["peak_bytes"], pico)
+            self._pico = max(self._pico, pico)
+
+    def report(self):
+        """Construye el informe JSON con el tiempo y el pico de memoria por etapa"""
+        total_ns = time.perf_counter_ns() - self._inicio
+        return {
+            "script": self.script,
+            "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "total_ms": total_ns / 1e6,
+            "peak_bytes": max(self._pico, tracemalloc.get_traced_memory()[1]),
+            "stages": {
+                name: {
+                    "ms": datos["ns"] / 1e6,
+                    "calls": datos["calls"],
+                    "peak_bytes": datos["peak_bytes"],
+                }
+                for name, datos in self.stages.items()
+            },
+        }
+
+    def finish(self):
+        """Escribe el informe (si la medición está activa) y la detiene"""
+        if not self.enabled:
+            return
+        informe = json.dumps(self.report(), indent=2, ensure_ascii=False)
+        if self.target == "-":
+            print(informe, file=sys.stderr)
+        else:
+            with open(self.target, "w", encoding="utf-8") as f:
+                f.write(informe + "\n")
+        tracemalloc.stop()
+        self.enabled = False
+
+
+# Instancia compartida por los generadores
+profiler = Profiler()
+
+
+def configure(argv, script):
+    """Activa el profiler si argv tiene --profile[=FICHERO] o existe XML2_PROFILE.
+
+    Devuelve argv sin la opción --profile.
+    """
+    target = os.environ.get(PROFILE_ENV)
+    resto = []
+    for arg in argv:
+        if arg == "--profile":
+            target = "-"
+        elif arg.startswith("--profile="):
+            target = arg[len("--profile=") :]
+        else:
+            resto.append(arg)
+
+    if target:
+        profiler.enable(script, "-" if target in ("1", "-") else target)
+    return resto
@@ -0,0 +1,310 @@
+import collections
+import gzip
+import hashlib
+import io
+import json
+import os
+import sys
+import threading
+import xml.etree.ElementTree as ET
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+import xml2altimetria
+import xml2html
+import xml2kml
+from circuit_model import parse_circuit
+from cli import pop_option, reject_unknown_options
+
+# Número de circuitos parseados que se mantienen en memoria
+DEFAULT_CACHE_SIZE = 32
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+
+# Recursos que se sirven de cada circuito y su tipo MIME
+RESOURCES = {
+    "kml": "application/vnd.google-earth.kml+xml; charset=utf-8",
+    "altimetria.svg": "image/svg+xml; charset=utf-8",
+    "html": "text/html; charset=utf-8",
+}
+
+
+class Rendered:
+    """Salida ya generada: bytes, su versión gzip (calculada al pedirla) y sus ETag.
+
+    Cada codificación es una representación distinta con su propio ETag: el
+    de la versión gzip lleva el sufijo -gz.
+    """
+
+    __slots__ = ("datos", "etag", "etag_gzip", "_gzip")
+
+    def __init__(self, datos):
+        self.datos = datos
+        digest = hashlib.sha256(datos).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+        self.etag_gzip = f'"{digest}-gz"'
+        self._gzip = None
+
+    def gzip(self):
+        if self._gzip is None:
+            self._gzip = gzip.compress(self.datos, compresslevel=6, mtime=0)
+        return self._gzip
+
+
+def accepts_gzip(accept_encoding):
+    """Indica si la cabecera Accept-Encoding admite gzip.
+
+    Se respetan los valores q: "gzip;q=0" lo rechaza explícitamente, y si
+    gzip no aparece vale lo que diga el comodín "*".
+    """
+    calidades = {}
+    for elemento in accept_encoding.split(","):
+        codificacion, _, parametros = elemento.partition(";")
+        codificacion = codificacion.strip().lower()
+        if not codificacion:
+            continue
+        calidad = 1.0
+        for parametro in parametros.split(";"):
+            clave, _, valor = parametro.partition("=")
+            if clave.strip().lower() == "q":
+                try:
+                    calidad = float(valor)
+                except ValueError:
+                    calidad = 0.0
+        calidades[codificacion] = calidad
+    for codificacion in ("gzip", "x-gzip", "*"):
+        if codificacion in calidades:
+            return calidades[codificacion] > 0
+    return False
+
+
+def etag_matches(if_none_match, etag):
+    """Indica si la cabecera If-None-Match coincide con etag.
+
+    La cabecera es "*" o una lista de ETag separados por comas; la
+    comparación es débil (se ignora el prefijo W/), como pide If-None-Match.
+    """
+    etiquetas = [e.strip() for e in if_none_match.split(",")]
+    if "*" in etiquetas:
+        return True
+    return any(e.removeprefix("W/") == etag for e in etiquetas)
+
+
+def render_resource(circuito, xml_file, recurso):
+    """Genera el texto de un recurso (ver RESOURCES) a partir del modelo parseado"""
+    sink = io.StringIO()
+    if recurso == "kml":
+        num_coords, _ = xml2kml.write_kml(circuito, sink, os.path.basename(xml_file))
+        if not num_coords:
+            raise ValueError("El circuito no tiene coordenadas")
+    elif recurso == "altimetria.svg":
+        nombre, puntos = xml2altimetria.circuit_profile(circuito)
+        if len(puntos) == 0:
+            raise ValueError("El circuito no tiene datos de altimetría")
+        xml2altimetria.write_altimetry_svg(nombre, puntos, sink)
+    else:
+        xml2html.write_html(
+            xml2html.circuit_info(circuito),
+            sink,
+            (os.path.dirname(os.path.abspath(xml_file)),),
+        )
+    return sink.getvalue()
+
+
+class CircuitCache:
+    """Caché LRU de circuitos parseados y de sus salidas ya generadas.
+
+    La clave es (ruta, mtime, tamaño): si el XML cambia en disco la entrada
+    deja de coincidir y se vuelve a parsear en la siguiente petición. Cada
+    entrada guarda el modelo del circuito y las salidas generadas a partir de
+    él, de modo que una petición repetida sólo cuesta un stat del fichero.
+    """
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        self.max_size = max_size
+        self._entradas = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def _key(self, xml_file):
+        estado = os.stat(xml_file)
+        return os.path.abspath(xml_file), estado.st_mtime_ns, estado.st_size
+
+    def _entry(self, xml_file):
+        """Entrada del circuito (modelo y salidas), parseándolo si hace falta"""
+        key = self._key(xml_file)
+        with self._lock:
+            entrada = self._entradas.get(key)
+            if entrada is not None:
+                self._entradas.move_to_end(key)
+                self.aciertos += 1
+                return entrada
+            self.fallos += 1
+
+        # El parseo se hace fuera del lock para no bloquear otras peticiones
+        entrada = {"circuito": parse_circuit(xml_file), "salidas": {}}
+        with self._lock:
+            # Las versiones anteriores del mismo fichero ya no sirven
+            for antigua in [k for k in self._entradas if k[0] == key[0]]:
+                del self._entradas[antigua]
+            self._entradas[key] = entrada
+            while len(self._entradas) > self.max_size:
+                self._entradas.popitem(last=False)
+        return entrada
+
+    def get(self, xml_file, recurso):
+        """Salida (Rendered) del recurso indicado del circuito xml_file"""
+        entrada = self._entry(xml_file)
+        rendered = entrada["salidas"].get(recurso)
+        if rendered is None:
+            texto = render_resource(entrada["circuito"], xml_file, recurso)
+            rendered = Rendered(texto.encode("utf-8"))
+            entrada["salidas"][recurso] = rendered
+        return rendered
+
+    def __len__(self):
+        return len(self._entradas)
+
+
+def list_circuits(directorio):
+    """Nombres (sin extensión) de los XML de circuito del directorio"""
+    return sorted(
+        os.path.splitext(nombre)[0]
+        for nombre in os.listdir(directorio)
+        if nombre.endswith(".xml")
+    )
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    """Sirve /<circuito>/kml, /<circuito>/altimetria.svg y /<circuito>/html.
+
+    La raíz (/) devuelve en JSON la lista de circuitos disponibles y el
+    estado de la caché. Las respuestas llevan ETag (distinto para la versión
+    gzip) y se responde 304 si coincide con If-None-Match; si el cliente
+    acepta gzip se envía la versión comprimida (en caché).
+    """
+
+    server_version = "xml2render/1"
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def _respond(self, send_body):
+        partes = [unquote(p) for p in urlsplit(self.path).path.split("/") if p]
+        directorio = self.server.directorio
+
+        if not partes:
+            cache = self.server.cache
+            indice = {
+                "circuitos": list_circuits(directorio),
+                "cache": {
+                    "entradas": len(cache),
+                    "aciertos": cache.aciertos,
+                    "fallos": cache.fallos,
+                },
+            }
+            cuerpo = json.dumps(indice).encode("utf-8")
+            self._send(HTTPStatus.OK, "application/json", cuerpo, send_body)
+            return
+
+        if len(partes) != 2 or partes[1] not in RESOURCES:
+            self._error(HTTPStatus.NOT_FOUND, "Recurso no encontrado", send_body)
+            return
+        nombre, recurso = partes
+        # Sólo se sirven XML del propio directorio (sin rutas relativas)
+        if nombre in (".", "..") or os.sep in nombre or "/" in nombre:
+            self._error(HTTPStatus.NOT_FOUND, "Circuito no encontrado", send_body)
+            return
+
+        xml_file = os.path.join(directorio, f"{nombre}.xml")
+        try:
+            rendered = self.server.cache.get(xml_file, recurso)
+        except FileNotFoundError:
+            self._error(HTTPStatus.NOT_FOUND, "Circuito no encontrado", send_body)
+            return
+        except (ET.ParseError, ValueError) as e:
+            self._error(HTTPStatus.UNPROCESSABLE_ENTITY, str(e), send_body)
+            return
+
+        comprimir = accepts_gzip(self.headers.get("Accept-Encoding", ""))
+        etag = rendered.etag_gzip if comprimir else rendered.etag
+        cabeceras = {
+            "ETag": etag,
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+
+        if etag_matches(self.headers.get("If-None-Match", ""), etag):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            for nombre, valor in cabeceras.items():
+                self.send_header(nombre, valor)
+            self.end_headers()
+            return
+
+        cuerpo = rendered.datos
+        if comprimir:
+            cuerpo = rendered.gzip()
+            cabeceras["Content-Encoding"] = "gzip"
+        self._send(HTTPStatus.OK, RESOURCES[recurso], cuerpo, send_body, cabeceras)
+
+    def _send(self, estado, tipo, cuerpo, send_body, cabeceras=None):
+        self.send_response(estado)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(cuerpo)))
+        for nombre, valor in (cabeceras or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(cuerpo)
+
+    def _error(self, estado, mensaje, send_body):
+        cuerpo = f"{mensaje}\n".encode("utf-8")
+        self._send(estado, "text/plain; charset=utf-8", cuerpo, send_body)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class RenderServer(ThreadingHTTPServer):
+    """Servidor HTTP con la caché de circuitos compartida entre peticiones"""
+
+    daemon_threads = True
+
+    def __init__(self, address, directorio, cache_size=DEFAULT_CACHE_SIZE, quiet=False):
+        super().__init__(address, RenderHandler)
+        self.directorio = directorio
+        self.cache = CircuitCache(cache_size)
+        self.quiet = quiet
+
+
+def main(argv):
+    # Uso: render_service.py [directorio] [--host=H] [--port=N] [--cache-size=N]
+    # Sirve los circuitos XML del directorio generando KML, SVG y HTML bajo demanda
+    host, argv = pop_option(argv, "--host", DEFAULT_HOST)
+    port, argv = pop_option(argv, "--port", DEFAULT_PORT, int)
+    cache_size, argv = pop_option(argv, "--cache-size", DEFAULT_CACHE_SIZE, int)
+    reject_unknown_options(argv, "[directorio]")
+    directorio = argv[1] if len(argv) > 1 else "."
+
+    if not os.path.isdir(directorio):
+        print(f"Error: No se encuentra el directorio {directorio}")
+        sys.exit(1)
+
+    servidor = RenderServer((host, port), directorio, cache_size)
+    print(f"Sirviendo {os.path.abspath(directorio)} en http://{host}:{port}/")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main(sys.argv)
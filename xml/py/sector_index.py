@@ -0,0 +1,167 @@
+import bisect
+import math
+
+from track_analytics import analyze_columns
+from tramo_cache import as_columns, columns_from_records
+
+# Colores de los sectores (RGB), asignados cíclicamente por número de sector
+SECTOR_COLORS = (
+    "#e6194b",
+    "#3cb44b",
+    "#4363d8",
+    "#f58231",
+    "#911eb4",
+    "#42d4f4",
+    "#f032e6",
+    "#9a6324",
+)
+
+
+def sector_color(sector):
+    """Color RGB (#rrggbb) de un sector"""
+    return SECTOR_COLORS[(sector - 1) % len(SECTOR_COLORS)]
+
+
+def kml_color(rgb, alpha="ff"):
+    """Convierte #rrggbb al formato aabbggrr de KML"""
+    return f"{alpha}{rgb[5:7]}{rgb[3:5]}{rgb[1:3]}"
+
+
+class SectorStats:
+    """Agregados de un sector: tramos, longitud, desnivel y rectángulo envolvente.
+
+    Longitud, distancia, subida, bajada y pendiente máxima son los totales
+    del sector calculados por track_analytics.
+    """
+
+    __slots__ = (
+        "sector",
+        "primero",
+        "ultimo",
+        "tramos",
+        "longitud",
+        "distancia",
+        "subida",
+        "bajada",
+        "pendiente_max",
+        "min_lon",
+        "min_lat",
+        "max_lon",
+        "max_lat",
+    )
+
+    def __init__(self, sector, primero, totales):
+        self.sector = sector
+        # Números (1 = primero) del primer y último tramo del sector
+        self.primero = primero
+        self.ultimo = primero
+        self.tramos = totales["tramos"]
+        # Longitud geodésica y distancia declarada, en metros
+        self.longitud = totales["longitud"]
+        self.distancia = totales["distancia"]
+        self.subida = totales["subida"]
+        self.bajada = totales["bajada"]
+        self.pendiente_max = totales["pendiente_max"]
+        self.min_lon = self.min_lat = math.inf
+        self.max_lon = self.max_lat = -math.inf
+
+    def _extend(self, lon, lat):
+        self.min_lon = min(self.min_lon, lon)
+        self.min_lat = min(self.min_lat, lat)
+        self.max_lon = max(self.max_lon, lon)
+        self.max_lat = max(self.max_lat, lat)
+
+    @property
+    def bbox(self):
+        """Rectángulo envolvente (min_lon, min_lat, max_lon, max_lat)"""
+        return self.min_lon, self.min_lat, self.max_lon, self.max_lat
+
+    def __repr__(self):
+        return (
+            f"SectorStats({self.sector}, tramos {self.primero}-{self.ultimo}, "
+            f"{self.longitud:.0f} m, +{self.subida:.1f}/-{self.bajada:.1f} m)"
+        )
+
+
+class SectorIndex:
+    """Índice de sectores de un circuito.
+
+    Asocia cada número de sector con sus agregados (SectorStats), de modo que
+    las consultas por sector no recorren los tramos. runs guarda los tramos
+    consecutivos de un mismo sector como (sector, primero, último), en orden
+    de recorrido; un sector puede aparecer en varios si no es contiguo. Los
+    tramos sin sector no cuentan en ningún sector pero cortan los runs. Se
+    construye con from_tramos o from_records sólo cuando se piden sectores.
+    """
+
+    def __init__(self):
+        self._sectores = {}
+        self.runs = []
+        self.num_tramos = 0
+
+    @classmethod
+    def from_tramos(cls, tramos, analisis=None):
+        """Índice de los tramos de tramo_cache (columnas o TramoStream).
+
+        Los totales de cada sector salen de analisis (analyze_columns de los
+        mismos tramos), que se calcula si no se indica; aquí sólo se recorren
+        las columnas de sector y coordenadas para los runs y los rectángulos.
+        """
+        tramos = as_columns(tramos)
+        if analisis is None:
+            analisis = analyze_columns(tramos)
+        totales = analisis["sectores"]
+
+        indice = cls()
+        origen = tramos.origen
+        # Punto de partida del tramo: el origen o el final del tramo anterior
+        anterior = (origen.longitud, origen.latitud) if origen else None
+        columnas = zip(tramos.sector, tramos.longitud, tramos.latitud)
+        for numero, (sector, lon, lat) in enumerate(columnas, start=1):
+            sector = None if math.isnan(sector) else int(sector)
+            if indice.runs and indice.runs[-1][0] == sector:
+                indice.runs[-1][2] = numero
+            else:
+                indice.runs.append([sector, numero, numero])
+
+            if sector is not None:
+                datos = indice._sectores.get(sector)
+                if datos is None:
+                    datos = indice._sectores[sector] = SectorStats(
+                        sector, numero, totales[sector]
+                    )
+                datos.ultimo = numero
+                datos._extend(lon, lat)
+                if anterior is not None:
+                    datos._extend(*anterior)
+            anterior = (lon, lat)
+        indice.num_tramos = len(tramos)
+        return indice
+
+    @classmethod
+    def from_records(cls, origen, registros, analisis=None):
+        """Índice de los registros (distancia, lon, lat, alt, sector) dados"""
+        return cls.from_tramos(columns_from_records(None, origen, registros), analisis)
+
+    def __getitem__(self, sector):
+        return self._sectores[sector]
+
+    def get(self, sector, default=None):
+        return self._sectores.get(sector, default)
+
+    def __contains__(self, sector):
+        return sector in self._sectores
+
+    def __len__(self):
+        return len(self._sectores)
+
+    def __iter__(self):
+        """Agregados de cada sector, por número de sector"""
+        return iter(sorted(self._sectores.values(), key=lambda datos: datos.sector))
+
+    def sector_of(self, tramo):
+        """Sector del tramo número tramo (1 = primero); None si no tiene"""
+        if not 1 <= tramo <= self.num_tramos:
+            raise IndexError(tramo)
+        i = bisect.bisect_right(self.runs, tramo, key=lambda run: run[1]) - 1
+        return self.runs[i][0]
@@ -0,0 +1,116 @@
+import heapq
+import math
+
+# Radio medio terrestre en metros (proyección local de lon/lat a metros)
+EARTH_RADIUS = 6371008.8
+
+
+def _deviation(a, b, c):
+    """Distancia de b a la recta que une a y c (altura del triángulo abc)"""
+    base = math.hypot(c[0] - a[0], c[1] - a[1])
+    doble_area = abs((b[0] - a[0]) * (c[1] - a[1]) - (c[0] - a[0]) * (b[1] - a[1]))
+    if base == 0:
+        return math.hypot(b[0] - a[0], b[1] - a[1])
+    return doble_area / base
+
+
+def simplify_indices(points, tolerance):
+    """Simplificación de Visvalingam-Whyatt en O(n log n) con un montículo.
+
+    En cada paso se elimina el punto menos significativo, medido como su
+    desviación respecto a la recta que une sus vecinos (en las mismas unidades
+    que los puntos), mientras sea menor que tolerance. Los extremos se
+    conservan siempre. Devuelve los índices de los puntos que se mantienen.
+    """
+    n = len(points)
+    if n <= 2 or tolerance <= 0:
+        return list(range(n))
+
+    prev = list(range(-1, n - 1))
+    nxt = list(range(1, n + 1))
+    eliminado = [False] * n
+    significancia = [math.inf] * n
+
+    heap = []
+    for i in range(1, n - 1):
+        significancia[i] = _deviation(points[i - 1], points[i], points[i + 1])
+        heap.append((significancia[i], i))
+    heapq.heapify(heap)
+
+    while heap:
+        valor, i = heapq.heappop(heap)
+        if eliminado[i] or valor != significancia[i]:
+            # Entrada obsoleta: el punto ya se eliminó o se recalculó
+            continue
+        if valor >= tolerance:
+            break
+
+        eliminado[i] = True
+        a, c = prev[i], nxt[i]
+        nxt[a] = c
+        prev[c] = a
+
+        # Recalcular los vecinos; nunca bajan de la significancia eliminada
+        # para que el orden de eliminación sea coherente
+        for j in (a, c):
+            if 0 < j < n - 1:
+                significancia[j] = max(
+                    valor, _deviation(points[prev[j]], points[j], points[nxt[j]])
+                )
+                heapq.heappush(heap, (significancia[j], j))
+
+    return [i for i in range(n) if not eliminado[i]]
+
+
+def simplify_points(points, tolerance):
+    """Simplifica una lista de puntos (x, y); devuelve (puntos, nº eliminados).
+
+    Un array NumPy de forma (n, 2) se simplifica sobre su copia en lista y
+    se devuelve como array.
+    """
+    if hasattr(points, "tolist"):
+        indices = simplify_indices(points.tolist(), tolerance)
+        return points[indices], len(points) - len(indices)
+    indices = simplify_indices(points, tolerance)
+    return [points[i] for i in indices], len(points) - len(indices)
+
+
+def project_lonlat(coords):
+    """Proyecta (lon, lat) a metros en un plano local equirectangular"""
+    if not coords:
+        return []
+    lon0, lat0 = coords[0]
+    escala_x = math.radians(1) * EARTH_RADIUS * math.cos(math.radians(lat0))
+    escala_y = math.radians(1) * EARTH_RADIUS
+    return [((lon - lon0) * escala_x, (lat - lat0) * escala_y) for lon, lat in coords]
+
+
+def simplify_records(origen, registros, tolerance_m):
+    """Simplifica registros (distancia, lon, lat, alt, sector) con tolerancia en metros.
+
+    El origen, si existe, participa como primer punto del trazado y siempre
+    se conserva. El último tramo también se conserva siempre. Devuelve
+    (registros conservados, nº eliminados).
+    """
+    registros = list(registros)
+    coords = [(r[1], r[2]) for r in registros]
+    desplazamiento = 0
+    if origen is not None:
+        coords.insert(0, (origen.longitud, origen.latitud))
+        desplazamiento = 1
+
+    indices = simplify_indices(project_lonlat(coords), tolerance_m)
+
+    # La distancia de los tramos eliminados se acumula en el siguiente tramo
+    # conservado, de modo que la distancia total del circuito no cambia
+    conservados = []
+    anterior = 0
+    for i in indices:
+        if i < desplazamiento:
+            continue
+        j = i - desplazamiento
+        distancias = [r[0] for r in registros[anterior : j + 1] if r[0] is not None]
+        distancia = sum(distancias) if distancias else None
+        conservados.append((distancia,) + registros[j][1:])
+        anterior = j + 1
+    return conservados, len(registros) - len(conservados)
@@ -0,0 +1,298 @@
+import heapq
+import math
+import sys
+import xml.etree.ElementTree as ET
+from array import array
+
+from simplify import EARTH_RADIUS
+from tramo_cache import as_columns, load_tramos
+
+
+class Match:
+    """Resultado de una consulta de tramo más cercano"""
+
+    __slots__ = ("tramo", "sector", "distancia", "fraccion")
+
+    def __init__(self, tramo: int, sector: int | None, distancia: float, fraccion: float):
+        # Número de tramo (1 = primero, como en los placemarks del KML)
+        self.tramo = tramo
+        self.sector = sector
+        # Distancia en metros del punto consultado al tramo
+        self.distancia = distancia
+        # Posición de la proyección a lo largo del tramo (0 = inicio, 1 = fin)
+        self.fraccion = fraccion
+
+    def __repr__(self):
+        return (
+            f"Match({self.tramo}, {self.sector!r}, "
+            f"{self.distancia:.2f}, {self.fraccion:.3f})"
+        )
+
+
+def _point_segment(px, py, ax, ay, bx, by):
+    """Distancia de p al segmento ab y fracción de su proyección sobre él"""
+    dx, dy = bx - ax, by - ay
+    largo2 = dx * dx + dy * dy
+    if largo2 == 0:
+        return math.hypot(px - ax, py - ay), 0.0
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / largo2))
+    return math.hypot(px - ax - t * dx, py - ay - t * dy), t
+
+
+def _segment_in_box(ax, ay, bx, by, x0, y0, x1, y1):
+    """Indica si el segmento ab corta el rectángulo (recorte de Liang-Barsky)"""
+    t0, t1 = 0.0, 1.0
+    dx, dy = bx - ax, by - ay
+    for p, q in ((-dx, ax - x0), (dx, x1 - ax), (-dy, ay - y0), (dy, y1 - ay)):
+        if p == 0:
+            if q < 0:
+                return False
+            continue
+        t = q / p
+        if p < 0:
+            t0 = max(t0, t)
+        else:
+            t1 = min(t1, t)
+        if t0 > t1:
+            return False
+    return True
+
+
+def _box_distance(px, py, x0, y0, x1, y1):
+    """Distancia mínima de p a un rectángulo (0 si está dentro)"""
+    dx = max(x0 - px, 0.0, px - x1)
+    dy = max(y0 - py, 0.0, py - y1)
+    return math.hypot(dx, dy)
+
+
+class SegmentIndex:
+    """Jerarquía de rectángulos envolventes sobre los segmentos del trazado.
+
+    Cada segmento une dos puntos consecutivos (el origen y los puntos finales
+    de los tramos). Como los segmentos consecutivos de un circuito están
+    próximos entre sí, basta agruparlos por orden: el nivel 0 envuelve
+    bloques de bucket_size segmentos y cada nivel superior une dos rectángulos
+    del anterior. Las consultas descartan ramas enteras por su rectángulo, con
+    un coste logarítmico en el número de tramos. Las coordenadas se proyectan
+    a metros en un plano local.
+    """
+
+    def __init__(self, coords, sectores, primer_tramo=1, bucket_size=16):
+        """coords: lista de (lon, lat); sectores: sector del tramo de cada segmento.
+
+        primer_tramo es el número del tramo que termina en coords[1].
+        """
+        self.primer_tramo = primer_tramo
+        self.sectores = list(sectores)
+        self.bucket_size = bucket_size
+        self._lon0, self._lat0 = coords[0] if coords else (0.0, 0.0)
+        self._escala_x = (
+            math.radians(1) * EARTH_RADIUS * math.cos(math.radians(self._lat0))
+        )
+        self._escala_y = math.radians(1) * EARTH_RADIUS
+
+        xs = array("d")
+        ys = array("d")
+        for lon, lat in coords:
+            x, y = self.project(lon, lat)
+            xs.append(x)
+            ys.append(y)
+        self._xs = xs
+        self._ys = ys
+
+        # Nivel 0: rectángulo de cada bloque de segmentos
+        num_segmentos = len(self)
+        nivel = [array("d") for _ in range(4)]
+        for inicio in range(0, num_segmentos, bucket_size):
+            fin = min(inicio + bucket_size, num_segmentos) + 1
+            bloque_x = xs[inicio:fin]
+            bloque_y = ys[inicio:fin]
+            for columna, valor in zip(
+                nivel, (min(bloque_x), min(bloque_y), max(bloque_x), max(bloque_y))
+            ):
+                columna.append(valor)
+        self._niveles = [nivel]
+
+        # Niveles superiores hasta llegar a un único rectángulo
+        while len(nivel[0]) > 1:
+            x0, y0, x1, y1 = nivel
+            n = len(x0)
+            nivel = [array("d") for _ in range(4)]
+            for i in range(0, n, 2):
+                j = min(i + 1, n - 1)
+                nivel[0].append(min(x0[i], x0[j]))
+                nivel[1].append(min(y0[i], y0[j]))
+                nivel[2].append(max(x1[i], x1[j]))
+                nivel[3].append(max(y1[i], y1[j]))
+            self._niveles.append(nivel)
+
+    @classmethod
+    def from_tramos(cls, tramos, bucket_size=16):
+        """Índice a partir de las columnas de tramo_cache"""
+        tramos = as_columns(tramos)
+        coords = list(zip(tramos.longitud, tramos.latitud))
+        sectores = [None if math.isnan(s) else int(s) for s in tramos.sector]
+        primer_tramo = 1
+        if tramos.origen is not None:
+            coords.insert(0, (tramos.origen.longitud, tramos.origen.latitud))
+        else:
+            # Sin origen, el primer segmento termina en el segundo tramo
+            sectores = sectores[1:]
+            primer_tramo = 2
+        return cls(coords, sectores, primer_tramo, bucket_size)
+
+    @classmethod
+    def from_circuit(cls, circuito, bucket_size=16):
+        """Índice a partir del modelo completo del circuito"""
+        coords = [(p.longitud, p.latitud) for p in circuito.coordenadas()]
+        sectores = [t.sector for t in circuito.tramos]
+        primer_tramo = 1
+        if circuito.origen is None:
+            sectores = sectores[1:]
+            primer_tramo = 2
+        return cls(coords, sectores, primer_tramo, bucket_size)
+
+    def __len__(self):
+        return max(0, len(self._xs) - 1)
+
+    def project(self, lon, lat):
+        """Proyecta (lon, lat) a metros en el plano local del índice"""
+        return (lon - self._lon0) * self._escala_x, (lat - self._lat0) * self._escala_y
+
+    def _children(self, nivel, i):
+        """Nodos hijos del nodo i del nivel indicado"""
+        if nivel == 0:
+            return ()
+        tope = len(self._niveles[nivel - 1][0])
+        return [(nivel - 1, j) for j in (2 * i, 2 * i + 1) if j < tope]
+
+    def _segments(self, i):
+        """Segmentos del bloque i del nivel 0"""
+        inicio = i * self.bucket_size
+        return range(inicio, min(inicio + self.bucket_size, len(self)))
+
+    def _node_distance(self, px, py, nivel, i):
+        x0, y0, x1, y1 = self._niveles[nivel]
+        return _box_distance(px, py, x0[i], y0[i], x1[i], y1[i])
+
+    def nearest(self, lon, lat):
+        """Tramo más cercano a (lon, lat); None si el índice está vacío.
+
+        Búsqueda del mejor primero: se expanden los nodos en orden de
+        distancia a su rectángulo y se termina cuando el siguiente está más
+        lejos que el mejor segmento encontrado.
+        """
+        if not len(self):
+            return None
+        px, py = self.project(lon, lat)
+        xs, ys = self._xs, self._ys
+
+        raiz = len(self._niveles) - 1
+        pendientes = [(self._node_distance(px, py, raiz, 0), raiz, 0)]
+        mejor = None
+        while pendientes:
+            cota, nivel, i = heapq.heappop(pendientes)
+            if mejor is not None and cota >= mejor[0]:
+                break
+            if nivel == 0:
+                for s in self._segments(i):
+                    distancia, fraccion = _point_segment(
+                        px, py, xs[s], ys[s], xs[s + 1], ys[s + 1]
+                    )
+                    if mejor is None or distancia < mejor[0]:
+                        mejor = (distancia, s, fraccion)
+                continue
+            for hijo in self._children(nivel, i):
+                heapq.heappush(
+                    pendientes, (self._node_distance(px, py, *hijo), *hijo)
+                )
+
+        distancia, s, fraccion = mejor
+        return Match(self.primer_tramo + s, self.sectores[s], distancia, fraccion)
+
+    def nearest_many(self, fixes):
+        """Tramo más cercano de cada (lon, lat) de fixes, en una sola llamada"""
+        return [self.nearest(lon, lat) for lon, lat in fixes]
+
+    def query_bbox(self, min_lon, min_lat, max_lon, max_lat):
+        """Números de los tramos que atraviesan el rectángulo lon/lat dado"""
+        if not len(self):
+            return []
+        x0, y0 = self.project(min_lon, min_lat)
+        x1, y1 = self.project(max_lon, max_lat)
+        xs, ys = self._xs, self._ys
+
+        tramos = []
+        pila = [(len(self._niveles) - 1, 0)]
+        while pila:
+            nivel, i = pila.pop()
+            nx0, ny0, nx1, ny1 = (columna[i] for columna in self._niveles[nivel])
+            if nx1 < x0 or nx0 > x1 or ny1 < y0 or ny0 > y1:
+                continue
+            if nivel:
+                pila.extend(self._children(nivel, i))
+                continue
+            tramos.extend(
+                self.primer_tramo + s
+                for s in self._segments(i)
+                if _segment_in_box(xs[s], ys[s], xs[s + 1], ys[s + 1], x0, y0, x1, y1)
+            )
+        return sorted(tramos)
+
+
+def read_fixes(stream):
+    """Lee posiciones "lon,lat" (una por línea; se ignoran vacías y comentarios).
+
+    Las líneas que no se pueden interpretar se omiten avisando en stderr.
+    """
+    for numero, linea in enumerate(stream, 1):
+        linea = linea.strip()
+        if not linea or linea.startswith("#"):
+            continue
+        try:
+            lon, lat = linea.split(",")[:2]
+            fix = float(lon), float(lat)
+        except ValueError:
+            print(f"Aviso: línea {numero} no válida: {linea}", file=sys.stderr)
+            continue
+        yield fix
+
+
+def main(argv):
+    # Uso: spatial_index.py circuito.xml [posiciones.csv | -]
+    # Escribe, para cada posición lon,lat, el tramo y sector más cercanos
+    if len(argv) < 2:
+        print("Uso: spatial_index.py circuito.xml [posiciones.csv | -]")
+        sys.exit(1)
+    in_xml = argv[1]
+    fixes_file = argv[2] if len(argv) > 2 else "-"
+
+    try:
+        indice = SegmentIndex.from_tramos(load_tramos(in_xml))
+    except FileNotFoundError:
+        print(f"Error: No se encuentra el archivo {in_xml}")
+        sys.exit(1)
+    except ET.ParseError as e:
+        print(f"Error al parsear XML: {e}")
+        sys.exit(1)
+
+    if fixes_file == "-":
+        fixes = list(read_fixes(sys.stdin))
+    else:
+        with open(fixes_file, encoding="utf-8") as f:
+            fixes = list(read_fixes(f))
+
+    print("lon,lat,tramo,sector,distancia_m,fraccion")
+    for (lon, lat), match in zip(fixes, indice.nearest_many(fixes)):
+        if match is None:
+            print(f"{lon},{lat},,,,")
+            continue
+        sector = "" if match.sector is None else match.sector
+        print(
+            f"{lon},{lat},{match.tramo},{sector},"
+            f"{match.distancia:.2f},{match.fraccion:.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv)
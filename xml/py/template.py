@@ -0,0 +1,58 @@
+import html
+import re
+
+# Hueco de una plantilla: {{ nombre }} (escapado) o {{ nombre|raw }} (sin escapar)
+SLOT_PATTERN = re.compile(r"\{\{\s*(\w+)(\|raw)?\s*\}\}")
+
+
+def escape(value):
+    """Escapa un valor para insertarlo en texto o atributos HTML"""
+    return html.escape(str(value), quote=True)
+
+
+class Template:
+    """Plantilla precompilada con huecos {{ nombre }}.
+
+    El texto se analiza una sola vez en una lista de fragmentos literales y
+    huecos; render() sólo rellena los huecos y hace un único ''.join. Todos
+    los huecos se escapan salvo los marcados con |raw, reservados para HTML
+    ya generado (por ejemplo, el resultado de otra plantilla).
+    """
+
+    __slots__ = ("source", "_chunks", "_slots")
+
+    def __init__(self, source):
+        self.source = source
+        self._chunks = []
+        # (posición en _chunks, nombre, escapar)
+        self._slots = []
+
+        posicion = 0
+        for match in SLOT_PATTERN.finditer(source):
+            self._chunks.append(source[posicion : match.start()])
+            self._slots.append((len(self._chunks), match.group(1), not match.group(2)))
+            self._chunks.append(None)
+            posicion = match.end()
+        self._chunks.append(source[posicion:])
+
+    @property
+    def names(self):
+        """Nombres de los huecos de la plantilla"""
+        return [name for _, name, _ in self._slots]
+
+    def render(self, values=None, **kwargs):
+        """Rellena los huecos con values (un diccionario) y/o kwargs"""
+        if values is None:
+            values = kwargs
+        elif kwargs:
+            values = {**values, **kwargs}
+
+        partes = self._chunks.copy()
+        for posicion, name, escapar in self._slots:
+            valor = values[name]
+            partes[posicion] = escape(valor) if escapar else str(valor)
+        return "".join(partes)
+
+    def render_each(self, items):
+        """Renderiza la plantilla una vez por cada diccionario de items"""
+        return "".join([self.render(item) for item in items])
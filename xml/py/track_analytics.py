@@ -0,0 +1,279 @@
+import math
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: sin él se usa Python puro
+    np = None
+
+from simplify import EARTH_RADIUS
+from tramo_cache import as_columns, columns_from_records
+
+# Diferencia relativa entre longitud geodésica y distancia declarada a partir
+# de la cual un tramo se considera discrepante
+DEFAULT_TOLERANCE = 0.25
+
+
+def _nan_to_none(valor):
+    return None if valor is None or math.isnan(valor) else valor
+
+
+def _segments_numpy(lons, lats, alts):
+    """Longitud (haversine), rumbo y desnivel de cada segmento entre puntos consecutivos"""
+    lon = np.radians(lons)
+    lat = np.radians(lats)
+    dlon = lon[1:] - lon[:-1]
+    dlat = lat[1:] - lat[:-1]
+
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(dlon / 2) ** 2
+    longitudes = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    y = np.sin(dlon) * np.cos(lat[1:])
+    x = np.cos(lat[:-1]) * np.sin(lat[1:]) - np.sin(lat[:-1]) * np.cos(lat[1:]) * np.cos(
+        dlon
+    )
+    rumbos = np.degrees(np.arctan2(y, x)) % 360
+    return longitudes, rumbos, alts[1:] - alts[:-1]
+
+
+def _segments_python(lons, lats, alts):
+    """_segments_numpy en Python puro"""
+    longitudes, rumbos, desniveles = [], [], []
+    for i in range(1, len(lons)):
+        lon1, lat1 = math.radians(lons[i - 1]), math.radians(lats[i - 1])
+        lon2, lat2 = math.radians(lons[i]), math.radians(lats[i])
+        dlon = lon2 - lon1
+        a = (
+            math.sin((lat2 - lat1) / 2) ** 2
+            + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
+        )
+        longitudes.append(2 * EARTH_RADIUS * math.asin(math.sqrt(min(a, 1.0))))
+        y = math.sin(dlon) * math.cos(lat2)
+        x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(
+            dlon
+        )
+        rumbos.append(math.degrees(math.atan2(y, x)) % 360)
+        desniveles.append(alts[i] - alts[i - 1])
+    return longitudes, rumbos, desniveles
+
+
+def _per_tramo_numpy(longitudes, rumbos, desniveles, distancias):
+    """Pendiente, cambio de rumbo, curvatura y discrepancia de cada tramo"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pendientes = np.where(longitudes > 0, desniveles / longitudes * 100, np.nan)
+        # Cambio de rumbo en el punto final de cada tramo (hacia el siguiente)
+        cambios = np.full(len(rumbos), np.nan)
+        cambios[:-1] = (rumbos[1:] - rumbos[:-1] + 180) % 360 - 180
+        curvaturas = np.full(len(rumbos), np.nan)
+        curvaturas[:-1] = np.radians(np.abs(cambios[:-1])) / (
+            (longitudes[:-1] + longitudes[1:]) / 2
+        )
+        curvaturas[~np.isfinite(curvaturas)] = np.nan
+        desviaciones = (longitudes - distancias) / distancias
+        desviaciones[~np.isfinite(desviaciones)] = np.nan
+    return pendientes, cambios, curvaturas, desviaciones
+
+
+def _per_tramo_python(longitudes, rumbos, desniveles, distancias):
+    """_per_tramo_numpy en Python puro"""
+    n = len(longitudes)
+    pendientes, cambios, curvaturas, desviaciones = [], [], [], []
+    for i in range(n):
+        longitud = longitudes[i]
+        pendientes.append(
+            desniveles[i] / longitud * 100 if longitud > 0 else math.nan
+        )
+        if i + 1 < n and not math.isnan(rumbos[i]) and not math.isnan(rumbos[i + 1]):
+            cambio = (rumbos[i + 1] - rumbos[i] + 180) % 360 - 180
+            media = (longitud + longitudes[i + 1]) / 2
+            curvatura = math.radians(abs(cambio)) / media if media > 0 else math.nan
+        else:
+            cambio = curvatura = math.nan
+        cambios.append(cambio)
+        curvaturas.append(curvatura)
+        distancia = distancias[i]
+        desviaciones.append(
+            (longitud - distancia) / distancia
+            if distancia and not math.isnan(distancia) and not math.isnan(longitud)
+            else math.nan
+        )
+    return pendientes, cambios, curvaturas, desviaciones
+
+
+def _aggregate(indices, distancias, longitudes, desniveles, pendientes, curvaturas):
+    """Totales de un conjunto de tramos (un sector o el circuito completo)"""
+
+    def valores(columna):
+        return [columna[i] for i in indices if not math.isnan(columna[i])]
+
+    declaradas = valores(distancias)
+    subidas = valores(desniveles)
+    pendientes = valores(pendientes)
+    curvaturas = valores(curvaturas)
+    return {
+        "tramos": len(indices),
+        "distancia": sum(declaradas),
+        "longitud": sum(valores(longitudes)),
+        "subida": sum(d for d in subidas if d > 0),
+        "bajada": -sum(d for d in subidas if d < 0),
+        "pendiente_max": max(pendientes, default=None),
+        "pendiente_min": min(pendientes, default=None),
+        "curvatura_max": max(curvaturas, default=None),
+    }
+
+
+def _aggregate_numpy(mascara, distancias, longitudes, desniveles, pendientes, curvaturas):
+    """_aggregate vectorizado con una máscara booleana de tramos"""
+
+    def extremo(funcion, columna):
+        columna = columna[mascara]
+        columna = columna[~np.isnan(columna)]
+        return float(funcion(columna)) if len(columna) else None
+
+    subidas = np.nan_to_num(desniveles[mascara])
+    return {
+        "tramos": int(mascara.sum()),
+        "distancia": float(np.nansum(distancias[mascara])),
+        "longitud": float(np.nansum(longitudes[mascara])),
+        "subida": float(subidas[subidas > 0].sum()),
+        "bajada": float(abs(subidas[subidas < 0].sum())),
+        "pendiente_max": extremo(np.max, pendientes),
+        "pendiente_min": extremo(np.min, pendientes),
+        "curvatura_max": extremo(np.max, curvaturas),
+    }
+
+
+def analyze_columns(tramos, tolerance=DEFAULT_TOLERANCE):
+    """Analiza la geometría de los tramos (columnas de tramo_cache).
+
+    Calcula en una pasada, vectorizada con NumPy si está instalado:
+    longitud geodésica (haversine) de cada tramo desde el punto anterior
+    (el origen para el primero), su diferencia relativa con la distancia
+    declarada, pendiente (%), rumbo (grados), cambio de rumbo y curvatura
+    (1/m) al final del tramo, y los totales por sector y del circuito.
+    Las columnas por tramo son arrays de NumPy (listas sin él) y los
+    valores que no se pueden calcular (el primer tramo sin origen, el último
+    cambio de rumbo...) son NaN: se pasan a None sólo al formatear un valor
+    (tramo_annotation). Devuelve un diccionario.
+    """
+    tramos = as_columns(tramos)
+    origen = tramos.origen
+    n = len(tramos)
+    if np is not None:
+        lons = np.frombuffer(tramos.longitud)
+        lats = np.frombuffer(tramos.latitud)
+        alts = np.frombuffer(tramos.altitud)
+        if origen is not None:
+            lons = np.concatenate(([origen.longitud], lons))
+            lats = np.concatenate(([origen.latitud], lats))
+            alts = np.concatenate(([origen.altitud], alts))
+        longitudes, rumbos, desniveles = _segments_numpy(lons, lats, alts)
+        if origen is None and n:
+            # Sin origen el primer tramo no tiene punto de partida
+            relleno = np.array([np.nan])
+            longitudes = np.concatenate((relleno, longitudes))
+            rumbos = np.concatenate((relleno, rumbos))
+            desniveles = np.concatenate((relleno, desniveles))
+        distancias = np.frombuffer(tramos.distancia)
+        pendientes, cambios, curvaturas, desviaciones = _per_tramo_numpy(
+            longitudes, rumbos, desniveles, distancias
+        )
+        sectores_col = np.frombuffer(tramos.sector)
+        sectores = {
+            int(s): _aggregate_numpy(
+                sectores_col == s,
+                distancias,
+                longitudes,
+                desniveles,
+                pendientes,
+                curvaturas,
+            )
+            for s in np.unique(sectores_col[~np.isnan(sectores_col)])
+        }
+        total = _aggregate_numpy(
+            np.ones(n, dtype=bool), distancias, longitudes, desniveles, pendientes, curvaturas
+        )
+        discrepantes = (np.flatnonzero(np.abs(desviaciones) > tolerance) + 1).tolist()
+        idx_pendiente = (
+            int(np.nanargmax(pendientes)) if n and not np.isnan(pendientes).all() else None
+        )
+    else:
+        lons = list(tramos.longitud)
+        lats = list(tramos.latitud)
+        alts = list(tramos.altitud)
+        if origen is not None:
+            lons.insert(0, origen.longitud)
+            lats.insert(0, origen.latitud)
+            alts.insert(0, origen.altitud)
+        longitudes, rumbos, desniveles = _segments_python(lons, lats, alts)
+        if origen is None and n:
+            longitudes.insert(0, math.nan)
+            rumbos.insert(0, math.nan)
+            desniveles.insert(0, math.nan)
+        distancias = list(tramos.distancia)
+        pendientes, cambios, curvaturas, desviaciones = _per_tramo_python(
+            longitudes, rumbos, desniveles, distancias
+        )
+        por_sector = {}
+        for i, s in enumerate(tramos.sector):
+            if not math.isnan(s):
+                por_sector.setdefault(int(s), []).append(i)
+        columnas_agregadas = (distancias, longitudes, desniveles, pendientes, curvaturas)
+        sectores = {
+            s: _aggregate(indices, *columnas_agregadas)
+            for s, indices in sorted(por_sector.items())
+        }
+        total = _aggregate(range(n), *columnas_agregadas)
+        discrepantes = [
+            i + 1
+            for i, d in enumerate(desviaciones)
+            if not math.isnan(d) and abs(d) > tolerance
+        ]
+        validas = [i for i in range(n) if not math.isnan(pendientes[i])]
+        idx_pendiente = max(validas, key=lambda i: pendientes[i], default=None)
+
+    return {
+        "longitud": longitudes,
+        "rumbo": rumbos,
+        "pendiente": pendientes,
+        "cambio_rumbo": cambios,
+        "curvatura": curvaturas,
+        "desviacion": desviaciones,
+        "discrepantes": discrepantes,
+        "idx_pendiente_max": idx_pendiente,
+        "sectores": sectores,
+        "total": total,
+    }
+
+
+def analyze_records(nombre, origen, registros, tolerance=DEFAULT_TOLERANCE):
+    """analyze_columns a partir de registros (distancia, lon, lat, alt, sector)"""
+    return analyze_columns(columns_from_records(nombre, origen, registros), tolerance)
+
+
+def tramo_annotation(analisis, i, tolerance=DEFAULT_TOLERANCE):
+    """Texto con la analítica del tramo i (0-based) para descripciones"""
+    partes = []
+    longitud = _nan_to_none(analisis["longitud"][i])
+    if longitud is not None:
+        partes.append(f"Longitud geodésica: {longitud:.1f} m")
+    pendiente = _nan_to_none(analisis["pendiente"][i])
+    if pendiente is not None:
+        partes.append(f"Pendiente: {pendiente:+.1f} %")
+    cambio = _nan_to_none(analisis["cambio_rumbo"][i])
+    if cambio is not None:
+        partes.append(f"Cambio de rumbo: {cambio:+.0f}°")
+    desviacion = _nan_to_none(analisis["desviacion"][i])
+    if desviacion is not None and abs(desviacion) > tolerance:
+        partes.append(f"Discrepancia con la distancia declarada: {desviacion:+.0%}")
+    return " | ".join(partes)
+
+
+def sector_summary(sector, datos):
+    """Resumen de una línea de los totales de un sector"""
+    texto = (
+        f"Sector {sector}: {datos['longitud']:.0f} m, "
+        f"+{datos['subida']:.1f} m / -{datos['bajada']:.1f} m"
+    )
+    if datos["pendiente_max"] is not None:
+        texto += f", pendiente máx. {datos['pendiente_max']:.1f} %"
+    return texto
@@ -0,0 +1,261 @@
+import contextlib
+import math
+import mmap
+import os
+import secrets
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+
+from build_cache import file_digest
+from circuit_model import Punto, iter_tramos, read_header
+
+# Extensión del fichero binario que se guarda junto a cada XML
+SIDECAR_SUFFIX = ".tramos.bin"
+MAGIC = b"XML2TRM1"
+
+# Cabecera: magic, SHA-256 del XML, nº de tramos, hay origen, origen
+# (lon, lat, alt) y longitud en bytes del nombre en UTF-8
+HEADER = struct.Struct("<8s32sQ?3dI")
+# Columnas float64 en el orden en que se guardan (un valor None se guarda como NaN)
+COLUMNS = ("distancia", "longitud", "latitud", "altitud", "sector")
+# Valores de cada columna que se acumulan antes de escribirlos en el fichero
+WRITE_BLOCK = 8192
+
+
+def sidecar_path(xml_file):
+    """Ruta del fichero binario de tramos asociado a xml_file"""
+    return os.path.splitext(xml_file)[0] + SIDECAR_SUFFIX
+
+
+def _columns_offset(nombre_bytes):
+    """Inicio de las columnas: tras cabecera y nombre, alineado a 8 bytes"""
+    fin = HEADER.size + nombre_bytes
+    return fin + (-fin % 8)
+
+
+class TramoColumns:
+    """Geometría de los tramos en columnas float64.
+
+    Las columnas son memoryviews sobre el fichero mapeado en memoria (sin
+    copias) o arrays en memoria (columns_from_records).
+    """
+
+    columnar = True
+
+    def __init__(self, nombre, origen, columnas, mapa=None):
+        self.nombre = nombre
+        self.origen = origen
+        self.distancia, self.longitud, self.latitud, self.altitud, self.sector = (
+            columnas
+        )
+        self._mapa = mapa
+
+    def __len__(self):
+        return len(self.distancia)
+
+    def registros(self):
+        """Genera los registros (distancia, lon, lat, alt, sector) de cada tramo"""
+        for distancia, lon, lat, alt, sector in zip(
+            self.distancia, self.longitud, self.latitud, self.altitud, self.sector
+        ):
+            yield (
+                None if math.isnan(distancia) else distancia,
+                lon,
+                lat,
+                alt,
+                None if math.isnan(sector) else int(sector),
+            )
+
+    def close(self):
+        """Libera las vistas y el mapeo del fichero"""
+        if self._mapa is None:
+            return
+        for nombre in COLUMNS:
+            getattr(self, nombre).release()
+        self._mapa.close()
+        self._mapa = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TramoStream:
+    """Tramos leídos del XML en streaming, sin guardarlos en columnas.
+
+    Es lo que devuelve load_tramos sin fichero binario: cada llamada a
+    registros() vuelve a recorrer el documento con iter_tramos, así que la
+    memoria usada no depende del número de tramos. Quien necesite las
+    columnas (columnar es False) debe construirlas con columns_from_records.
+    """
+
+    columnar = False
+
+    def __init__(self, xml_file, nombre, origen):
+        self.xml_file = xml_file
+        self.nombre = nombre
+        self.origen = origen
+
+    def registros(self):
+        """Genera los registros (distancia, lon, lat, alt, sector) de cada tramo"""
+        yield from iter_tramos(self.xml_file)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def as_columns(tramos):
+    """Las columnas de tramos, construyéndolas en memoria si se leen en streaming"""
+    if tramos.columnar:
+        return tramos
+    return columns_from_records(tramos.nombre, tramos.origen, tramos.registros())
+
+
+def _encode(valor):
+    return math.nan if valor is None else float(valor)
+
+
+def columns_from_records(nombre, origen, registros):
+    """Construye las columnas en memoria consumiendo registros"""
+    columnas = [array("d") for _ in COLUMNS]
+    for registro in registros:
+        for columna, valor in zip(columnas, registro):
+            columna.append(_encode(valor))
+    return TramoColumns(nombre, origen, columnas)
+
+
+def write_sidecar(path, digest, nombre, origen, registros):
+    """Guarda los tramos consumiendo registros, de forma atómica.
+
+    Las columnas van una tras otra en el fichero: según llegan los registros
+    la primera se escribe directamente en él y las demás en ficheros
+    temporales que se añaden al final, así que la memoria usada no depende
+    del número de tramos. La cabecera (con el número de tramos) se escribe
+    al terminar. Como en output.write_atomic, el temporal tiene un nombre
+    único para que varios procesos puedan regenerar el fichero a la vez.
+    """
+    nombre_bytes = nombre.encode("utf-8")
+    directorio, base = os.path.split(path)
+    tmp = os.path.join(directorio, f".{base}.{secrets.token_hex(8)}.tmp")
+    try:
+        with open(tmp, "xb") as f, contextlib.ExitStack() as pila:
+            resto = [
+                pila.enter_context(tempfile.TemporaryFile()) for _ in COLUMNS[1:]
+            ]
+            destinos = [f, *resto]
+            # Cabecera, nombre y relleno provisionales
+            f.write(b"\0" * _columns_offset(len(nombre_bytes)))
+
+            bloques = [array("d") for _ in COLUMNS]
+            num = 0
+            for registro in registros:
+                for bloque, valor in zip(bloques, registro):
+                    bloque.append(_encode(valor))
+                num += 1
+                if len(bloques[0]) >= WRITE_BLOCK:
+                    for bloque, destino in zip(bloques, destinos):
+                        bloque.tofile(destino)
+                        del bloque[:]
+            for bloque, destino in zip(bloques, destinos):
+                bloque.tofile(destino)
+
+            for columna in resto:
+                columna.seek(0)
+                shutil.copyfileobj(columna, f)
+            f.seek(0)
+            f.write(
+                HEADER.pack(
+                    MAGIC,
+                    bytes.fromhex(digest),
+                    num,
+                    origen is not None,
+                    *(
+                        (origen.longitud, origen.latitud, origen.altitud)
+                        if origen
+                        else (0, 0, 0)
+                    ),
+                    len(nombre_bytes),
+                )
+            )
+            f.write(nombre_bytes)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp)
+        raise
+
+
+def load_sidecar(path, digest):
+    """Mapea en memoria el fichero de tramos; None si no existe o está obsoleto.
+
+    Está obsoleto si el SHA-256 guardado no coincide con el del XML actual.
+    """
+    # Las columnas se guardan en little-endian y se leen sin conversión
+    if sys.byteorder != "little":
+        return None
+    try:
+        with open(path, "rb") as f:
+            mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        # ValueError: fichero vacío (no se puede mapear)
+        return None
+
+    if len(mapa) < HEADER.size:
+        mapa.close()
+        return None
+    magic, guardado, num, hay_origen, lon, lat, alt, len_nombre = HEADER.unpack_from(
+        mapa
+    )
+    inicio = _columns_offset(len_nombre)
+    if (
+        magic != MAGIC
+        or guardado.hex() != digest
+        or len(mapa) != inicio + 8 * num * len(COLUMNS)
+    ):
+        mapa.close()
+        return None
+
+    nombre = mapa[HEADER.size : HEADER.size + len_nombre].decode("utf-8")
+    origen = Punto(lon, lat, alt) if hay_origen else None
+    vista = memoryview(mapa)
+    columnas = [
+        vista[inicio + 8 * num * i : inicio + 8 * num * (i + 1)].cast("d")
+        for i in range(len(COLUMNS))
+    ]
+    vista.release()
+    return TramoColumns(nombre, origen, columnas, mapa)
+
+
+def load_tramos(xml_file, use_sidecar=True):
+    """Geometría de los tramos de xml_file, desde el fichero binario si está al día.
+
+    Si no lo está, se parsea el XML en streaming y se vuelve a escribir. Sin
+    fichero binario (use_sidecar False o un directorio que no admite
+    escritura) se devuelve un TramoStream que lee el XML en streaming.
+    """
+    if not use_sidecar:
+        return TramoStream(xml_file, *read_header(xml_file))
+
+    path = sidecar_path(xml_file)
+    digest = file_digest(xml_file)
+    tramos = load_sidecar(path, digest)
+    if tramos is not None:
+        return tramos
+
+    nombre, origen = read_header(xml_file)
+    try:
+        write_sidecar(path, digest, nombre, origen, iter_tramos(xml_file))
+    except OSError:
+        return TramoStream(xml_file, nombre, origen)
+    return load_sidecar(path, digest) or TramoStream(xml_file, nombre, origen)
@@ -0,0 +1,121 @@
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+import xml_backend
+from circuit_model import circuit_from_root, section_digests
+
+# Secciones de primer nivel del XML de las que depende cada salida
+KML_SECTIONS = ("nombre", "geografia", "tramos")
+SVG_SECTIONS = ("nombre", "geografia", "tramos")
+HTML_SECTIONS = (
+    "nombre",
+    "medidas",
+    "evento",
+    "ubicacion",
+    "patrocinio",
+    "referencias",
+    "galeriaFotos",
+    "galeriaVideos",
+    "resultado",
+    "clasificacionMundial",
+)
+# Secciones adicionales del HTML con la tabla de sectores (el origen de
+# geografia es el punto de partida del primer tramo)
+HTML_SECTOR_SECTIONS = ("geografia", "tramos")
+
+
+def changed_outputs(previous, current, outputs):
+    """Salidas afectadas por los cambios entre dos juegos de hashes de sección.
+
+    outputs asocia cada ruta de salida con las secciones de las que depende;
+    una salida que aún no existe siempre se considera afectada.
+    """
+    cambiadas = {
+        seccion
+        for seccion in previous.keys() | current.keys()
+        if previous.get(seccion) != current.get(seccion)
+    }
+    return [
+        output
+        for output, secciones in outputs.items()
+        if not os.path.exists(output) or cambiadas.intersection(secciones)
+    ]
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def wait_for_change(path, last_mtime, interval=0.5, debounce=0.3):
+    """Espera (sondeando mtime) a que path cambie y deje de modificarse.
+
+    El debounce evita reconstruir a mitad de un guardado: sólo se devuelve
+    cuando el mtime lleva debounce segundos estable.
+    """
+    while True:
+        time.sleep(interval)
+        mtime = _mtime(path)
+        if mtime is None or mtime == last_mtime:
+            continue
+        while True:
+            time.sleep(debounce)
+            estable = _mtime(path)
+            if estable == mtime:
+                return mtime
+            mtime = estable
+
+
+def watch(
+    in_xml,
+    out_kml,
+    out_svg,
+    out_html,
+    rebuild,
+    interval=0.5,
+    debounce=0.3,
+    sectors=False,
+):
+    """Regenera sólo las salidas afectadas cada vez que cambia in_xml.
+
+    rebuild(circuito, pendientes) escribe las salidas indicadas a partir del
+    modelo; el XML se parsea una única vez por cambio. Con sectors el HTML
+    incluye la tabla de sectores y depende también de los tramos. Los
+    errores (XML mal formado, valores no válidos) se informan en stderr y se
+    sigue vigilando. Termina con Ctrl+C.
+    """
+    html_sections = HTML_SECTIONS + (HTML_SECTOR_SECTIONS if sectors else ())
+    outputs = {out_kml: KML_SECTIONS, out_svg: SVG_SECTIONS, out_html: html_sections}
+    digests = {}
+    mtime = _mtime(in_xml)
+
+    print(f"Vigilando {in_xml} (Ctrl+C para salir)")
+    try:
+        while True:
+            try:
+                root = xml_backend.parse(in_xml)
+                actuales = section_digests(root)
+                pendientes = changed_outputs(digests, actuales, outputs)
+                if pendientes:
+                    inicio = time.perf_counter()
+                    rebuild(circuit_from_root(root), pendientes)
+                    print(
+                        f"Regenerado {', '.join(pendientes)} "
+                        f"en {(time.perf_counter() - inicio) * 1000:.0f} ms"
+                    )
+                else:
+                    print("Sin cambios en las secciones usadas por las salidas")
+                # Sólo tras regenerar con éxito: si falla, el siguiente cambio
+                # vuelve a intentar las mismas salidas
+                digests = actuales
+            except ET.ParseError as e:
+                print(f"Error al parsear XML: {e}", file=sys.stderr)
+            except (OSError, ValueError) as e:
+                print(f"Error al regenerar las salidas: {e}", file=sys.stderr)
+            mtime = wait_for_change(in_xml, mtime, interval, debounce)
+    except KeyboardInterrupt:
+        print()
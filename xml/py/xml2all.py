@@ -0,0 +1,294 @@
+import functools
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+import xml2altimetria
+import xml2html
+import xml2kml
+from build_cache import CACHE_FILENAME, BuildCache, build_key, file_digest
+from circuit_model import parse_circuit
+from cli import pop_flag, pop_option, reject_unknown_options
+from number_format import DEGREE_DIGITS, PIXEL_DIGITS, parse_digits
+from output import open_artifact
+from sector_index import SectorIndex
+from track_analytics import analyze_records
+from watch import watch
+
+
+def output_keys(in_xml, out_kml, out_svg, out_html, options, digest=None):
+    """Claves de caché de las tres salidas de un circuito.
+
+    digest es el SHA-256 del XML si ya se conoce (si no, se calcula).
+    """
+    if digest is None:
+        digest = file_digest(in_xml)
+    # Opciones comunes a las tres salidas
+    escritura = {
+        "minify": options.get("minify", False),
+        "precompress": options.get("precompress", False),
+        "sectors": options.get("sectors", False),
+    }
+    return {
+        out_kml: build_key(
+            digest,
+            "kml",
+            xml2kml.VERSION,
+            source=in_xml,
+            timestamp=options.get("timestamp", False),
+            tolerance_m=options.get("tolerance_m"),
+            analytics=options.get("analytics", False),
+            digits=options.get("kml_digits", DEGREE_DIGITS),
+            **escritura,
+        ),
+        out_svg: build_key(
+            digest,
+            "svg",
+            xml2altimetria.VERSION,
+            tolerance_px=options.get("tolerance_px"),
+            analytics=options.get("analytics", False),
+            digits=options.get("svg_digits", PIXEL_DIGITS),
+            **escritura,
+        ),
+        out_html: build_key(
+            digest,
+            "html",
+            xml2html.VERSION,
+            page_size=options.get("page_size", xml2html.DEFAULT_PAGE_SIZE),
+            gallery_page_size=options.get(
+                "gallery_page_size", xml2html.DEFAULT_GALLERY_PAGE_SIZE
+            ),
+            **escritura,
+        ),
+    }
+
+
+def write_outputs(
+    circuito, in_xml, pendientes, out_kml, out_svg, out_html, options, open_sink=None
+):
+    """Escribe, a partir del modelo ya parseado, las salidas incluidas en pendientes.
+
+    options admite timestamp (fecha en el KML), tolerance_m (simplificación
+    del KML en metros), tolerance_px (simplificación del perfil en píxeles) y
+    analytics (anotar KML y perfil con la analítica geodésica de los tramos),
+    page_size y gallery_page_size (paginación de la clasificación y galerías),
+    minify y precompress (minificar y escribir copias .gz/.br de las salidas),
+    kml_digits y svg_digits (decimales de las coordenadas de KML y SVG) y
+    sectors (KML, perfil y HTML divididos o anotados por sectores).
+    open_sink(ruta) sustituye la apertura de cada salida (por defecto
+    open_artifact con minify y precompress).
+    """
+    tiempos = {}
+    minify = options.get("minify", False)
+    precompress = options.get("precompress", False)
+    if open_sink is None:
+        open_sink = functools.partial(
+            open_artifact, minify=minify, precompress=precompress
+        )
+
+    # El índice de sectores se construye una sola vez para las tres salidas
+    sectores = None
+    if options.get("sectors"):
+        sectores = SectorIndex.from_records(circuito.origen, circuito.registros())
+
+    if out_kml in pendientes:
+        inicio = time.perf_counter()
+        with open_sink(out_kml) as sink:
+            xml2kml.write_kml(
+                circuito,
+                sink,
+                in_xml,
+                timestamp=options.get("timestamp", False),
+                tolerance_m=options.get("tolerance_m"),
+                analytics=options.get("analytics", False),
+                digits=options.get("kml_digits", DEGREE_DIGITS),
+                sectores=sectores,
+            )
+        tiempos["kml"] = time.perf_counter() - inicio
+
+    if out_svg in pendientes:
+        inicio = time.perf_counter()
+        nombre, puntos = xml2altimetria.circuit_profile(circuito)
+        analisis = None
+        if options.get("analytics"):
+            analisis = analyze_records(
+                circuito.nombre, circuito.origen, circuito.registros()
+            )
+        with open_sink(out_svg) as sink:
+            xml2altimetria.write_altimetry_svg(
+                nombre,
+                puntos,
+                sink,
+                options.get("tolerance_px"),
+                analisis,
+                options.get("svg_digits", PIXEL_DIGITS),
+                sectores,
+            )
+        tiempos["svg"] = time.perf_counter() - inicio
+
+    if out_html in pendientes:
+        inicio = time.perf_counter()
+        xml2html.write_html_pages(
+            xml2html.circuit_info(circuito, sectores),
+            out_html,
+            options.get("page_size", xml2html.DEFAULT_PAGE_SIZE),
+            options.get("gallery_page_size", xml2html.DEFAULT_GALLERY_PAGE_SIZE),
+            xml2html.image_dirs(in_xml, out_html),
+            minify,
+            precompress,
+            open_sink,
+        )
+        tiempos["html"] = time.perf_counter() - inicio
+
+    return tiempos
+
+
+def build_circuit(in_xml, out_kml, out_svg, out_html, cache=None, options=None):
+    """Genera KML, SVG de altimetría y HTML a partir de un único parseo del XML.
+
+    Con una BuildCache sólo se regeneran las salidas cuya clave (hash del XML,
+    versión del generador y opciones) ha cambiado; si todas están al día no se
+    llega a parsear el XML. No imprime nada: devuelve los tiempos (en segundos)
+    de cada etapa, con las salidas omitidas en "cached", y lanza ValueError si
+    el XML no contiene coordenadas.
+    """
+    options = options or {}
+    tiempos = {"parse": 0.0, "kml": 0.0, "svg": 0.0, "html": 0.0, "cached": 0}
+
+    keys = None
+    if cache is not None:
+        keys = output_keys(in_xml, out_kml, out_svg, out_html, options)
+        pendientes = [o for o, key in keys.items() if not cache.is_fresh(o, key)]
+        tiempos["cached"] = len(keys) - len(pendientes)
+        if not pendientes:
+            return tiempos
+    else:
+        pendientes = [out_kml, out_svg, out_html]
+
+    inicio = time.perf_counter()
+    circuito = parse_circuit(in_xml)
+    tiempos["parse"] = time.perf_counter() - inicio
+
+    if not circuito.coordenadas():
+        raise ValueError(
+            "No se han podido extraer coordenadas del XML. Comprueba los nombres y namespaces."
+        )
+
+    tiempos.update(
+        write_outputs(circuito, in_xml, pendientes, out_kml, out_svg, out_html, options)
+    )
+
+    if cache is not None:
+        for output in pendientes:
+            cache.update(output, keys[output])
+
+    return tiempos
+
+
+def generate_all(in_xml, out_kml, out_svg, out_html, cache=None, options=None):
+    """Genera las tres salidas de un circuito e informa de los ficheros escritos"""
+    try:
+        tiempos = build_circuit(
+            in_xml, out_kml, out_svg, out_html, cache=cache, options=options
+        )
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+    if tiempos["cached"] == 3:
+        print("Salidas al día: el XML no ha cambiado desde el último build")
+        return
+
+    print(f"Generado {out_kml}")
+    print(f"Archivo SVG generado: {out_svg}")
+    print(f"Archivo HTML generado: {out_html}")
+
+
+def main(argv):
+    # --no-cache fuerza la regeneración; --timestamp añade la fecha al KML;
+    # --watch regenera las salidas afectadas cada vez que cambia el XML;
+    # --simplify-m=METROS y --simplify-px=PX simplifican el KML y el perfil SVG;
+    # --analytics anota KML y perfil con la analítica geodésica de los tramos;
+    # --page-size=N y --gallery-page-size=N paginan clasificación y galerías;
+    # --minify y --precompress preparan las salidas para servirlas; --kmz
+    # escribe el KML comprimido (circuito.kmz); --kml-precision=N y
+    # --svg-precision=N fijan los decimales de las coordenadas ("full" = completas);
+    # --sectors divide KML y perfil por sectores y añade su tabla al HTML
+    no_cache, argv = pop_flag(argv, "--no-cache")
+    watch_mode, argv = pop_flag(argv, "--watch")
+    kmz, argv = pop_flag(argv, "--kmz")
+    options = {}
+    options["timestamp"], argv = pop_flag(argv, "--timestamp")
+    options["tolerance_m"], argv = pop_option(argv, "--simplify-m", type=float)
+    options["tolerance_px"], argv = pop_option(argv, "--simplify-px", type=float)
+    options["analytics"], argv = pop_flag(argv, "--analytics")
+    options["minify"], argv = pop_flag(argv, "--minify")
+    options["precompress"], argv = pop_flag(argv, "--precompress")
+    options["sectors"], argv = pop_flag(argv, "--sectors")
+    options["kml_digits"], argv = pop_option(
+        argv, "--kml-precision", DEGREE_DIGITS, parse_digits
+    )
+    options["svg_digits"], argv = pop_option(
+        argv, "--svg-precision", PIXEL_DIGITS, parse_digits
+    )
+    options["page_size"], argv = pop_option(
+        argv, "--page-size", xml2html.DEFAULT_PAGE_SIZE, int
+    )
+    options["gallery_page_size"], argv = pop_option(
+        argv, "--gallery-page-size", xml2html.DEFAULT_GALLERY_PAGE_SIZE, int
+    )
+
+    reject_unknown_options(argv, "[circuito.xml] [directorio]")
+
+    if len(argv) < 2:
+        in_xml = "circuitoEsquema.xml"
+        out_dir = "."
+    elif len(argv) == 2:
+        in_xml = argv[1]
+        out_dir = "."
+    else:
+        in_xml = argv[1]
+        out_dir = argv[2]
+
+    out_kml = os.path.join(out_dir, "circuito.kmz" if kmz else "circuito.kml")
+    out_svg = os.path.join(out_dir, "altimetria.svg")
+    out_html = os.path.join(out_dir, "circuito.html")
+
+    if watch_mode:
+        watch(
+            in_xml,
+            out_kml,
+            out_svg,
+            out_html,
+            lambda circuito, pendientes: write_outputs(
+                circuito, in_xml, pendientes, out_kml, out_svg, out_html, options
+            ),
+            sectors=options["sectors"],
+        )
+        return
+
+    cache = None if no_cache else BuildCache.load(os.path.join(out_dir, CACHE_FILENAME))
+
+    try:
+        generate_all(
+            in_xml,
+            out_kml,
+            out_svg,
+            out_html,
+            cache=cache,
+            options=options,
+        )
+    except FileNotFoundError:
+        print(f"Error: No se encuentra el archivo {in_xml}")
+        sys.exit(1)
+    except ET.ParseError as e:
+        print(f"Error al parsear XML: {e}")
+        sys.exit(1)
+
+    if cache is not None:
+        cache.save()
+
+
+if __name__ == "__main__":
+    main(sys.argv)
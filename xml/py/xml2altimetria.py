@@ -1,14 +1,56 @@
+import itertools
 import sys
 import xml.etree.ElementTree as ET
 
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: sin él se usa Python puro
+    np = None
+
+from cli import pop_flag, pop_option, reject_unknown_options
+from output import message_stream, open_artifact, open_output
+from number_format import (
+    PIXEL_DIGITS,
+    fixed_formatter,
+    pair_template,
+    parse_digits,
+)
+from profiling import configure, profiler
+from sector_index import SectorIndex, sector_color
+from simplify import simplify_points
+from track_analytics import analyze_columns, analyze_records, sector_summary
+from tramo_cache import load_tramos
+
+# Versión del formato generado; forma parte de la clave de la caché de builds
+VERSION = "3"
+
+# Número de puntos de polilínea que se formatean en cada escritura
+POLYLINE_BLOCK = 1024
+
 
 class Svg:
-    """Clase para generar archivos SVG con perfiles altimétricos"""
+    """Clase para generar archivos SVG con perfiles altimétricos.
 
-    def __init__(self, width=1200, height=600):
+    Si se indica un sink (objeto tipo fichero) los fragmentos se escriben en él
+    según se generan; si no, se acumulan en svg_content hasta llamar a save().
+    Las coordenadas se escriben con digits decimales (None = valor completo).
+    """
+
+    def __init__(self, width=1200, height=600, sink=None, digits=PIXEL_DIGITS):
         self.width = width
         self.height = height
+        self.sink = sink
         self.svg_content = []
+        self.digits = digits
+        self._px = fixed_formatter(digits)
+        self._pair = pair_template(digits)
+
+    def write(self, fragment):
+        """Emite un fragmento SVG al sink o al buffer interno"""
+        if self.sink is not None:
+            self.sink.write(fragment)
+        else:
+            self.svg_content.append(fragment)
 
     def write_header(self):
         """Escribe el encabezado del archivo SVG"""
@@ -32,143 +74,294 @@ class Svg:
   <!-- Fondo blanco -->
   <rect width="{self.width}" height="{self.height}" fill="white"/>
 '''
-        self.svg_content.append(header)
-
-    def add_polyline(self, points, style_class="profile"):
-        """Añade una polilínea al SVG"""
-        points_str = " ".join([f"{x},{y}" for x, y in points])
-        polyline = f'  <polyline points="{points_str}" class="{style_class}"/>\n'
-        self.svg_content.append(polyline)
+        self.write(header)
+
+    def add_circle(self, cx, cy, r, fill):
+        """Añade un círculo al SVG"""
+        px = self._px
+        self.write(f'  <circle cx="{px(cx)}" cy="{px(cy)}" r="{r}" fill="{fill}"/>\n')
+
+    def add_polyline(self, points, style_class="profile", closing=()):
+        """Añade una polilínea al SVG, escribiendo los puntos por bloques.
+
+        points es un iterable de pares (x, y) o un array NumPy de forma
+        (n, 2); de éste cada bloque se convierte a texto de una vez.
+        closing son pares que se añaden tras points (las esquinas que
+        cierran el área del perfil) sin tener que concatenarlos al array.
+        """
+        self.write('  <polyline points="')
+        if np is not None and isinstance(points, np.ndarray):
+            bloques = (
+                points[i : i + POLYLINE_BLOCK].tolist()
+                for i in range(0, len(points), POLYLINE_BLOCK)
+            )
+        else:
+            points = iter(points)
+            bloques = iter(lambda: list(itertools.islice(points, POLYLINE_BLOCK)), [])
+        if closing:
+            bloques = itertools.chain(bloques, [list(closing)])
+        separator = ""
+        pair = self._pair
+        for block in bloques:
+            if pair is None:
+                texto = " ".join([f"{x},{y}" for x, y in block])
+            else:
+                # Una sola operación de formato por bloque
+                texto = " ".join([pair] * len(block)) % tuple(
+                    itertools.chain.from_iterable(block)
+                )
+            self.write(separator + texto)
+            separator = " "
+        self.write(f'" class="{style_class}"/>\n')
+
+    def add_rect(self, x, y, width, height, fill, opacity=0.15):
+        """Añade un rectángulo translúcido al SVG"""
+        px = self._px
+        self.write(
+            f'  <rect x="{px(x)}" y="{px(y)}" width="{px(width)}" '
+            f'height="{px(height)}" fill="{fill}" fill-opacity="{opacity}"/>\n'
+        )
 
     def add_line(self, x1, y1, x2, y2, style_class="grid"):
         """Añade una línea al SVG"""
+        px = self._px
         line = (
-            f'  <line x1="{x1}" y1="{y1}" x2="{x2}" y2="{y2}" class="{style_class}"/>\n'
+            f'  <line x1="{px(x1)}" y1="{px(y1)}" x2="{px(x2)}" y2="{px(y2)}" '
+            f'class="{style_class}"/>\n'
         )
-        self.svg_content.append(line)
+        self.write(line)
 
     def add_text(self, x, y, text, style_class="text", text_anchor=None, rotate=None):
         """Añade texto al SVG"""
         anchor_attr = f' text-anchor="{text_anchor}"' if text_anchor else ""
         rotate_attr = f' transform="rotate({rotate})"' if rotate else ""
-        text_elem = f'  <text x="{x}" y="{y}" class="{style_class}"{anchor_attr}{rotate_attr}>{text}</text>\n'
-        self.svg_content.append(text_elem)
+        px = self._px
+        text_elem = f'  <text x="{px(x)}" y="{px(y)}" class="{style_class}"{anchor_attr}{rotate_attr}>{text}</text>\n'
+        self.write(text_elem)
 
     def write_footer(self):
         """Escribe el cierre del archivo SVG"""
-        self.svg_content.append("</svg>\n")
+        self.write("</svg>\n")
 
     def save(self, filename):
-        """Guarda el contenido SVG en un archivo"""
-        with open(filename, "w", encoding="utf-8") as f:
+        """Guarda el contenido SVG acumulado en un archivo (o en stdout con "-")"""
+        with open_output(filename) as f:
             f.writelines(self.svg_content)
 
 
-def extract_circuit_data(xml_file):
-    """Extrae datos de distancia y altitud del archivo XML usando XPath"""
-    tree = ET.parse(xml_file)
-    root = tree.getroot()
+def cumulative_distances(incrementos):
+    """Distancia acumulada a partir de las distancias de cada tramo.
+
+    Con NumPy devuelve un array; sin él, una lista.
+    """
+    if np is not None:
+        return np.cumsum(np.asarray(incrementos, dtype=float))
+    return list(itertools.accumulate(incrementos))
 
-    # Detectar namespace
-    if root.tag.startswith("{"):
-        doc_ns = root.tag[1 : root.tag.index("}")]
-    else:
-        doc_ns = "http://www.uniovi.es/circuito"
 
-    nsmap = {"c": doc_ns}
+def profile_pairs(puntos):
+    """Los puntos del perfil como lista de pares, sean un array NumPy o una lista"""
+    if np is not None and isinstance(puntos, np.ndarray):
+        return puntos.tolist()
+    return puntos
 
-    # Extraer nombre del circuito
-    nombre_elem = root.find(".//c:nombre", namespaces=nsmap)
-    nombre = nombre_elem.text.strip() if nombre_elem is not None else "Circuito"
 
-    # Extraer origen
-    origen = root.find(".//c:geografia//c:origen", namespaces=nsmap)
-    distancia_acum = 0
-    puntos = []
+def profile_from_records(nombre, origen, registros):
+    """Obtiene los puntos (distancia acumulada, altitud) consumiendo registros.
+
+    Acepta cualquier iterable de registros (distancia, lon, lat, alt, sector),
+    incluido el generador en streaming de circuit_model.iter_tramos. Con
+    NumPy los puntos son un array de forma (n, 2) (columnas distancia y
+    altitud); sin él, una lista de pares.
+    """
+    incrementos = []
+    altitudes = []
 
     if origen is not None:
-        alt_elem = origen.find("c:altitud", namespaces=nsmap)
-        if alt_elem is not None:
-            altitud = float(alt_elem.text.strip())
-            puntos.append((distancia_acum, altitud))
+        incrementos.append(0)
+        altitudes.append(origen.altitud)
 
-    # Extraer tramos usando XPath
-    tramos = root.findall(".//c:tramos//c:tramo", namespaces=nsmap)
+    for distancia, _lon, _lat, altitud, _sector in registros:
+        incrementos.append(distancia if distancia is not None else 0)
+        altitudes.append(altitud)
 
-    for tramo in tramos:
-        # Extraer distancia del tramo
-        dist_elem = tramo.find(".//c:distancia", namespaces=nsmap)
-        if dist_elem is not None:
-            distancia = float(dist_elem.text.strip())
-            distancia_acum += distancia
+    distancias = cumulative_distances(incrementos)
+    if np is not None:
+        return nombre, np.column_stack((distancias, np.asarray(altitudes, dtype=float)))
+    return nombre, list(zip(distancias, altitudes))
 
-        # Extraer altitud del punto final
-        punto_final = tramo.find(".//c:puntoFinal", namespaces=nsmap)
-        if punto_final is not None:
-            alt_elem = punto_final.find("c:altitud", namespaces=nsmap)
-            if alt_elem is not None:
-                altitud = float(alt_elem.text.strip())
-                puntos.append((distancia_acum, altitud))
 
-    return nombre, puntos
+def circuit_profile(circuito):
+    """Obtiene los puntos (distancia acumulada, altitud) del modelo del circuito"""
+    return profile_from_records(circuito.nombre, circuito.origen, circuito.registros())
 
 
-def normalize_points(puntos, width, height, margin=80):
-    """Normaliza los puntos al espacio SVG con márgenes"""
-    if not puntos:
-        return []
+def profile_from_columns(tramos):
+    """Como profile_from_records, pero a partir de las columnas de tramo_cache.
+
+    Con NumPy las columnas se leen sin copiarlas (np.frombuffer sobre el
+    fichero mapeado en memoria); los tramos leídos en streaming (TramoStream)
+    se consumen registro a registro.
+    """
+    if np is None or not tramos.columnar:
+        return profile_from_records(tramos.nombre, tramos.origen, tramos.registros())
 
-    # Extraer distancias y altitudes
+    incrementos = np.nan_to_num(np.frombuffer(tramos.distancia), nan=0.0)
+    altitudes = np.frombuffer(tramos.altitud)
+    if tramos.origen is not None:
+        incrementos = np.concatenate(([0.0], incrementos))
+        altitudes = np.concatenate(([tramos.origen.altitud], altitudes))
+    return tramos.nombre, np.column_stack((np.cumsum(incrementos), altitudes))
+
+
+def extract_circuit_data(xml_file, use_sidecar=True):
+    """Extrae datos de distancia y altitud del archivo XML.
+
+    Los tramos se leen del fichero binario junto al XML si está al día; si no,
+    se parsean en streaming y se guarda para las siguientes ejecuciones.
+    """
+    return profile_from_columns(load_tramos(xml_file, use_sidecar))
+
+
+def _compute_profile_numpy(puntos, width, height, margin):
+    """compute_profile vectorizado: una pasada por columna con arrays NumPy.
+
+    Los puntos normalizados se devuelven como array (n, 2): sólo se
+    convierten a texto al escribir la polilínea.
+    """
+    datos = np.asarray(puntos, dtype=float)
+    distancias = datos[:, 0]
+    altitudes = datos[:, 1]
+
+    idx_min = int(np.argmin(altitudes))
+    idx_max = int(np.argmax(altitudes))
+    min_dist = float(distancias.min())
+    max_dist = float(distancias.max())
+    min_alt = float(altitudes[idx_min])
+    max_alt = float(altitudes[idx_max])
+
+    graph_width = width - 2 * margin
+    graph_height = height - 2 * margin
+    ancho_dist = (max_dist - min_dist) or 1
+    ancho_alt = (max_alt - min_alt) or 1
+    xs = margin + (distancias - min_dist) / ancho_dist * graph_width
+    ys = height - margin - (altitudes - min_alt) / ancho_alt * graph_height
+
+    return {
+        "puntos": np.column_stack((xs, ys)),
+        "rangos": (min_dist, max_dist, min_alt, max_alt),
+        "idx_min": idx_min,
+        "idx_max": idx_max,
+        "desnivel": max_alt - min_alt,
+    }
+
+
+def _compute_profile_python(puntos, width, height, margin):
+    """compute_profile en Python puro (sin NumPy)"""
     distancias = [p[0] for p in puntos]
     altitudes = [p[1] for p in puntos]
 
-    # Calcular rangos
+    # min/max/index sobre listas se ejecutan en C: más rápido que un bucle único
     min_dist = min(distancias)
     max_dist = max(distancias)
     min_alt = min(altitudes)
     max_alt = max(altitudes)
+    idx_min = altitudes.index(min_alt)
+    idx_max = altitudes.index(max_alt)
 
     # Área disponible para el gráfico
     graph_width = width - 2 * margin
     graph_height = height - 2 * margin
 
+    # Un perfil de un solo punto o totalmente llano tiene rango 0: se usa 1
+    # para no dividir por cero (el perfil queda en el borde del gráfico)
+    ancho_dist = (max_dist - min_dist) or 1
+    ancho_alt = (max_alt - min_alt) or 1
+
     # Normalizar puntos (invertir Y porque en SVG Y crece hacia abajo)
     normalized = []
     for dist, alt in puntos:
-        x = margin + (dist - min_dist) / (max_dist - min_dist) * graph_width
-        y = height - margin - (alt - min_alt) / (max_alt - min_alt) * graph_height
+        x = margin + (dist - min_dist) / ancho_dist * graph_width
+        y = height - margin - (alt - min_alt) / ancho_alt * graph_height
         normalized.append((x, y))
 
-    return normalized, (min_dist, max_dist, min_alt, max_alt)
+    return {
+        "puntos": normalized,
+        "rangos": (min_dist, max_dist, min_alt, max_alt),
+        "idx_min": idx_min,
+        "idx_max": idx_max,
+        "desnivel": max_alt - min_alt,
+    }
 
 
-def create_altimetry_svg(xml_file, svg_file):
-    """Genera el archivo SVG de altimetría a partir del XML"""
+def compute_profile(puntos, width, height, margin=80):
+    """Normaliza el perfil al espacio SVG y calcula sus estadísticas.
 
-    # Extraer datos del circuito
-    try:
-        nombre, puntos = extract_circuit_data(xml_file)
-    except FileNotFoundError:
-        print(f"Error: No se encuentra el archivo {xml_file}")
-        sys.exit(1)
-    except ET.ParseError as e:
-        print(f"Error al parsear XML: {e}")
-        sys.exit(1)
+    Devuelve un diccionario con los puntos normalizados, los rangos
+    (min_dist, max_dist, min_alt, max_alt), los índices de las altitudes
+    mínima y máxima y el desnivel. Usa NumPy si está instalado.
+    """
+    if np is not None:
+        return _compute_profile_numpy(puntos, width, height, margin)
+    return _compute_profile_python(puntos, width, height, margin)
 
-    if not puntos:
-        print("No se pudieron extraer datos de altimetría del archivo XML")
-        sys.exit(1)
 
-    print(f"Extraídos {len(puntos)} puntos del circuito")
+def normalize_points(puntos, width, height, margin=80):
+    """Normaliza los puntos al espacio SVG con márgenes"""
+    if len(puntos) == 0:
+        return []
 
+    perfil = compute_profile(puntos, width, height, margin)
+    return perfil["puntos"], perfil["rangos"]
+
+
+def sector_bands(normalized_points, sectores):
+    """Franjas (x_inicio, x_fin, sector) de cada tramo continuo de un sector.
+
+    Los puntos del perfil incluyen el origen si existe, así que el tramo
+    número k acaba en el punto k - 1 + desplazamiento y empieza en el
+    anterior. Los tramos sin sector no tienen franja.
+    """
+    desplazamiento = len(normalized_points) - sectores.num_tramos
+    bandas = []
+    for sector, primero, ultimo in sectores.runs:
+        if sector is None:
+            continue
+        inicio = max(primero - 2 + desplazamiento, 0)
+        fin = ultimo - 1 + desplazamiento
+        if fin < 0:
+            continue
+        bandas.append((normalized_points[inicio][0], normalized_points[fin][0], sector))
+    return bandas
+
+
+def write_altimetry_svg(
+    nombre,
+    puntos,
+    sink,
+    tolerance_px=None,
+    analisis=None,
+    digits=PIXEL_DIGITS,
+    sectores=None,
+):
+    """Escribe el perfil altimétrico en el sink y devuelve sus estadísticas.
+
+    Con tolerance_px la polilínea del perfil se simplifica en el espacio del
+    SVG (tolerancia en píxeles) antes de escribirse. Con analisis (de
+    track_analytics) se marca el tramo de mayor pendiente y se añade el
+    resumen de cada sector. Con sectores (un SectorIndex de los mismos
+    tramos) el fondo del gráfico se colorea por sectores. Las coordenadas se
+    escriben con digits decimales.
+    """
     # Crear objeto SVG
-    svg = Svg(width=1200, height=600)
+    svg = Svg(width=1200, height=600, sink=sink, digits=digits)
     svg.write_header()
 
-    # Normalizar puntos
-    normalized_points, (min_dist, max_dist, min_alt, max_alt) = normalize_points(
-        puntos, svg.width, svg.height
-    )
+    # Normalizar puntos y calcular estadísticas en una sola pasada
+    with profiler.stage("normalize_points"):
+        perfil = compute_profile(puntos, svg.width, svg.height)
+    normalized_points = perfil["puntos"]
+    min_dist, max_dist, min_alt, max_alt = perfil["rangos"]
 
     margin = 80
     graph_height = svg.height - 2 * margin
@@ -233,60 +426,193 @@ def create_altimetry_svg(xml_file, svg_file):
         rotate=f"-90 20 {svg.height // 2}",
     )
 
+    # Franjas de color de los sectores, bajo el perfil
+    if sectores is not None:
+        for x_inicio, x_fin, sector in sector_bands(normalized_points, sectores):
+            svg.add_rect(
+                x_inicio, margin, x_fin - x_inicio, graph_height, sector_color(sector)
+            )
+            svg.add_text(
+                (x_inicio + x_fin) / 2,
+                margin + 14,
+                f"S{sector}",
+                "label",
+                text_anchor="middle",
+            )
+
     # Crear polilínea cerrada para efecto de relleno
-    closed_points = normalized_points.copy()
+    eliminados = 0
+    profile_points = normalized_points
+    if tolerance_px:
+        profile_points, eliminados = simplify_points(normalized_points, tolerance_px)
     # Cerrar con el eje inferior
-    closed_points.append((svg.width - margin, svg.height - margin))
-    closed_points.append((margin, svg.height - margin))
+    cierre = [(svg.width - margin, svg.height - margin), (margin, svg.height - margin)]
 
     # Dibujar perfil altimétrico
-    svg.add_polyline(closed_points, "profile")
+    svg.add_polyline(profile_points, "profile", cierre)
 
     # Añadir puntos destacados (opcional)
-    max_alt_point = max(puntos, key=lambda p: p[1])
-    min_alt_point = min(puntos, key=lambda p: p[1])
-
-    idx_max = puntos.index(max_alt_point)
-    idx_min = puntos.index(min_alt_point)
-
-    x_max, y_max = normalized_points[idx_max]
-    x_min, y_min = normalized_points[idx_min]
+    x_max, y_max = normalized_points[perfil["idx_max"]]
+    x_min, y_min = normalized_points[perfil["idx_min"]]
 
     # Marcar punto más alto
-    svg.svg_content.append(f'  <circle cx="{x_max}" cy="{y_max}" r="5" fill="red"/>\n')
+    svg.add_circle(x_max, y_max, 5, "red")
     svg.add_text(
-        x_max, y_max - 10, f"Máx: {max_alt_point[1]:.1f}m", "text", text_anchor="middle"
+        x_max, y_max - 10, f"Máx: {max_alt:.1f}m", "text", text_anchor="middle"
     )
 
     # Marcar punto más bajo
-    svg.svg_content.append(f'  <circle cx="{x_min}" cy="{y_min}" r="5" fill="blue"/>\n')
+    svg.add_circle(x_min, y_min, 5, "blue")
     svg.add_text(
-        x_min, y_min + 20, f"Mín: {min_alt_point[1]:.1f}m", "text", text_anchor="middle"
+        x_min, y_min + 20, f"Mín: {min_alt:.1f}m", "text", text_anchor="middle"
     )
 
+    if analisis is not None:
+        # Los puntos del perfil incluyen el origen si existe: desplazamiento
+        # entre el índice de cada tramo y el de su punto
+        desplazamiento = len(normalized_points) - len(analisis["pendiente"])
+        idx = analisis["idx_pendiente_max"]
+        if idx is not None and idx + desplazamiento >= 0:
+            x_pend, y_pend = normalized_points[idx + desplazamiento]
+            svg.add_circle(x_pend, y_pend, 4, "orange")
+            svg.add_text(
+                x_pend,
+                y_pend - 10,
+                f"Pendiente máx: {analisis['pendiente'][idx]:.1f}%",
+                "label",
+                text_anchor="middle",
+            )
+        if analisis["sectores"]:
+            resumen = " · ".join(
+                sector_summary(sector, datos)
+                for sector, datos in analisis["sectores"].items()
+            )
+            svg.add_text(svg.width // 2, 62, resumen, "label", text_anchor="middle")
+
     # Información adicional
-    desnivel = max_alt_point[1] - min_alt_point[1]
+    desnivel = perfil["desnivel"]
     info_text = f"Distancia total: {max_dist:.0f}m | Desnivel: {desnivel:.1f}m"
     svg.add_text(
         svg.width // 2, svg.height - 50, info_text, "label", text_anchor="middle"
     )
 
     svg.write_footer()
-    svg.save(svg_file)
 
-    print(f"Archivo SVG generado: {svg_file}")
-    print(f"Distancia total: {max_dist:.0f} metros")
-    print(f"Altitud mínima: {min_alt_point[1]:.2f} metros")
-    print(f"Altitud máxima: {max_alt_point[1]:.2f} metros")
-    print(f"Desnivel: {desnivel:.2f} metros")
-    print("\nPara crear altimetria.pdf:")
-    print("1. Abre altimetria.svg en el navegador Opera (o Chrome/Firefox)")
-    print("2. Ctrl+P (Imprimir)")
-    print("3. Selecciona 'Guardar como PDF'")
-    print("4. Nombra el archivo como 'altimetria.pdf'")
+    return {
+        "distancia": max_dist,
+        "altitud_min": min_alt,
+        "altitud_max": max_alt,
+        "desnivel": desnivel,
+        "puntos_eliminados": eliminados,
+    }
+
+
+def create_altimetry_svg(
+    xml_file,
+    svg_file,
+    circuito=None,
+    tolerance_px=None,
+    use_sidecar=True,
+    analytics=False,
+    minify=False,
+    precompress=False,
+    digits=PIXEL_DIGITS,
+    sectors=False,
+):
+    """Genera el archivo SVG de altimetría a partir del XML (o del modelo ya parseado).
+
+    svg_file puede ser "-" para escribir en la salida estándar; en ese caso los
+    mensajes informativos se envían a stderr. Con analytics el perfil se anota
+    con la analítica geodésica de los tramos; minify y precompress minifican
+    el SVG y escriben sus copias .gz/.br (ver output.open_artifact); digits
+    son los decimales de las coordenadas en píxeles; con sectors se colorea
+    el fondo del perfil por sectores.
+    """
+    out = message_stream(svg_file)
+
+    # Extraer datos del circuito
+    analisis = None
+    sectores = None
+    try:
+        with profiler.stage("extract_circuit_data"):
+            if circuito is None:
+                tramos = load_tramos(xml_file, use_sidecar)
+                nombre, puntos = profile_from_columns(tramos)
+            else:
+                nombre, puntos = circuit_profile(circuito)
+        if analytics:
+            with profiler.stage("analytics"):
+                if circuito is None:
+                    analisis = analyze_columns(tramos)
+                else:
+                    analisis = analyze_records(
+                        circuito.nombre, circuito.origen, circuito.registros()
+                    )
+        if sectors:
+            with profiler.stage("sectors"):
+                if circuito is None:
+                    sectores = SectorIndex.from_tramos(tramos, analisis)
+                else:
+                    sectores = SectorIndex.from_records(
+                        circuito.origen, circuito.registros(), analisis
+                    )
+    except FileNotFoundError:
+        print(f"Error: No se encuentra el archivo {xml_file}", file=sys.stderr)
+        sys.exit(1)
+    except ET.ParseError as e:
+        print(f"Error al parsear XML: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if len(puntos) == 0:
+        print(
+            "No se pudieron extraer datos de altimetría del archivo XML", file=sys.stderr
+        )
+        sys.exit(1)
+
+    print(f"Extraídos {len(puntos)} puntos del circuito", file=out)
+
+    # "save" mide la apertura y el volcado final del fichero; "render" el
+    # formateo de los fragmentos (escritos en el buffer de salida)
+    with profiler.stage("save"), open_artifact(svg_file, minify, precompress) as sink:
+        with profiler.stage("render"):
+            stats = write_altimetry_svg(
+                nombre, puntos, sink, tolerance_px, analisis, digits, sectores
+            )
+
+    print(f"Archivo SVG generado: {svg_file}", file=out)
+    if tolerance_px:
+        print(
+            f"Simplificación: {stats['puntos_eliminados']} puntos eliminados", file=out
+        )
+    print(f"Distancia total: {stats['distancia']:.0f} metros", file=out)
+    print(f"Altitud mínima: {stats['altitud_min']:.2f} metros", file=out)
+    print(f"Altitud máxima: {stats['altitud_max']:.2f} metros", file=out)
+    print(f"Desnivel: {stats['desnivel']:.2f} metros", file=out)
+    print("\nPara crear altimetria.pdf:", file=out)
+    print("1. Abre altimetria.svg en el navegador Opera (o Chrome/Firefox)", file=out)
+    print("2. Ctrl+P (Imprimir)", file=out)
+    print("3. Selecciona 'Guardar como PDF'", file=out)
+    print("4. Nombra el archivo como 'altimetria.pdf'", file=out)
 
 
 def main(argv):
+    # --profile[=FICHERO] (o XML2_PROFILE) emite un informe JSON de tiempos
+    argv = configure(argv, "xml2altimetria.py")
+    # --simplify=PX simplifica el perfil con esa tolerancia en píxeles
+    tolerance_px, argv = pop_option(argv, "--simplify", type=float)
+    # --no-sidecar ignora (y no escribe) el fichero binario de tramos
+    no_sidecar, argv = pop_flag(argv, "--no-sidecar")
+    # --analytics anota el perfil con la analítica geodésica de los tramos
+    analytics, argv = pop_flag(argv, "--analytics")
+    # --minify y --precompress preparan el SVG para servirlo
+    minify, argv = pop_flag(argv, "--minify")
+    precompress, argv = pop_flag(argv, "--precompress")
+    # --precision=N fija los decimales de las coordenadas ("full" = completas)
+    digits, argv = pop_option(argv, "--precision", PIXEL_DIGITS, parse_digits)
+    # --sectors colorea el fondo del perfil por sectores
+    sectors, argv = pop_flag(argv, "--sectors")
+    reject_unknown_options(argv, "[circuito.xml] [altimetria.svg|-]")
+
     if len(argv) < 2:
         in_xml = "circuitoEsquema.xml"
         out_svg = "altimetria.svg"
@@ -297,7 +623,18 @@ def main(argv):
         in_xml = argv[1]
         out_svg = argv[2]
 
-    create_altimetry_svg(in_xml, out_svg)
+    create_altimetry_svg(
+        in_xml,
+        out_svg,
+        tolerance_px=tolerance_px,
+        use_sidecar=not no_sidecar,
+        analytics=analytics,
+        minify=minify,
+        precompress=precompress,
+        digits=digits,
+        sectors=sectors,
+    )
+    profiler.finish()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,213 @@
+import bisect
+import json
+import math
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+from cli import pop_option, reject_unknown_options
+from xml2altimetria import Svg, extract_circuit_data, profile_pairs
+
+# Puntos máximos por tesela; una tesela con menos puntos reales no se subdivide
+DEFAULT_TILE_POINTS = 1024
+# Nivel de zoom máximo (el nivel z tiene 2**z teselas)
+DEFAULT_MAX_LEVEL = 8
+MANIFEST_FILENAME = "altimetria_lod.json"
+
+
+def minmax_decimate(puntos, max_points):
+    """Reduce puntos a unos max_points conservando el mínimo y el máximo de cada grupo.
+
+    Los puntos se agrupan en bloques consecutivos y de cada bloque se emiten
+    su punto más bajo y su punto más alto en el orden en que aparecen, de modo
+    que los picos del perfil se conservan a cualquier nivel de detalle.
+    """
+    if len(puntos) <= max_points:
+        return list(puntos)
+
+    bloque = math.ceil(len(puntos) / max(1, max_points // 2))
+    decimados = []
+    for inicio in range(0, len(puntos), bloque):
+        grupo = puntos[inicio : inicio + bloque]
+        bajo = min(range(len(grupo)), key=lambda i: grupo[i][1])
+        alto = max(range(len(grupo)), key=lambda i: grupo[i][1])
+        for i in sorted({bajo, alto}):
+            decimados.append(grupo[i])
+    return decimados
+
+
+def _normalize(puntos, rango_dist, rango_alt, width, height, margin):
+    """Normaliza a coordenadas SVG con rangos fijos (comunes a todas las teselas)"""
+    min_dist, max_dist = rango_dist
+    min_alt, max_alt = rango_alt
+    ancho_dist = (max_dist - min_dist) or 1
+    ancho_alt = (max_alt - min_alt) or 1
+    graph_width = width - 2 * margin
+    graph_height = height - 2 * margin
+    return [
+        (
+            margin + (dist - min_dist) / ancho_dist * graph_width,
+            height - margin - (alt - min_alt) / ancho_alt * graph_height,
+        )
+        for dist, alt in puntos
+    ]
+
+
+def write_tile_svg(puntos, rango_dist, rango_alt, sink, width=600, height=300, margin=40):
+    """Escribe una tesela del perfil: el tramo de distancias rango_dist"""
+    svg = Svg(width=width, height=height, sink=sink)
+    svg.write_header()
+
+    normalized = _normalize(puntos, rango_dist, rango_alt, width, height, margin)
+    normalized.append((width - margin, height - margin))
+    normalized.append((margin, height - margin))
+    svg.add_polyline(normalized, "profile")
+
+    # Ejes y etiquetas con el rango de la tesela
+    svg.add_line(margin, height - margin, width - margin, height - margin, "axis")
+    svg.add_line(margin, margin, margin, height - margin, "axis")
+    svg.add_text(margin, height - margin + 15, f"{rango_dist[0]:.0f}m", "label")
+    svg.add_text(
+        width - margin,
+        height - margin + 15,
+        f"{rango_dist[1]:.0f}m",
+        "label",
+        text_anchor="end",
+    )
+    svg.add_text(margin - 5, margin, f"{rango_alt[1]:.1f}m", "label", text_anchor="end")
+    svg.add_text(
+        margin - 5, height - margin, f"{rango_alt[0]:.1f}m", "label", text_anchor="end"
+    )
+    svg.write_footer()
+
+
+def _interpolate(puntos, distancias, distancia):
+    """Punto del perfil en distancia, interpolando linealmente entre sus vecinos"""
+    i = bisect.bisect_left(distancias, distancia)
+    if i == 0:
+        return (distancia, puntos[0][1])
+    if i == len(puntos):
+        return (distancia, puntos[-1][1])
+    (d0, a0), (d1, a1) = puntos[i - 1], puntos[i]
+    if d1 == d0:
+        return (distancia, a1)
+    return (distancia, a0 + (a1 - a0) * (distancia - d0) / (d1 - d0))
+
+
+def build_pyramid(puntos, tile_points=DEFAULT_TILE_POINTS, max_level=DEFAULT_MAX_LEVEL):
+    """Calcula los niveles de detalle del perfil.
+
+    El nivel z divide la distancia total en 2**z teselas iguales, cada una
+    decimada a tile_points como máximo (incluidos sus extremos, interpolados
+    en los límites de la tesela). Se añaden niveles hasta que todas las
+    teselas caben sin decimar o se alcanza max_level. Genera, nivel a nivel,
+    la lista de teselas (desde, hasta, puntos).
+    """
+    distancias = [p[0] for p in puntos]
+    min_dist, max_dist = distancias[0], distancias[-1]
+
+    for z in range(max_level + 1):
+        num_tiles = 2**z
+        paso = (max_dist - min_dist) / num_tiles
+        teselas = []
+        completo = True
+        for i in range(num_tiles):
+            desde = min_dist + i * paso
+            hasta = max_dist if i == num_tiles - 1 else desde + paso
+            # Los extremos se interpolan en desde y hasta: el trazado es
+            # continuo entre teselas y no se sale del área del gráfico
+            inicio = bisect.bisect_right(distancias, desde)
+            fin = bisect.bisect_left(distancias, hasta)
+            interiores = puntos[inicio:fin]
+            if len(interiores) + 2 > tile_points:
+                completo = False
+            tramo = [
+                _interpolate(puntos, distancias, desde),
+                *minmax_decimate(interiores, max(1, tile_points - 2)),
+                _interpolate(puntos, distancias, hasta),
+            ]
+            teselas.append((desde, hasta, tramo))
+        yield teselas
+        if completo:
+            break
+
+
+def create_altimetry_tiles(
+    xml_file, out_dir, tile_points=DEFAULT_TILE_POINTS, max_level=DEFAULT_MAX_LEVEL
+):
+    """Genera las teselas SVG de todos los niveles y el manifiesto JSON"""
+    nombre, puntos = extract_circuit_data(xml_file)
+    puntos = profile_pairs(puntos)
+    if not puntos:
+        raise ValueError("No se pudieron extraer datos de altimetría del archivo XML")
+
+    altitudes = [p[1] for p in puntos]
+    rango_alt = (min(altitudes), max(altitudes))
+    os.makedirs(out_dir, exist_ok=True)
+
+    manifest = {
+        "circuito": nombre,
+        "distancia": [puntos[0][0], puntos[-1][0]],
+        "altitud": list(rango_alt),
+        "puntos": len(puntos),
+        "tile_points": tile_points,
+        "niveles": [],
+    }
+
+    for z, teselas in enumerate(build_pyramid(puntos, tile_points, max_level)):
+        nivel = {"nivel": z, "teselas": []}
+        for i, (desde, hasta, tramo) in enumerate(teselas):
+            archivo = f"altimetria_z{z}_{i}.svg"
+            with open(os.path.join(out_dir, archivo), "w", encoding="utf-8") as f:
+                write_tile_svg(tramo, (desde, hasta), rango_alt, f)
+            nivel["teselas"].append(
+                {"archivo": archivo, "desde": desde, "hasta": hasta, "puntos": len(tramo)}
+            )
+        manifest["niveles"].append(nivel)
+
+    with open(os.path.join(out_dir, MANIFEST_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+    return manifest
+
+
+def main(argv):
+    # --tile-points=N puntos por tesela; --max-level=N nivel de zoom máximo
+    tile_points, argv = pop_option(
+        argv, "--tile-points", DEFAULT_TILE_POINTS, type=int
+    )
+    max_level, argv = pop_option(argv, "--max-level", DEFAULT_MAX_LEVEL, type=int)
+    reject_unknown_options(argv, "[circuito.xml] [directorio]")
+
+    if len(argv) < 2:
+        in_xml = "circuitoEsquema.xml"
+        out_dir = "altimetria_lod"
+    elif len(argv) == 2:
+        in_xml = argv[1]
+        out_dir = "altimetria_lod"
+    else:
+        in_xml = argv[1]
+        out_dir = argv[2]
+
+    try:
+        manifest = create_altimetry_tiles(in_xml, out_dir, tile_points, max_level)
+    except FileNotFoundError:
+        print(f"Error: No se encuentra el archivo {in_xml}")
+        sys.exit(1)
+    except ET.ParseError as e:
+        print(f"Error al parsear XML: {e}")
+        sys.exit(1)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+    num_teselas = sum(len(n["teselas"]) for n in manifest["niveles"])
+    print(
+        f"Generadas {num_teselas} teselas en {len(manifest['niveles'])} niveles "
+        f"({manifest['puntos']} puntos) en {out_dir}"
+    )
+    print(f"Manifiesto: {os.path.join(out_dir, MANIFEST_FILENAME)}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,261 @@
+import argparse
+import glob
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import xml2html
+from build_cache import CACHE_FILENAME, BuildCache
+from number_format import DEGREE_DIGITS, PIXEL_DIGITS, parse_digits
+from xml2all import build_circuit
+
+# Plantillas de nombre por defecto; {stem} es el nombre del XML sin extensión
+DEFAULT_KML = "{stem}.kml"
+DEFAULT_SVG = "{stem}_altimetria.svg"
+DEFAULT_HTML = "{stem}.html"
+
+
+def find_inputs(paths):
+    """Expande directorios y patrones glob a la lista ordenada de XML de circuitos"""
+    inputs = []
+    for path in paths:
+        if os.path.isdir(path):
+            inputs.extend(glob.glob(os.path.join(path, "*.xml")))
+        elif glob.has_magic(path):
+            inputs.extend(glob.glob(path))
+        else:
+            inputs.append(path)
+    # Sin duplicados y en un orden estable
+    return sorted(set(inputs))
+
+
+def output_paths(in_xml, out_dir, kml_pattern, svg_pattern, html_pattern):
+    """Calcula las rutas de salida de un circuito según las plantillas de nombre"""
+    stem = os.path.splitext(os.path.basename(in_xml))[0]
+    return tuple(
+        os.path.join(out_dir, pattern.format(stem=stem))
+        for pattern in (kml_pattern, svg_pattern, html_pattern)
+    )
+
+
+def build_one(in_xml, outputs, cache=None, options=None):
+    """Trabajo de un proceso del pool: genera las salidas de un circuito.
+
+    Recibe sólo las entradas de caché de sus salidas y devuelve la caché
+    actualizada para que el proceso principal la fusione y la guarde.
+    """
+    inicio = time.perf_counter()
+    try:
+        tiempos = build_circuit(in_xml, *outputs, cache=cache, options=options)
+        error = None
+    except (OSError, ET.ParseError, ValueError) as e:
+        tiempos = {}
+        error = str(e)
+    tiempos["total"] = time.perf_counter() - inicio
+    return in_xml, tiempos, error, cache
+
+
+def print_summary(resultados, wall_time, out=sys.stdout):
+    """Imprime la tabla de tiempos por fichero (en milisegundos).
+
+    Las columnas read y write sólo aparecen si algún resultado las mide
+    (las rellena el pipeline asíncrono de xml2pipeline).
+    """
+    columnas = ("parse", "kml", "svg", "html", "total")
+    if any("read" in r[1] for r in resultados):
+        columnas = ("read", *columnas[:-1], "write", "total")
+    ancho = max([len("Archivo")] + [len(r[0]) for r in resultados])
+
+    print(
+        f"{'Archivo':<{ancho}} " + " ".join(f"{c:>8}" for c in columnas),
+        file=out,
+    )
+    for in_xml, tiempos, error in resultados:
+        if error:
+            print(f"{in_xml:<{ancho}} ERROR: {error}", file=out)
+            continue
+        celdas = " ".join(f"{tiempos[c] * 1000:8.1f}" for c in columnas)
+        cached = f"  ({tiempos['cached']} en caché)" if tiempos["cached"] else ""
+        print(f"{in_xml:<{ancho}} {celdas}{cached}", file=out)
+
+    correctos = sum(1 for r in resultados if not r[2])
+    print(
+        f"{correctos}/{len(resultados)} circuitos generados en {wall_time:.2f} s",
+        file=out,
+    )
+
+
+def build_batch(
+    inputs,
+    out_dir,
+    kml_pattern,
+    svg_pattern,
+    html_pattern,
+    jobs=None,
+    use_cache=True,
+    options=None,
+):
+    """Genera las salidas de todos los circuitos en un pool de procesos.
+
+    Con use_cache se omiten los circuitos cuyas salidas están al día según la
+    caché guardada en out_dir. Devuelve la lista de resultados
+    (in_xml, tiempos, error) en el orden de entrada.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    cache = BuildCache.load(os.path.join(out_dir, CACHE_FILENAME)) if use_cache else None
+
+    resultados = {}
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = []
+        for in_xml in inputs:
+            outputs = output_paths(
+                in_xml, out_dir, kml_pattern, svg_pattern, html_pattern
+            )
+            futures.append(
+                executor.submit(
+                    build_one,
+                    in_xml,
+                    outputs,
+                    cache.subset(outputs) if cache is not None else None,
+                    options,
+                )
+            )
+        for future in as_completed(futures):
+            in_xml, tiempos, error, worker_cache = future.result()
+            resultados[in_xml] = (in_xml, tiempos, error)
+            if worker_cache is not None:
+                cache.merge(worker_cache)
+
+    if cache is not None:
+        cache.save()
+
+    return [resultados[in_xml] for in_xml in inputs]
+
+
+def add_build_arguments(parser):
+    """Añade al parser las plantillas de nombre y las opciones de generación.
+
+    Son las comunes a xml2batch y xml2pipeline; options_from_args las
+    convierte en el diccionario de opciones de build_circuit.
+    """
+    parser.add_argument(
+        "--kml", default=DEFAULT_KML, help="plantilla del nombre KML (.kmz lo comprime)"
+    )
+    parser.add_argument("--svg", default=DEFAULT_SVG, help="plantilla del nombre SVG")
+    parser.add_argument("--html", default=DEFAULT_HTML, help="plantilla del nombre HTML")
+    parser.add_argument(
+        "--no-cache", action="store_true", help="regenera aunque el XML no haya cambiado"
+    )
+    parser.add_argument(
+        "--timestamp", action="store_true", help="añade la fecha de generación al KML"
+    )
+    parser.add_argument(
+        "--simplify-m", type=float, help="tolerancia de simplificación del KML (m)"
+    )
+    parser.add_argument(
+        "--simplify-px", type=float, help="tolerancia de simplificación del SVG (px)"
+    )
+    parser.add_argument(
+        "--analytics",
+        action="store_true",
+        help="anota KML y SVG con la analítica geodésica de los tramos",
+    )
+    parser.add_argument(
+        "--page-size",
+        type=int,
+        default=xml2html.DEFAULT_PAGE_SIZE,
+        help="filas de clasificación por página HTML (0 = sin paginar)",
+    )
+    parser.add_argument(
+        "--gallery-page-size",
+        type=int,
+        default=xml2html.DEFAULT_GALLERY_PAGE_SIZE,
+        help="fotos o vídeos por página HTML (0 = sin paginar)",
+    )
+    parser.add_argument(
+        "--minify",
+        action="store_true",
+        help="minifica las salidas y acorta sus decimales",
+    )
+    parser.add_argument(
+        "--precompress",
+        action="store_true",
+        help="escribe copias .gz (y .br si hay brotli) de las salidas",
+    )
+    parser.add_argument(
+        "--sectors",
+        action="store_true",
+        help="divide KML y perfil por sectores y añade su tabla al HTML",
+    )
+    parser.add_argument(
+        "--kml-precision",
+        type=parse_digits,
+        default=DEGREE_DIGITS,
+        help='decimales de longitud y latitud en el KML ("full" = completas)',
+    )
+    parser.add_argument(
+        "--svg-precision",
+        type=parse_digits,
+        default=PIXEL_DIGITS,
+        help='decimales de las coordenadas del SVG ("full" = completas)',
+    )
+
+
+def options_from_args(args):
+    """Diccionario de opciones de build_circuit a partir de add_build_arguments"""
+    return {
+        "timestamp": args.timestamp,
+        "tolerance_m": args.simplify_m,
+        "tolerance_px": args.simplify_px,
+        "analytics": args.analytics,
+        "page_size": args.page_size,
+        "gallery_page_size": args.gallery_page_size,
+        "minify": args.minify,
+        "precompress": args.precompress,
+        "kml_digits": args.kml_precision,
+        "svg_digits": args.svg_precision,
+        "sectors": args.sectors,
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog="xml2batch.py",
+        description="Genera KML, altimetría SVG y HTML de varios circuitos en paralelo",
+    )
+    parser.add_argument(
+        "inputs", nargs="*", default=["."], help="XML, directorios o patrones glob"
+    )
+    parser.add_argument("-o", "--out-dir", default=".", help="directorio de salida")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=None, help="procesos (por defecto, nº de CPUs)"
+    )
+    add_build_arguments(parser)
+    args = parser.parse_args(argv[1:])
+
+    inputs = find_inputs(args.inputs)
+    if not inputs:
+        print("No se han encontrado XML de circuitos")
+        sys.exit(1)
+
+    inicio = time.perf_counter()
+    resultados = build_batch(
+        inputs,
+        args.out_dir,
+        args.kml,
+        args.svg,
+        args.html,
+        jobs=args.jobs,
+        use_cache=not args.no_cache,
+        options=options_from_args(args),
+    )
+    print_summary(resultados, time.perf_counter() - inicio)
+
+    if any(error for _, _, error in resultados):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,305 @@
+import argparse
+import colorsys
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+from number_format import PIXEL_DIGITS, parse_digits
+from output import message_stream, open_artifact
+from xml2altimetria import Svg, extract_circuit_data, profile_pairs
+from xml2altimetria_lod import minmax_decimate
+from xml2batch import find_inputs
+
+# Puntos máximos del perfil de cada circuito tras decimarlo
+DEFAULT_MAX_POINTS = 500
+DEFAULT_OUTPUT = "comparacion.svg"
+
+# Dimensiones del gráfico (la leyenda se añade debajo)
+WIDTH = 1200
+GRAPH_HEIGHT = 600
+MARGIN = 80
+# Columnas y alto de cada fila de la leyenda
+LEGEND_COLUMNS = 3
+LEGEND_ROW = 18
+
+
+def series_color(i, total):
+    """Color (#rrggbb) de la serie i, repartidas por el círculo cromático"""
+    r, g, b = colorsys.hsv_to_rgb(i / max(total, 1), 0.85, 0.85)
+    return f"#{round(r * 255):02x}{round(g * 255):02x}{round(b * 255):02x}"
+
+
+def lap_profile(xml_file, max_points=DEFAULT_MAX_POINTS, use_sidecar=True):
+    """Trabajo de un proceso del pool: perfil de un circuito en fracción de vuelta.
+
+    La distancia acumulada se divide por la longitud de la vuelta, de modo
+    que todos los circuitos van de 0 a 1, y el perfil se decima a max_points
+    conservando los picos (minmax_decimate) antes de devolverlo, así que al
+    proceso principal sólo llegan los puntos que se van a dibujar. Devuelve
+    un diccionario con nombre, longitud, rango de altitudes y puntos
+    (fracción, altitud).
+    """
+    nombre, puntos = extract_circuit_data(xml_file, use_sidecar)
+    puntos = profile_pairs(puntos)
+    if not puntos:
+        raise ValueError("No se pudieron extraer datos de altimetría del archivo XML")
+
+    inicio = puntos[0][0]
+    longitud = puntos[-1][0] - inicio
+    escala = longitud or 1
+    altitudes = [alt for _, alt in puntos]
+    return {
+        "nombre": nombre,
+        "longitud": longitud,
+        "altitud": (min(altitudes), max(altitudes)),
+        "puntos": minmax_decimate(
+            [((dist - inicio) / escala, alt) for dist, alt in puntos], max_points
+        ),
+    }
+
+
+def _extract(xml_file, max_points, use_sidecar):
+    try:
+        return xml_file, lap_profile(xml_file, max_points, use_sidecar), None
+    except FileNotFoundError:
+        return xml_file, None, "No se encuentra el archivo"
+    except ET.ParseError as e:
+        return xml_file, None, f"Error al parsear XML: {e}"
+    except ValueError as e:
+        return xml_file, None, str(e)
+
+
+def extract_profiles(
+    inputs, max_points=DEFAULT_MAX_POINTS, jobs=None, use_sidecar=True
+):
+    """Extrae en un pool de procesos los perfiles de todos los circuitos.
+
+    Devuelve la lista de resultados (xml_file, perfil, error) en el orden de
+    entrada; perfil es None si el circuito no se ha podido leer.
+    """
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(_extract, xml_file, max_points, use_sidecar)
+            for xml_file in inputs
+        ]
+        return [future.result() for future in futures]
+
+
+def write_comparison_svg(perfiles, sink, digits=PIXEL_DIGITS):
+    """Escribe en el sink los perfiles superpuestos con ejes comunes.
+
+    El eje horizontal es la fracción de vuelta (0-100 %) y el vertical una
+    escala de altitud compartida por todos los circuitos, de modo que los
+    perfiles se pueden comparar directamente. Cada circuito tiene su color y
+    su entrada en la leyenda, bajo el gráfico.
+    """
+    filas = -(-len(perfiles) // LEGEND_COLUMNS)
+    svg = Svg(
+        width=WIDTH,
+        height=GRAPH_HEIGHT + filas * LEGEND_ROW + 20,
+        sink=sink,
+        digits=digits,
+    )
+    svg.write_header()
+
+    # Una clase por serie, así cada polilínea sólo lleva su nombre de clase
+    estilos = "".join(
+        f"    .c{i} {{ stroke: {series_color(i, len(perfiles))}; }}\n"
+        for i in range(len(perfiles))
+    )
+    svg.write(
+        "  <style>\n"
+        "    .serie { fill: none; stroke-width: 1.5; }\n"
+        f"{estilos}"
+        "  </style>\n"
+    )
+
+    min_alt = min(perfil["altitud"][0] for perfil in perfiles)
+    max_alt = max(perfil["altitud"][1] for perfil in perfiles)
+    rango_alt = (max_alt - min_alt) or 1
+    graph_width = WIDTH - 2 * MARGIN
+    graph_height = GRAPH_HEIGHT - 2 * MARGIN
+    base = GRAPH_HEIGHT - MARGIN
+
+    svg.add_text(
+        WIDTH // 2,
+        40,
+        f"Comparativa de perfiles altimétricos ({len(perfiles)} circuitos)",
+        "title",
+        text_anchor="middle",
+    )
+
+    # Grid horizontal (altitudes comunes)
+    num_h_lines = 5
+    for i in range(num_h_lines + 1):
+        y = base - (i / num_h_lines) * graph_height
+        svg.add_line(MARGIN, y, WIDTH - MARGIN, y, "grid")
+        alt_value = min_alt + rango_alt * i / num_h_lines
+        svg.add_text(
+            MARGIN - 10, y + 5, f"{alt_value:.1f}m", "label", text_anchor="end"
+        )
+
+    # Grid vertical (fracción de vuelta)
+    num_v_lines = 10
+    for i in range(num_v_lines + 1):
+        x = MARGIN + (i / num_v_lines) * graph_width
+        svg.add_line(x, MARGIN, x, base, "grid")
+        svg.add_text(
+            x, base + 20, f"{100 * i // num_v_lines}%", "label", text_anchor="middle"
+        )
+
+    svg.add_line(MARGIN, MARGIN, MARGIN, base, "axis")
+    svg.add_line(MARGIN, base, WIDTH - MARGIN, base, "axis")
+    svg.add_text(
+        WIDTH // 2,
+        GRAPH_HEIGHT - 20,
+        "Fracción de vuelta",
+        "text",
+        text_anchor="middle",
+    )
+    svg.add_text(
+        20,
+        GRAPH_HEIGHT // 2,
+        "Altitud (metros)",
+        "text",
+        text_anchor="middle",
+        rotate=f"-90 20 {GRAPH_HEIGHT // 2}",
+    )
+
+    # Perfiles
+    for i, perfil in enumerate(perfiles):
+        svg.add_polyline(
+            (
+                (
+                    MARGIN + fraccion * graph_width,
+                    base - (alt - min_alt) / rango_alt * graph_height,
+                )
+                for fraccion, alt in perfil["puntos"]
+            ),
+            f"serie c{i}",
+        )
+
+    # Leyenda: muestra del color, nombre y longitud de la vuelta
+    ancho_columna = (WIDTH - 2 * MARGIN) / LEGEND_COLUMNS
+    for i, perfil in enumerate(perfiles):
+        fila, columna = divmod(i, LEGEND_COLUMNS)
+        x = MARGIN + columna * ancho_columna
+        y = GRAPH_HEIGHT + fila * LEGEND_ROW
+        svg.add_line(x, y - 4, x + 20, y - 4, f"serie c{i}")
+        svg.add_text(
+            x + 26, y, f"{perfil['nombre']} ({perfil['longitud']:.0f}m)", "label"
+        )
+
+    svg.write_footer()
+
+
+def create_comparison_svg(
+    inputs,
+    svg_file=DEFAULT_OUTPUT,
+    max_points=DEFAULT_MAX_POINTS,
+    jobs=None,
+    use_sidecar=True,
+    minify=False,
+    precompress=False,
+    digits=PIXEL_DIGITS,
+):
+    """Extrae en paralelo los perfiles de inputs y escribe la comparativa.
+
+    Los circuitos que no se pueden leer se omiten. Devuelve la lista de
+    resultados (xml_file, perfil, error) de extract_profiles.
+    """
+    resultados = extract_profiles(inputs, max_points, jobs, use_sidecar)
+    perfiles = [perfil for _, perfil, _ in resultados if perfil is not None]
+    if perfiles:
+        with open_artifact(svg_file, minify, precompress) as sink:
+            write_comparison_svg(perfiles, sink, digits)
+    return resultados
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog="xml2comparacion.py",
+        description=(
+            "Superpone los perfiles altimétricos de varios circuitos en un SVG "
+            "con la distancia en fracción de vuelta y una escala de altitud común"
+        ),
+    )
+    parser.add_argument(
+        "inputs", nargs="*", default=["."], help="XML, directorios o patrones glob"
+    )
+    parser.add_argument(
+        "-o", "--output", default=DEFAULT_OUTPUT, help="SVG de salida (- = stdout)"
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="procesos de extracción (por defecto, nº de CPUs)",
+    )
+    parser.add_argument(
+        "--max-points",
+        type=int,
+        default=DEFAULT_MAX_POINTS,
+        help="puntos máximos del perfil de cada circuito",
+    )
+    parser.add_argument(
+        "--no-sidecar",
+        action="store_true",
+        help="ignora (y no escribe) los ficheros binarios de tramos",
+    )
+    parser.add_argument(
+        "--minify", action="store_true", help="minifica el SVG y acorta sus decimales"
+    )
+    parser.add_argument(
+        "--precompress",
+        action="store_true",
+        help="escribe copias .gz (y .br si hay brotli) del SVG",
+    )
+    parser.add_argument(
+        "--precision",
+        type=parse_digits,
+        default=PIXEL_DIGITS,
+        help='decimales de las coordenadas del SVG ("full" = completas)',
+    )
+    args = parser.parse_args(argv[1:])
+
+    inputs = find_inputs(args.inputs)
+    if not inputs:
+        print("No se han encontrado XML de circuitos")
+        sys.exit(1)
+
+    out = message_stream(args.output)
+    inicio = time.perf_counter()
+    resultados = create_comparison_svg(
+        inputs,
+        args.output,
+        args.max_points,
+        args.jobs,
+        not args.no_sidecar,
+        args.minify,
+        args.precompress,
+        args.precision,
+    )
+
+    for xml_file, _, error in resultados:
+        if error:
+            print(f"{xml_file}: ERROR: {error}", file=out)
+    perfiles = [perfil for _, perfil, _ in resultados if perfil is not None]
+    if not perfiles:
+        print("No se ha podido leer ningún circuito", file=out)
+        sys.exit(1)
+
+    puntos = sum(len(perfil["puntos"]) for perfil in perfiles)
+    print(
+        f"Generado {args.output} con {len(perfiles)}/{len(resultados)} circuitos "
+        f"({puntos} puntos) en {time.perf_counter() - inicio:.2f} s",
+        file=out,
+    )
+    if len(perfiles) < len(resultados):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
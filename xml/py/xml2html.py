@@ -1,28 +1,43 @@
+import functools
+import os
+import re
+import struct
 import sys
 import xml.etree.ElementTree as ET
 
+from circuit_model import parse_circuit
+from cli import pop_flag, pop_option, reject_unknown_options
+from output import message_stream, open_artifact, open_output
+from profiling import configure, profiler
+from sector_index import SectorIndex
+from template import Template
 
-class Html:
-    """Clase para generar archivos HTML a partir de datos XML"""
+# Versión del formato generado; forma parte de la clave de la caché de builds
+VERSION = "5"
 
-    def __init__(self, author="UO287841 - Luis Salvador Ferrero Carneiro"):
-        self.author = author
-        self.html_content = []
+# Filas de clasificación y elementos de galería por página (0 = sin paginar)
+DEFAULT_PAGE_SIZE = 50
+DEFAULT_GALLERY_PAGE_SIZE = 12
+# Secciones que se paginan en ficheros {base}_{seccion}_{n}.html
+PAGINATED_SECTIONS = ("clasificacion", "fotos", "videos")
 
-    def write_header(self, title, description, keywords):
-        """Escribe el encabezado HTML con metadatos"""
-        header = f'''<!DOCTYPE html>
+
+AUTHOR = "UO287841 - Luis Salvador Ferrero Carneiro"
+
+# Plantillas de la página, compiladas una sola vez al importar el módulo
+PAGE = Template(
+    """<!DOCTYPE html>
 <html lang="es">
 <head>
   <meta charset="UTF-8" />
-  <meta name="author" content="{self.author}" />
-  <meta name="description" content="{description}" />
-  <meta name="keywords" content="{keywords}" />
+  <meta name="author" content="{{ autor }}" />
+  <meta name="description" content="{{ descripcion }}" />
+  <meta name="keywords" content="{{ keywords }}" />
   <meta name="viewport" content="width=device-width, initial-scale=1.0" />
 
   <link rel="stylesheet" href="estilo/estilo.css" />
   <link rel="stylesheet" href="estilo/layout.css" />
-  <title>{title}</title>
+  <title>{{ titulo }}</title>
 
   <link rel="icon" type="image/x-icon" href="multimedia/img/favicon/favicon.ico" />
 </head>
@@ -48,396 +63,619 @@ class Html:
   </header>
 
   <main>
-'''
-        self.html_content.append(header)
-
-    def add_heading(self, level, text):
-        """Añade un encabezado (h1-h6)"""
-        self.html_content.append(f"    <h{level}>{text}</h{level}>\n")
-
-    def add_paragraph(self, text):
-        """Añade un párrafo"""
-        self.html_content.append(f"    <p>{text}</p>\n")
-
-    def open_section(self, section_class=None):
-        """Abre una sección"""
-        class_attr = f' class="{section_class}"' if section_class else ""
-        self.html_content.append(f"    <section{class_attr}>\n")
-
-    def close_section(self):
-        """Cierra una sección"""
-        self.html_content.append("    </section>\n")
-
-    def open_article(self, article_class=None):
-        """Abre un artículo"""
-        class_attr = f' class="{article_class}"' if article_class else ""
-        self.html_content.append(f"      <article{class_attr}>\n")
-
-    def close_article(self):
-        """Cierra un artículo"""
-        self.html_content.append("      </article>\n")
-
-    def add_list_item(self, text):
-        """Añade un elemento de lista"""
-        self.html_content.append(f"        <li>{text}</li>\n")
-
-    def open_list(self, list_type="ul"):
-        """Abre una lista (ul, ol, dl)"""
-        self.html_content.append(f"      <{list_type}>\n")
-
-    def close_list(self, list_type="ul"):
-        """Cierra una lista"""
-        self.html_content.append(f"      </{list_type}>\n")
-
-    def add_table_row(self, cells, is_header=False):
-        """Añade una fila de tabla"""
-        tag = "th" if is_header else "td"
-        row = "          <tr>\n"
-        for cell in cells:
-            row += f"            <{tag}>{cell}</{tag}>\n"
-        row += "          </tr>\n"
-        self.html_content.append(row)
-
-    def open_table(self, caption=None):
-        """Abre una tabla"""
-        self.html_content.append("      <table>\n")
-        if caption:
-            self.html_content.append(f"        <caption>{caption}</caption>\n")
-
-    def open_thead(self):
-        """Abre thead"""
-        self.html_content.append("        <thead>\n")
-
-    def close_thead(self):
-        """Cierra thead"""
-        self.html_content.append("        </thead>\n")
-
-    def open_tbody(self):
-        """Abre tbody"""
-        self.html_content.append("        <tbody>\n")
-
-    def close_tbody(self):
-        """Cierra tbody"""
-        self.html_content.append("        </tbody>\n")
-
-    def close_table(self):
-        """Cierra una tabla"""
-        self.html_content.append("      </table>\n")
-
-    def add_image(self, src, alt, description=None):
-        """Añade una imagen"""
-        img = f'      <img src="{src}" alt="{alt}" />\n'
-        self.html_content.append(img)
-        if description:
-            self.html_content.append(f"      <p>{description}</p>\n")
-
-    def add_video(self, src, description=None):
-        """Añade un video"""
-        video = f'''      <video controls>
-        <source src="{src}" type="video/webm" />
-        Tu navegador no soporta el elemento de video.
-      </video>\n'''
-        self.html_content.append(video)
-        if description:
-            self.html_content.append(f"      <p>{description}</p>\n")
-
-    def add_link(self, href, text):
-        """Añade un enlace"""
-        self.html_content.append(f'      <a href="{href}">{text}</a>\n')
-
-    def write_footer(self):
-        """Escribe el cierre del HTML"""
-        footer = """  </main>
+    <h2>{{ nombre }}</h2>
+{{ secciones|raw }}  </main>
 </body>
 </html>
 """
-        self.html_content.append(footer)
+)
 
-    def save(self, filename):
-        """Guarda el contenido HTML en un archivo"""
-        with open(filename, "w", encoding="utf-8") as f:
-            f.writelines(self.html_content)
+SECTION = Template(
+    """    <section class="{{ clase }}">
+    <h3>{{ titulo }}</h3>
+{{ contenido|raw }}    </section>
+"""
+)
 
+SUBHEADING = Template("    <h4>{{ texto }}</h4>\n")
 
-def extract_circuit_info(xml_file):
-    """Extrae información del circuito usando XPath"""
-    tree = ET.parse(xml_file)
-    root = tree.getroot()
+DEFINITION_LIST = Template("      <dl>\n{{ definiciones|raw }}      </dl>\n")
 
-    # Detectar namespace
-    if root.tag.startswith("{"):
-        doc_ns = root.tag[1 : root.tag.index("}")]
-    else:
-        doc_ns = "http://www.uniovi.es/circuito"
+DEFINITION = Template(
+    """        <dt>{{ termino }}</dt>
+        <dd>{{ descripcion }}</dd>
+"""
+)
+
+CLASSIFICATION_TABLE = Template(
+    """      <table>
+        <caption>{{ caption }}</caption>
+        <thead>
+          <tr>
+            <th>Posición</th>
+            <th>Piloto</th>
+            <th>Equipo</th>
+            <th>Puntos</th>
+          </tr>
+        </thead>
+        <tbody>
+{{ filas|raw }}        </tbody>
+      </table>
+"""
+)
+
+CLASSIFICATION_ROW = Template(
+    """          <tr>
+            <td>{{ posicion }}</td>
+            <td>{{ nombre }}</td>
+            <td>{{ equipo }}</td>
+            <td>{{ puntos }}</td>
+          </tr>
+"""
+)
+
+SECTOR_TABLE = Template(
+    """      <table>
+        <caption>Agregados de cada sector del trazado</caption>
+        <thead>
+          <tr>
+            <th>Sector</th>
+            <th>Tramos</th>
+            <th>Longitud</th>
+            <th>Subida</th>
+            <th>Bajada</th>
+          </tr>
+        </thead>
+        <tbody>
+{{ filas|raw }}        </tbody>
+      </table>
+"""
+)
+
+SECTOR_ROW = Template(
+    """          <tr>
+            <td>{{ sector }}</td>
+            <td>{{ tramos }}</td>
+            <td>{{ longitud }}</td>
+            <td>{{ subida }}</td>
+            <td>{{ bajada }}</td>
+          </tr>
+"""
+)
 
-    nsmap = {"c": doc_ns}
+IMAGE = Template(
+    '      <img src="{{ archivo }}" alt="{{ alt }}" loading="lazy" />\n'
+)
 
-    # Diccionario para almacenar toda la información
-    info = {}
+IMAGE_SIZED = Template(
+    '      <img src="{{ archivo }}" alt="{{ alt }}" '
+    'width="{{ ancho }}" height="{{ alto }}" loading="lazy" />\n'
+)
 
-    # Nombre del circuito
-    nombre = root.find(".//c:nombre", namespaces=nsmap)
-    info["nombre"] = nombre.text.strip() if nombre is not None else "Circuito"
+VIDEO = Template(
+    """      <video controls preload="none">
+        <source src="{{ archivo }}" type="video/webm" />
+        Tu navegador no soporta el elemento de video.
+      </video>
+"""
+)
 
-    # Medidas
-    longitud = root.find(".//c:medidas//c:longitud", namespaces=nsmap)
-    if longitud is not None:
-        info["longitud"] = longitud.text.strip()
-        info["longitud_unidades"] = longitud.get("unidades", "m")
+CAPTION = Template("      <p>{{ texto }}</p>\n")
 
-    anchura = root.find(".//c:medidas//c:anchuraMedia", namespaces=nsmap)
-    if anchura is not None:
-        info["anchura"] = anchura.text.strip()
-        info["anchura_unidades"] = anchura.get("unidades", "m")
+LIST = Template("      <ul>\n{{ elementos|raw }}      </ul>\n")
 
-    # Evento
-    fecha = root.find(".//c:evento//c:fecha", namespaces=nsmap)
-    info["fecha"] = fecha.text.strip() if fecha is not None else ""
+LIST_ITEM = Template("        <li>{{ texto }}</li>\n")
 
-    hora = root.find(".//c:evento//c:horaInicio", namespaces=nsmap)
-    info["hora"] = hora.text.strip() if hora is not None else ""
+PAGINATION = Template(
+    """      <nav class="paginacion" aria-label="{{ etiqueta }}">
+{{ anterior|raw }}        <span>Página {{ numero }} de {{ total }}</span>
+{{ siguiente|raw }}      </nav>
+"""
+)
+
+PAGE_LINK = Template('        <a href="{{ href }}" rel="{{ rel }}">{{ texto }}</a>\n')
+
+
+def sector_rows(sectores):
+    """Filas de la tabla de sectores a partir del índice de sectores"""
+    return [
+        {
+            "sector": datos.sector,
+            "tramos": f"{datos.primero}–{datos.ultimo}",
+            "longitud": f"{datos.longitud:.0f} m",
+            "subida": f"{datos.subida:.1f} m",
+            "bajada": f"{datos.bajada:.1f} m",
+        }
+        for datos in sectores
+    ]
+
+
+def circuit_info(circuito, sectores=None):
+    """Construye el diccionario de información a partir del modelo del circuito.
+
+    Con sectores (SectorIndex del circuito) se añade la tabla de sectores.
+    """
+    info = {
+        "nombre": circuito.nombre,
+        "fecha": circuito.fecha,
+        "hora": circuito.hora,
+        "vueltas": circuito.vueltas,
+        "localidad": circuito.localidad,
+        "pais": circuito.pais,
+        "patrocinador": circuito.patrocinador,
+        "referencias": circuito.referencias,
+        "fotos": circuito.fotos,
+        "videos": circuito.videos,
+        "vencedor": circuito.vencedor,
+        "tiempo": circuito.tiempo,
+        "clasificacion": circuito.clasificacion,
+    }
 
-    vueltas = root.find(".//c:evento//c:numeroVueltas", namespaces=nsmap)
-    info["vueltas"] = vueltas.text.strip() if vueltas is not None else ""
+    # Medidas
+    if circuito.longitud is not None:
+        info["longitud"] = circuito.longitud
+        info["longitud_unidades"] = circuito.longitud_unidades
 
-    # Ubicación
-    localidad = root.find(".//c:ubicacion//c:localidadProxima", namespaces=nsmap)
-    info["localidad"] = localidad.text.strip() if localidad is not None else ""
+    if circuito.anchura is not None:
+        info["anchura"] = circuito.anchura
+        info["anchura_unidades"] = circuito.anchura_unidades
 
-    pais = root.find(".//c:ubicacion//c:pais", namespaces=nsmap)
-    info["pais"] = pais.text.strip() if pais is not None else ""
+    if sectores is not None:
+        info["sectores"] = sector_rows(sectores)
 
-    # Patrocinio
-    patrocinador = root.find(
-        ".//c:patrocinio//c:patrocinadorPrincipal", namespaces=nsmap
-    )
-    info["patrocinador"] = patrocinador.text.strip() if patrocinador is not None else ""
-
-    # Referencias
-    referencias = root.findall(".//c:referencias//c:referencia", namespaces=nsmap)
-    info["referencias"] = [ref.text.strip() for ref in referencias if ref.text]
-
-    # Galería de fotos
-    fotos = root.findall(".//c:galeriaFotos//c:foto", namespaces=nsmap)
-    info["fotos"] = []
-    for foto in fotos:
-        info["fotos"].append(
-            {
-                "archivo": foto.get("archivo", ""),
-                "descripcion": foto.get("descripcion", ""),
-            }
-        )
+    return info
+
+
+def extract_circuit_info(xml_file):
+    """Extrae información del circuito del archivo XML"""
+    return circuit_info(parse_circuit(xml_file))
 
-    # Galería de videos
-    videos = root.findall(".//c:galeriaVideos//c:video", namespaces=nsmap)
-    info["videos"] = []
-    for video in videos:
-        info["videos"].append(
-            {
-                "archivo": video.get("archivo", ""),
-                "descripcion": video.get("descripcion", ""),
-                "duracion": video.get("duracion", ""),
-            }
-        )
 
-    # Resultado
-    vencedor = root.find(".//c:resultado//c:vencedor", namespaces=nsmap)
-    info["vencedor"] = vencedor.text.strip() if vencedor is not None else ""
-
-    tiempo = root.find(".//c:resultado//c:tiempoTotal", namespaces=nsmap)
-    info["tiempo"] = tiempo.text.strip() if tiempo is not None else ""
-
-    # Clasificación mundial
-    pilotos = root.findall(".//c:clasificacionMundial//c:piloto", namespaces=nsmap)
-    info["clasificacion"] = []
-    for piloto in pilotos:
-        nombre_piloto = piloto.find("c:nombrePiloto", namespaces=nsmap)
-        equipo = piloto.find("c:equipo", namespaces=nsmap)
-        puntos = piloto.find("c:puntos", namespaces=nsmap)
-        posicion = piloto.get("posicion", "")
-
-        info["clasificacion"].append(
-            {
-                "posicion": posicion,
-                "nombre": nombre_piloto.text.strip()
-                if nombre_piloto is not None
-                else "",
-                "equipo": equipo.text.strip() if equipo is not None else "",
-                "puntos": puntos.text.strip() if puntos is not None else "",
-            }
+def _definitions(*pares):
+    """Lista dl con los pares (término, descripción)"""
+    return DEFINITION_LIST.render(
+        definiciones=DEFINITION.render_each(
+            {"termino": termino, "descripcion": descripcion}
+            for termino, descripcion in pares
         )
+    )
 
-    return info
 
+def _section(clase, titulo, *contenido):
+    return SECTION.render(clase=clase, titulo=titulo, contenido="".join(contenido))
 
-def escape_html(text):
-    """Escapa caracteres especiales de HTML"""
-    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
 
+def _gallery_item(plantilla, archivo, descripcion, **atributos):
+    """Imagen o vídeo de una galería seguido de su descripción (si la tiene)"""
+    item = plantilla.render(archivo=archivo, **atributos)
+    if descripcion:
+        item += CAPTION.render(texto=descripcion)
+    return item
 
-def create_html(xml_file, html_file):
-    """Genera el archivo HTML a partir del XML"""
 
+def _read_image_size(path):
+    """(ancho, alto) leídos de la cabecera de un PNG, GIF o JPEG; None si no se puede"""
     try:
-        info = extract_circuit_info(xml_file)
-    except FileNotFoundError:
-        print(f"Error: No se encuentra el archivo {xml_file}")
-        sys.exit(1)
-    except ET.ParseError as e:
-        print(f"Error al parsear XML: {e}")
-        sys.exit(1)
+        with open(path, "rb") as f:
+            cabecera = f.read(26)
+            if cabecera.startswith(b"\x89PNG\r\n\x1a\n"):
+                return struct.unpack(">II", cabecera[16:24])
+            if cabecera[:6] in (b"GIF87a", b"GIF89a"):
+                return struct.unpack("<HH", cabecera[6:10])
+            if not cabecera.startswith(b"\xff\xd8"):
+                return None
+            # JPEG: se recorren los segmentos hasta el primer SOFn
+            f.seek(2)
+            while True:
+                marca = f.read(4)
+                if len(marca) < 4 or marca[0] != 0xFF:
+                    return None
+                tipo, longitud = marca[1], struct.unpack(">H", marca[2:])[0]
+                if 0xC0 <= tipo <= 0xCF and tipo not in (0xC4, 0xC8, 0xCC):
+                    alto, ancho = struct.unpack(">xHH", f.read(5))
+                    return ancho, alto
+                f.seek(longitud - 2, os.SEEK_CUR)
+    except (OSError, struct.error):
+        return None
+
+
+@functools.lru_cache(maxsize=1024)
+def _cached_image_size(path, mtime_ns):
+    # mtime_ns forma parte de la clave: si la imagen cambia se vuelve a leer
+    return _read_image_size(path)
+
+
+def image_size(archivo, base_dirs=()):
+    """Dimensiones de la imagen archivo, buscada relativa a cada directorio de base_dirs.
+
+    Devuelve None si no se encuentra o no se reconoce el formato; en ese caso
+    la imagen se escribe sin width/height.
+    """
+    for base in base_dirs:
+        path = os.path.join(base, archivo)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            continue
+        dimensiones = _cached_image_size(path, mtime_ns)
+        if dimensiones:
+            return dimensiones
+    return None
+
+
+def paginate(items, size):
+    """Divide items en páginas de size elementos (una sola página si size <= 0)"""
+    if size <= 0 or len(items) <= size:
+        return [items]
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def page_filename(html_file, seccion, numero):
+    """Nombre del fichero de la página numero de una sección (la 1 es la principal)"""
+    if numero == 1:
+        return os.path.basename(html_file)
+    base, ext = os.path.splitext(os.path.basename(html_file))
+    return f"{base}_{seccion}_{numero}{ext}"
+
+
+def _pagination(html_file, seccion, numero, total):
+    """Enlaces anterior/siguiente de la página numero de total"""
+    if total <= 1:
+        return ""
+    anterior = siguiente = ""
+    if numero > 1:
+        anterior = PAGE_LINK.render(
+            href=page_filename(html_file, seccion, numero - 1),
+            rel="prev",
+            texto="Anterior",
+        )
+    if numero < total:
+        siguiente = PAGE_LINK.render(
+            href=page_filename(html_file, seccion, numero + 1),
+            rel="next",
+            texto="Siguiente",
+        )
+    return PAGINATION.render(
+        etiqueta=f"Páginas de {seccion}",
+        anterior=anterior,
+        siguiente=siguiente,
+        numero=numero,
+        total=total,
+    )
 
-    # Crear objeto HTML
-    html = Html()
 
-    # Escribir encabezado
-    html.write_header(
-        title=f"MotoGP - {info['nombre']}",
-        description=f"Información sobre el circuito {info['nombre']}",
-        keywords="MotoGP, circuito, carreras, motociclismo",
+def _classification_section(filas, navegacion=""):
+    return _section(
+        "clasificacion",
+        "Clasificación Mundial",
+        CLASSIFICATION_TABLE.render(
+            caption="Top Pilotos en el Campeonato",
+            filas=CLASSIFICATION_ROW.render_each(filas),
+        ),
+        navegacion,
     )
 
-    # Título principal (dentro de main)
-    html.add_heading(2, info["nombre"])
 
-    # Sección: Información General
-    html.open_section("info-general")
-    html.add_heading(3, "Información General")
+def _photos_section(fotos, base_dirs=(), navegacion=""):
+    def item(foto):
+        alt = foto["descripcion"] or "Imagen del circuito"
+        dimensiones = image_size(foto["archivo"], base_dirs)
+        if dimensiones is None:
+            return _gallery_item(IMAGE, foto["archivo"], foto["descripcion"], alt=alt)
+        ancho, alto = dimensiones
+        return _gallery_item(
+            IMAGE_SIZED,
+            foto["archivo"],
+            foto["descripcion"],
+            alt=alt,
+            ancho=ancho,
+            alto=alto,
+        )
 
-    # Características del circuito
-    html.add_heading(4, "Características del Circuito")
-    html.open_list("dl")
-    html.html_content.append("        <dt>Longitud</dt>\n")
-    html.html_content.append(
-        f"        <dd>{info.get('longitud', 'N/A')} {info.get('longitud_unidades', '')}</dd>\n"
+    return _section(
+        "galeria-fotos", "Galería de Fotos", *(item(foto) for foto in fotos), navegacion
     )
-    html.html_content.append("        <dt>Anchura Media</dt>\n")
-    html.html_content.append(
-        f"        <dd>{info.get('anchura', 'N/A')} {info.get('anchura_unidades', '')}</dd>\n"
+
+
+def _videos_section(videos, navegacion=""):
+    return _section(
+        "galeria-videos",
+        "Galería de Videos",
+        *(
+            _gallery_item(VIDEO, video["archivo"], video["descripcion"])
+            for video in videos
+        ),
+        navegacion,
+    )
+
+
+def _page(info, secciones):
+    return PAGE.render(
+        autor=AUTHOR,
+        titulo=f"MotoGP - {info['nombre']}",
+        descripcion=f"Información sobre el circuito {info['nombre']}",
+        keywords="MotoGP, circuito, carreras, motociclismo",
+        nombre=info["nombre"],
+        secciones="".join(secciones),
     )
-    html.close_list("dl")
-
-    # Ubicación
-    html.add_heading(4, "Ubicación")
-    html.open_list("dl")
-    html.html_content.append("        <dt>Localidad</dt>\n")
-    html.html_content.append(f"        <dd>{info.get('localidad', 'N/A')}</dd>\n")
-    html.html_content.append("        <dt>País</dt>\n")
-    html.html_content.append(f"        <dd>{info.get('pais', 'N/A')}</dd>\n")
-    html.close_list("dl")
-
-    html.close_section()
-
-    # Sección: Evento
-    html.open_section("evento")
-    html.add_heading(3, "Información del Evento")
-
-    html.open_list("dl")
-    html.html_content.append("        <dt>Fecha</dt>\n")
-    html.html_content.append(f"        <dd>{info.get('fecha', 'N/A')}</dd>\n")
-    html.html_content.append("        <dt>Hora de Inicio</dt>\n")
-    html.html_content.append(f"        <dd>{info.get('hora', 'N/A')}</dd>\n")
-    html.html_content.append("        <dt>Número de Vueltas</dt>\n")
-    html.html_content.append(f"        <dd>{info.get('vueltas', 'N/A')}</dd>\n")
-    html.close_list("dl")
-
-    html.close_section()
-
-    # Sección: Patrocinio
+
+
+def render_pages(
+    info,
+    html_file="circuito.html",
+    page_size=0,
+    gallery_page_size=0,
+    base_dirs=(),
+):
+    """Renderiza la página del circuito y, si se pagina, las páginas adicionales.
+
+    La clasificación se divide en páginas de page_size filas y las galerías
+    en páginas de gallery_page_size elementos (0 = sin paginar). La página
+    principal sólo incluye la primera página de cada sección, con enlaces
+    anterior/siguiente hacia el resto, de modo que su tamaño no crece con el
+    número de pilotos, fotos o vídeos. Las dimensiones de las imágenes se
+    leen de los ficheros buscados en base_dirs. Devuelve una lista de pares
+    (nombre de fichero, html) cuyo primer elemento es la página principal;
+    todos los datos se escapan.
+    """
+    # Secciones paginadas: (clave en info, tamaño de página, renderizador)
+    paginadas = [
+        ("clasificacion", page_size, _classification_section),
+        ("fotos", gallery_page_size, lambda f, nav: _photos_section(f, base_dirs, nav)),
+        ("videos", gallery_page_size, _videos_section),
+    ]
+    primeras = {}
+    paginas = []
+    for seccion, size, renderizar in paginadas:
+        if not info.get(seccion):
+            continue
+        trozos = paginate(info[seccion], size)
+        for numero, trozo in enumerate(trozos, 1):
+            html_seccion = renderizar(
+                trozo, _pagination(html_file, seccion, numero, len(trozos))
+            )
+            if numero == 1:
+                primeras[seccion] = html_seccion
+            else:
+                paginas.append(
+                    (
+                        page_filename(html_file, seccion, numero),
+                        _page(info, [html_seccion]),
+                    )
+                )
+
+    secciones = [
+        _section(
+            "info-general",
+            "Información General",
+            SUBHEADING.render(texto="Características del Circuito"),
+            _definitions(
+                (
+                    "Longitud",
+                    f"{info.get('longitud', 'N/A')} {info.get('longitud_unidades', '')}",
+                ),
+                (
+                    "Anchura Media",
+                    f"{info.get('anchura', 'N/A')} {info.get('anchura_unidades', '')}",
+                ),
+            ),
+            SUBHEADING.render(texto="Ubicación"),
+            _definitions(
+                ("Localidad", info.get("localidad", "N/A")),
+                ("País", info.get("pais", "N/A")),
+            ),
+        ),
+        _section(
+            "evento",
+            "Información del Evento",
+            _definitions(
+                ("Fecha", info.get("fecha", "N/A")),
+                ("Hora de Inicio", info.get("hora", "N/A")),
+                ("Número de Vueltas", info.get("vueltas", "N/A")),
+            ),
+        ),
+    ]
+
+    if info.get("sectores"):
+        secciones.append(
+            _section(
+                "sectores",
+                "Sectores",
+                SECTOR_TABLE.render(filas=SECTOR_ROW.render_each(info["sectores"])),
+            )
+        )
+
     if info.get("patrocinador"):
-        html.open_section("patrocinio")
-        html.add_heading(3, "Patrocinio")
-        html.open_list("dl")
-        html.html_content.append("        <dt>Patrocinador Principal</dt>\n")
-        html.html_content.append(f"        <dd>{info['patrocinador']}</dd>\n")
-        html.close_list("dl")
-        html.close_section()
-
-    # Sección: Resultado
-    if info.get("vencedor"):
-        html.open_section("resultado")
-        html.add_heading(3, "Resultado de la Carrera")
-        html.open_list("dl")
-        html.html_content.append("        <dt>Vencedor</dt>\n")
-        html.html_content.append(f"        <dd>{info['vencedor']}</dd>\n")
-        html.html_content.append("        <dt>Tiempo Total</dt>\n")
-        html.html_content.append(f"        <dd>{info.get('tiempo', 'N/A')}</dd>\n")
-        html.close_list("dl")
-        html.close_section()
-
-    # Sección: Clasificación Mundial
-    if info.get("clasificacion"):
-        html.open_section("clasificacion")
-        html.add_heading(3, "Clasificación Mundial")
-
-        html.open_table("Top Pilotos en el Campeonato")
-        html.open_thead()
-        html.add_table_row(["Posición", "Piloto", "Equipo", "Puntos"], is_header=True)
-        html.close_thead()
-
-        html.open_tbody()
-        for piloto in info["clasificacion"]:
-            html.add_table_row(
-                [
-                    piloto["posicion"],
-                    piloto["nombre"],
-                    piloto["equipo"],
-                    piloto["puntos"],
-                ]
+        secciones.append(
+            _section(
+                "patrocinio",
+                "Patrocinio",
+                _definitions(("Patrocinador Principal", info["patrocinador"])),
             )
-        html.close_tbody()
+        )
 
-        html.close_table()
-        html.close_section()
+    if info.get("vencedor"):
+        secciones.append(
+            _section(
+                "resultado",
+                "Resultado de la Carrera",
+                _definitions(
+                    ("Vencedor", info["vencedor"]),
+                    ("Tiempo Total", info.get("tiempo", "N/A")),
+                ),
+            )
+        )
 
-    # Sección: Galería de Fotos
-    if info.get("fotos"):
-        html.open_section("galeria-fotos")
-        html.add_heading(3, "Galería de Fotos")
+    secciones.extend(
+        primeras[clave] for clave in ("clasificacion", "fotos", "videos") if clave in primeras
+    )
 
-        for foto in info["fotos"]:
-            html.add_image(
-                foto["archivo"],
-                foto["descripcion"] if foto["descripcion"] else "Imagen del circuito",
-                foto["descripcion"],
+    if info.get("referencias"):
+        secciones.append(
+            _section(
+                "referencias",
+                "Referencias",
+                LIST.render(
+                    elementos=LIST_ITEM.render_each(
+                        {"texto": ref} for ref in info["referencias"]
+                    )
+                ),
             )
+        )
 
-        html.close_section()
+    return [(os.path.basename(html_file), _page(info, secciones)), *paginas]
 
-    # Sección: Galería de Videos
-    if info.get("videos"):
-        html.open_section("galeria-videos")
-        html.add_heading(3, "Galería de Videos")
 
-        for video in info["videos"]:
-            html.add_video(video["archivo"], video["descripcion"])
+def render_html(info, base_dirs=()):
+    """Renderiza la página HTML del circuito completa, sin paginar"""
+    return render_pages(info, base_dirs=base_dirs)[0][1]
 
-        html.close_section()
 
-    # Sección: Referencias
-    if info.get("referencias"):
-        html.open_section("referencias")
-        html.add_heading(3, "Referencias")
-        html.open_list("ul")
+def write_html(info, sink, base_dirs=()):
+    """Escribe la página HTML del circuito (sin paginar) en el sink"""
+    sink.write(render_html(info, base_dirs))
 
-        for ref in info["referencias"]:
-            # Escapar & en las referencias
-            ref_escaped = escape_html(ref)
-            html.add_list_item(ref_escaped)
 
-        html.close_list("ul")
-        html.close_section()
+def write_html_pages(
+    info,
+    html_file,
+    page_size=DEFAULT_PAGE_SIZE,
+    gallery_page_size=DEFAULT_GALLERY_PAGE_SIZE,
+    base_dirs=(),
+    minify=False,
+    precompress=False,
+    open_sink=None,
+):
+    """Escribe la página principal en html_file y las adicionales a su lado.
 
-    # Escribir cierre
-    html.write_footer()
-    html.save(html_file)
+    minify y precompress se aplican a cada página (ver output.open_artifact).
+    open_sink(ruta) permite sustituir la apertura de cada fichero (por
+    defecto, open_artifact). Devuelve las rutas de todos los ficheros escritos.
+    """
+    if open_sink is None:
+        open_sink = functools.partial(
+            open_artifact, minify=minify, precompress=precompress
+        )
+    directorio = os.path.dirname(html_file)
+    paginas = render_pages(info, html_file, page_size, gallery_page_size, base_dirs)
+    escritos = []
+    for numero, (nombre, contenido) in enumerate(paginas):
+        path = html_file if numero == 0 else os.path.join(directorio, nombre)
+        with open_sink(path) as sink:
+            sink.write(contenido)
+        escritos.append(path)
+    remove_stale_pages(html_file, escritos)
+    return escritos
+
+
+def remove_stale_pages(html_file, escritos):
+    """Borra las páginas adicionales de html_file que no están en escritos.
+
+    Son las que dejó una ejecución anterior con más páginas (y sus copias
+    .gz/.br); si se conservaran seguirían enlazándose entre sí.
+    """
+    directorio = os.path.dirname(html_file) or "."
+    base, ext = os.path.splitext(os.path.basename(html_file))
+    patron = re.compile(
+        rf"{re.escape(base)}_(?:{'|'.join(PAGINATED_SECTIONS)})_\d+"
+        rf"{re.escape(ext)}(?:\.gz|\.br)?"
+    )
+    vigentes = {os.path.basename(path) for path in escritos}
+    vigentes |= {f"{nombre}{copia}" for nombre in vigentes for copia in (".gz", ".br")}
+    for nombre in os.listdir(directorio):
+        if patron.fullmatch(nombre) and nombre not in vigentes:
+            os.unlink(os.path.join(directorio, nombre))
+
+
+def image_dirs(xml_file, html_file):
+    """Directorios donde buscar las imágenes: el del XML y el del HTML generado"""
+    dirs = [os.path.dirname(os.path.abspath(xml_file))]
+    if html_file != "-":
+        dirs.append(os.path.dirname(os.path.abspath(html_file)))
+    return tuple(dirs)
+
+
+def create_html(
+    xml_file,
+    html_file,
+    circuito=None,
+    page_size=DEFAULT_PAGE_SIZE,
+    gallery_page_size=DEFAULT_GALLERY_PAGE_SIZE,
+    minify=False,
+    precompress=False,
+    sectors=False,
+):
+    """Genera el archivo HTML a partir del XML (o del modelo ya parseado).
+
+    La clasificación y las galerías se paginan en ficheros adicionales junto
+    a html_file (page_size y gallery_page_size; 0 = sin paginar). html_file
+    puede ser "-" para escribir en la salida estándar una única página sin
+    paginar; en ese caso los mensajes informativos se envían a stderr.
+    minify y precompress minifican las páginas y escriben sus copias .gz/.br;
+    sectors añade la tabla de sectores del trazado.
+    """
+    out = message_stream(html_file)
 
-    print(f"Archivo HTML generado: {html_file}")
-    print(f"Circuito: {info['nombre']}")
-    print("HTML válido según estándares W3C")
+    try:
+        with profiler.stage("extract_circuit_info"):
+            if circuito is None:
+                circuito = parse_circuit(xml_file)
+            sectores = None
+            if sectors:
+                sectores = SectorIndex.from_records(
+                    circuito.origen, circuito.registros()
+                )
+            info = circuit_info(circuito, sectores)
+    except FileNotFoundError:
+        print(f"Error: No se encuentra el archivo {xml_file}", file=sys.stderr)
+        sys.exit(1)
+    except ET.ParseError as e:
+        print(f"Error al parsear XML: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    base_dirs = image_dirs(xml_file, html_file)
+    if html_file == "-":
+        # "save" mide la apertura y el volcado final del fichero; "render" el
+        # formateo de los fragmentos (escritos en el buffer de salida)
+        with profiler.stage("save"), open_output(html_file) as sink:
+            with profiler.stage("render"):
+                write_html(info, sink, base_dirs)
+        escritos = [html_file]
+    else:
+        with profiler.stage("render"):
+            escritos = write_html_pages(
+                info,
+                html_file,
+                page_size,
+                gallery_page_size,
+                base_dirs,
+                minify,
+                precompress,
+            )
+
+    print(f"Archivo HTML generado: {html_file}", file=out)
+    if len(escritos) > 1:
+        print(f"Páginas adicionales: {len(escritos) - 1}", file=out)
+    print(f"Circuito: {info['nombre']}", file=out)
+    print("HTML válido según estándares W3C", file=out)
 
 
 def main(argv):
+    # --profile[=FICHERO] (o XML2_PROFILE) emite un informe JSON de tiempos
+    argv = configure(argv, "xml2html.py")
+    # --page-size=N filas de clasificación y --gallery-page-size=N fotos o
+    # vídeos por página (0 = todo en una sola página)
+    page_size, argv = pop_option(argv, "--page-size", DEFAULT_PAGE_SIZE, int)
+    gallery_page_size, argv = pop_option(
+        argv, "--gallery-page-size", DEFAULT_GALLERY_PAGE_SIZE, int
+    )
+    # --minify y --precompress preparan las páginas para servirlas
+    minify, argv = pop_flag(argv, "--minify")
+    precompress, argv = pop_flag(argv, "--precompress")
+    # --sectors añade la tabla de sectores del trazado
+    sectors, argv = pop_flag(argv, "--sectors")
+    reject_unknown_options(argv, "[circuito.xml] [circuito.html|-]")
+
     if len(argv) < 2:
         in_xml = "circuitoEsquema.xml"
         out_html = "circuito.html"
@@ -448,7 +686,16 @@ def main(argv):
         in_xml = argv[1]
         out_html = argv[2]
 
-    create_html(in_xml, out_html)
+    create_html(
+        in_xml,
+        out_html,
+        page_size=page_size,
+        gallery_page_size=gallery_page_size,
+        minify=minify,
+        precompress=precompress,
+        sectors=sectors,
+    )
+    profiler.finish()
 
 
 if __name__ == "__main__":
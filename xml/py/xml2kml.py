@@ -1,97 +1,52 @@
+import itertools
+import shutil
 import sys
+import tempfile
 import xml.etree.ElementTree as ET
 from datetime import datetime
 
+from cli import pop_flag, pop_option, reject_unknown_options
+from output import message_stream, open_artifact
+from number_format import (
+    DEGREE_DIGITS,
+    METER_DIGITS,
+    fixed_formatter,
+    format_number,
+    parse_digits,
+)
+from profiling import configure, profiler
+from sector_index import SectorIndex, kml_color, sector_color
+from simplify import simplify_records
+from track_analytics import analyze_columns, analyze_records, tramo_annotation
+from tramo_cache import load_tramos
+
+# Versión del formato generado; forma parte de la clave de la caché de builds
+VERSION = "5"
+
 
 def q(name, ns):
     """Helper: construye nombre con namespace para ElementTree si se prefiere."""
     return f"{{{ns}}}{name}"
 
 
-def main(argv):
-    if len(argv) < 2:
-        in_xml = "circuitoEsquema.xml"
-        out_kml = "circuito.kml"
-    elif len(argv) == 2:
-        in_xml = argv[1]
-        out_kml = "circuito.kml"
-    else:
-        in_xml = argv[1]
-        out_kml = argv[2]
+class Kml:
+    """Clase para generar archivos KML escribiendo directamente en un sink"""
 
-    # Parse XML
-    tree = ET.parse(in_xml)
-    root = tree.getroot()
-
-    # Detectar namespace del documento (esperado: http://www.uniovi.es/circuito)
-    # root.tag tiene la forma '{namespace}schema' o '{namespace}circuito' dependiendo del archivo
-    # Buscamos el namespace declarado en el documento (target)
-    nsmap = {}
-    # Reutilizamos el namespace tal cual que indica root (si aplica)
-    if root.tag.startswith("{"):
-        # extraer texto entre { and }
-        doc_ns = root.tag.split("}")[0].strip("{")
-    else:
-        doc_ns = "http://www.uniovi.es/circuito"
-
-    # namespace prefix que usaremos en las búsquedas XPath
-    nsmap["c"] = doc_ns
-
-    # Extraer el elemento 'origen' (si existe)
-    origen = root.find(".//c:geografia//c:origen", namespaces=nsmap)
-    coords = []
-    if origen is not None:
-        lon_e = origen.find("c:longitud", namespaces=nsmap)
-        lat_e = origen.find("c:latitud", namespaces=nsmap)
-        alt_e = origen.find("c:altitud", namespaces=nsmap)
-        if lon_e is not None and lat_e is not None:
-            try:
-                lon = lon_e.text.strip()
-                lat = lat_e.text.strip()
-                alt = alt_e.text.strip() if alt_e is not None and alt_e.text else "0"
-                coords.append((lon, lat, alt))
-            except Exception:
-                pass
-
-    # Extraer todas las coordenadas de los tramos en orden (usar XPath y ns)
-    tramos = root.findall(".//c:tramos//c:tramo", namespaces=nsmap)
-    # Para cada tramo coger puntoFinal/longitud, latitud, altitud
-    for tramo in tramos:
-        punto = tramo.find(".//c:puntoFinal", namespaces=nsmap)
-        if punto is None:
-            continue
-        lon_e = punto.find("c:longitud", namespaces=nsmap)
-        lat_e = punto.find("c:latitud", namespaces=nsmap)
-        alt_e = punto.find("c:altitud", namespaces=nsmap)
-        if lon_e is not None and lat_e is not None:
-            lon = lon_e.text.strip()
-            lat = lat_e.text.strip()
-            alt = alt_e.text.strip() if alt_e is not None and alt_e.text else "0"
-            coords.append((lon, lat, alt))
-
-    if not coords:
-        print(
-            "No se han podido extraer coordenadas del XML. Comprueba los nombres y namespaces."
-        )
-        sys.exit(1)
+    def __init__(self, sink):
+        self.sink = sink
 
-    # Construir la sección KML para coordenadas: lon,lat,alt separadas por comas y saltos de línea
-    coords_text = "\n".join([f"{c[0]},{c[1]},{c[2]}" for c in coords])
+    def write(self, fragment):
+        """Emite un fragmento KML al sink"""
+        self.sink.write(fragment)
 
-    # Metadata para descripción
-    nombre = root.find(".//c:nombre", namespaces=nsmap)
-    nombre_text = (
-        nombre.text.strip() if nombre is not None and nombre.text else "Circuito"
-    )
-
-    fecha = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%SZ")
-
-    # Plantilla KML (básica)
-    kml_template = f"""<?xml version="1.0" encoding="UTF-8"?>
+    def write_header(self, nombre, description):
+        """Escribe el encabezado del documento KML y su estilo de línea"""
+        self.write(
+            f"""<?xml version="1.0" encoding="UTF-8"?>
 <kml xmlns="http://www.opengis.net/kml/2.2">
   <Document>
-    <name>{nombre_text} - Planimetría</name>
-    <description>Generado desde {in_xml} el {fecha} (xml2kml.py)</description>
+    <name>{nombre} - Planimetría</name>
+    <description>{description}</description>
 
     <!-- Style for the circuit line -->
     <Style id="circuitLineStyle">
@@ -100,79 +55,395 @@ def main(argv):
         <width>4</width>
       </LineStyle>
     </Style>
+"""
+        )
 
-    <!-- Origin marker -->
-    <Placemark>
-      <name>Origen</name>
-      <description>Origen definido en geografía</description>
+    def add_comment(self, text):
+        """Añade un comentario precedido de una línea en blanco"""
+        self.write(f"\n    <!-- {text} -->\n")
+
+    def add_point(self, name, description, coords, leading_newline=False):
+        """Añade un Placemark con un Point"""
+        lon, lat, alt = coords
+        if leading_newline:
+            self.write("\n")
+        self.write(
+            f"""    <Placemark>
+      <name>{name}</name>
+      <description>{description}</description>
       <Point>
-        <coordinates>{coords[0][0]},{coords[0][1]},{coords[0][2]}</coordinates>
+        <coordinates>{lon},{lat},{alt}</coordinates>
       </Point>
     </Placemark>
+"""
+        )
 
-    <!-- Full circuit as LineString -->
-    <Placemark>
-      <name>{nombre_text} - Track</name>
-      <styleUrl>#circuitLineStyle</styleUrl>
+    def open_linestring(self, name, style_url):
+        """Abre un Placemark con LineString para escribir coordenadas"""
+        self.write(
+            f"""    <Placemark>
+      <name>{name}</name>
+      <styleUrl>#{style_url}</styleUrl>
       <LineString>
         <tessellate>1</tessellate>
         <altitudeMode>absolute</altitudeMode>
         <coordinates>
-{coords_text}
-        </coordinates>
+"""
+        )
+
+    def add_coordinate(self, lon, lat, alt):
+        """Añade una coordenada lon,lat,alt al LineString abierto"""
+        self.write(f"{lon},{lat},{alt}\n")
+
+    def close_linestring(self):
+        """Cierra el LineString abierto"""
+        self.write(
+            """        </coordinates>
       </LineString>
     </Placemark>
+"""
+        )
 
-    <!-- Optional: placemarks per tramo -->
+    def add_style(self, style_id, color, width=4):
+        """Añade un estilo de línea con el color (aabbggrr) indicado"""
+        self.write(
+            f"""    <Style id="{style_id}">
+      <LineStyle>
+        <color>{color}</color>
+        <width>{width}</width>
+      </LineStyle>
+    </Style>
 """
+        )
 
-    # Añadir placemarks por tramo (coordenadas puntuales)
-    # Usamos XPath para extraer número de sector y distancia para la descripción
-    for i, tramo in enumerate(tramos, start=1):
-        punto = tramo.find(".//c:puntoFinal", namespaces=nsmap)
-        lon_e = punto.find("c:longitud", namespaces=nsmap)
-        lat_e = punto.find("c:latitud", namespaces=nsmap)
-        alt_e = punto.find("c:altitud", namespaces=nsmap)
-        sector = tramo.find("c:sector", namespaces=nsmap)
-        distancia = tramo.find("c:distancia", namespaces=nsmap)
-
-        if lon_e is None or lat_e is None:
-            continue
-        lon = lon_e.text.strip()
-        lat = lat_e.text.strip()
-        alt = alt_e.text.strip() if alt_e is not None and alt_e.text else "0"
-        desc_parts = []
-        if sector is not None and sector.text:
-            desc_parts.append(f"Sector: {sector.text.strip()}")
-        if distancia is not None and distancia.text:
-            desc_parts.append(f"Distancia: {distancia.text.strip()} m")
-        desc = " | ".join(desc_parts) if desc_parts else f"Tramo {i}"
-        placemark = f"""
-    <Placemark>
-      <name>Tramo {i}</name>
-      <description>{desc}</description>
-      <Point>
-        <coordinates>{lon},{lat},{alt}</coordinates>
-      </Point>
-    </Placemark>
+    def open_folder(self, name, description):
+        """Abre un Folder; los elementos siguientes quedan dentro hasta cerrarlo"""
+        self.write(
+            f"""    <Folder>
+      <name>{name}</name>
+      <description>{description}</description>
 """
-        kml_template += placemark
+        )
+
+    def close_folder(self):
+        """Cierra el Folder abierto"""
+        self.write("    </Folder>\n")
 
-    # Cierre
-    kml_template += """
+    def write_footer(self):
+        """Escribe el cierre del documento KML"""
+        self.write(
+            """
   </Document>
 </kml>
 """
+        )
+
+
+# Marcador de "ningún run abierto" (None es el run de los tramos sin sector)
+_NO_RUN = object()
 
-    # Escribir fichero KML
-    with open(out_kml, "w", encoding="utf-8") as f:
-        f.write(kml_template)
 
-    print(f"Generado {out_kml} con {len(coords)} puntos (incluido origen).")
-    print("Abrir en Google Earth: Archivo -> Abrir archivo KML local.")
+def _open_sector(kml, nombre, sector, sectores):
+    """Abre el Folder y el LineString de un tramo continuo del sector"""
+    datos = sectores.get(sector)
+    if datos is None:
+        kml.open_folder("Sin sector", "Tramos sin sector")
+        kml.open_linestring(f"{nombre} - Sin sector", "circuitLineStyle")
+        return
+    kml.open_folder(
+        f"Sector {sector}",
+        f"Tramos {datos.primero}-{datos.ultimo} | "
+        f"Longitud: {datos.longitud:.0f} m | "
+        f"Subida: {datos.subida:.1f} m | Bajada: {datos.bajada:.1f} m",
+    )
+    kml.open_linestring(f"{nombre} - Sector {sector}", f"sector{sector}")
+
+
+def write_kml_records(
+    nombre,
+    origen,
+    registros,
+    sink,
+    source_name,
+    timestamp=False,
+    analisis=None,
+    digits=DEGREE_DIGITS,
+    sectores=None,
+):
+    """Escribe el KML en el sink consumiendo registros (distancia, lon, lat, alt, sector).
+
+    Los registros pueden venir de un generador (iter_tramos): las coordenadas
+    se escriben según llegan y los placemarks por tramo se acumulan en un
+    fichero temporal, por lo que la memoria no crece con el número de tramos.
+    Devuelve el número de coordenadas escritas (0 si no había ninguna, en
+    cuyo caso no se escribe nada). Sin timestamp la salida es reproducible:
+    el mismo XML produce siempre los mismos bytes. Con analisis (de
+    track_analytics, calculado sobre los mismos registros) la descripción de
+    cada tramo incluye su longitud geodésica, pendiente y cambio de rumbo.
+    Longitud y latitud se escriben con digits decimales (None = el valor
+    completo) y las altitudes con METER_DIGITS, conservando los ceros finales
+    como en el XML de origen (12.677500, 20.40). Con sectores (un
+    SectorIndex de los mismos tramos) el trazado se divide en un Folder por
+    cada tramo continuo de un sector, con su color y sus agregados.
+    """
+    grados = fixed_formatter(digits, zeros=True)
+    metros = fixed_formatter(METER_DIGITS if digits is not None else None, zeros=True)
+
+    registros = iter(registros)
+    primero = next(registros, None)
+    if origen is None and primero is None:
+        return 0
+
+    if origen is not None:
+        origen_coords = (origen.longitud, origen.latitud, origen.altitud)
+    else:
+        origen_coords = primero[1:4]
+    origen_coords = (
+        grados(origen_coords[0]),
+        grados(origen_coords[1]),
+        metros(origen_coords[2]),
+    )
+
+    if timestamp:
+        fecha = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%SZ")
+        description = f"Generado desde {source_name} el {fecha} (xml2kml.py)"
+    else:
+        description = f"Generado desde {source_name} (xml2kml.py)"
+
+    if primero is None:
+        # Sólo hay origen: no hay sectores que separar
+        sectores = None
+
+    kml = Kml(sink)
+    kml.write_header(nombre, description)
+    if sectores is not None:
+        for datos in sectores:
+            color = kml_color(sector_color(datos.sector))
+            kml.add_style(f"sector{datos.sector}", color)
+    kml.add_comment("Origin marker")
+    kml.add_point("Origen", "Origen definido en geografía", origen_coords)
+    if sectores is None:
+        kml.add_comment("Full circuit as LineString")
+        kml.open_linestring(f"{nombre} - Track", "circuitLineStyle")
+    else:
+        kml.add_comment("Circuit split by sector")
+
+    num_coords = 0
+    with tempfile.SpooledTemporaryFile(
+        max_size=1 << 20, mode="w+", encoding="utf-8"
+    ) as spool:
+        placemarks = Kml(spool)
+
+        # Coordenadas lon,lat,alt, una por línea; con sectores el origen es el
+        # primer punto del primer Folder
+        anterior = None
+        if origen is not None:
+            if sectores is None:
+                kml.add_coordinate(*origen_coords)
+            else:
+                anterior = origen_coords
+            num_coords += 1
+        actual = _NO_RUN
+
+        # Placemarks por tramo (coordenadas puntuales), con sector y
+        # distancia del tramo para la descripción
+        tramos = itertools.chain([primero], registros) if primero else ()
+        for i, (distancia, lon, lat, alt, sector) in enumerate(tramos, start=1):
+            coords = (grados(lon), grados(lat), metros(alt))
+            if sectores is not None and sector != actual:
+                if actual is not _NO_RUN:
+                    kml.close_linestring()
+                    kml.close_folder()
+                _open_sector(kml, nombre, sector, sectores)
+                # Cada Folder empieza donde acabó el anterior
+                if anterior is not None:
+                    kml.add_coordinate(*anterior)
+                actual = sector
+            kml.add_coordinate(*coords)
+            anterior = coords
+            num_coords += 1
+
+            desc_parts = []
+            if sector is not None:
+                desc_parts.append(f"Sector: {sector}")
+            if distancia is not None:
+                desc_parts.append(f"Distancia: {format_number(distancia)} m")
+            if analisis is not None:
+                anotacion = tramo_annotation(analisis, i - 1)
+                if anotacion:
+                    desc_parts.append(anotacion)
+            desc = " | ".join(desc_parts) if desc_parts else f"Tramo {i}"
+            placemarks.add_point(f"Tramo {i}", desc, coords, leading_newline=True)
+
+        kml.close_linestring()
+        if sectores is not None:
+            kml.close_folder()
+        kml.add_comment("Optional: placemarks per tramo")
+        spool.seek(0)
+        shutil.copyfileobj(spool, sink)
+
+    kml.write_footer()
+    return num_coords
+
+
+def write_kml(
+    circuito,
+    sink,
+    source_name,
+    timestamp=False,
+    tolerance_m=None,
+    analytics=False,
+    digits=DEGREE_DIGITS,
+    sectores=None,
+):
+    """Escribe el KML del circuito a partir del modelo ya parseado.
+
+    Con tolerance_m se simplifica antes el trazado (tolerancia en metros); con
+    analytics se anota cada tramo con su analítica geodésica; digits son los
+    decimales de longitud y latitud; con sectores (SectorIndex del circuito)
+    el trazado se divide por sectores. Devuelve el número de puntos escritos
+    y el de puntos eliminados.
+    """
+    registros = circuito.registros()
+    eliminados = 0
+    if tolerance_m:
+        registros, eliminados = simplify_records(
+            circuito.origen, registros, tolerance_m
+        )
+    analisis = None
+    if analytics:
+        registros = list(registros)
+        analisis = analyze_records(circuito.nombre, circuito.origen, registros)
+    num_coords = write_kml_records(
+        circuito.nombre,
+        circuito.origen,
+        registros,
+        sink,
+        source_name,
+        timestamp=timestamp,
+        analisis=analisis,
+        digits=digits,
+        sectores=sectores,
+    )
+    return num_coords, eliminados
+
+
+def main(argv):
+    # --profile[=FICHERO] (o XML2_PROFILE) emite un informe JSON de tiempos;
+    # la descripción del documento lleva la fecha de generación salvo con
+    # --no-timestamp (salida reproducible; --timestamp se acepta por
+    # compatibilidad);
+    # --simplify=METROS simplifica el trazado con esa tolerancia;
+    # --no-sidecar ignora (y no escribe) el fichero binario de tramos;
+    # --analytics anota cada tramo con su analítica geodésica;
+    # --minify y --precompress preparan la salida para servirla (un destino
+    # .kmz se escribe comprimido); --precision=N fija los decimales de
+    # longitud y latitud (--precision=full conserva los valores completos);
+    # --sectors divide el trazado en un Folder de color por sector
+    argv = configure(argv, "xml2kml.py")
+    no_timestamp, argv = pop_flag(argv, "--no-timestamp")
+    _, argv = pop_flag(argv, "--timestamp")
+    no_sidecar, argv = pop_flag(argv, "--no-sidecar")
+    analytics, argv = pop_flag(argv, "--analytics")
+    minify, argv = pop_flag(argv, "--minify")
+    precompress, argv = pop_flag(argv, "--precompress")
+    sectors, argv = pop_flag(argv, "--sectors")
+    digits, argv = pop_option(argv, "--precision", DEGREE_DIGITS, parse_digits)
+    tolerance_m, argv = pop_option(argv, "--simplify", type=float)
+    reject_unknown_options(argv, "[circuito.xml] [circuito.kml|-]")
+
+    if len(argv) < 2:
+        in_xml = "circuitoEsquema.xml"
+        out_kml = "circuito.kml"
+    elif len(argv) == 2:
+        in_xml = argv[1]
+        out_kml = "circuito.kml"
+    else:
+        in_xml = argv[1]
+        out_kml = argv[2]
+
+    # Los tramos se leen del fichero binario junto al XML si está al día; si
+    # no, se parsean en streaming y se guarda para las siguientes ejecuciones.
+    # out_kml puede ser "-" para escribir en stdout (mensajes a stderr)
+    out = message_stream(out_kml)
+    try:
+        with profiler.stage("parse"):
+            tramos = load_tramos(in_xml, use_sidecar=not no_sidecar)
+        nombre, origen = tramos.nombre, tramos.origen
+        registros = tramos.registros()
+        if not tramos.columnar:
+            # Sin fichero binario el XML se parsea al consumir los registros
+            # (al simplificar o al escribir): ese tiempo se cuenta en "parse"
+            registros = profiler.timed_iter("parse", registros)
+        if tolerance_m:
+            with profiler.stage("simplify"):
+                registros, eliminados = simplify_records(
+                    origen, registros, tolerance_m
+                )
+            print(f"Simplificación: {eliminados} puntos eliminados", file=out)
+
+        analisis = None
+        if analytics:
+            with profiler.stage("analytics"):
+                if tolerance_m:
+                    analisis = analyze_records(nombre, origen, registros)
+                else:
+                    analisis = analyze_columns(tramos)
+            discrepantes = analisis["discrepantes"]
+            if discrepantes:
+                print(
+                    f"Aviso: {len(discrepantes)} tramos con distancia declarada "
+                    f"distinta de la geodésica",
+                    file=out,
+                )
+
+        sectores = None
+        if sectors:
+            # Los agregados se calculan sobre el trazado completo, antes de
+            # simplificar (la analítica sólo se reutiliza si es de ese trazado)
+            with profiler.stage("sectors"):
+                sectores = SectorIndex.from_tramos(
+                    tramos, None if tolerance_m else analisis
+                )
+
+        with profiler.stage("write"), open_artifact(
+            out_kml, minify, precompress
+        ) as sink:
+            with profiler.stage("format"):
+                num_coords = write_kml_records(
+                    nombre,
+                    origen,
+                    registros,
+                    sink,
+                    in_xml,
+                    timestamp=not no_timestamp,
+                    analisis=analisis,
+                    digits=digits,
+                    sectores=sectores,
+                )
+            if not num_coords:
+                # Dentro del bloque, para que no se escriba un KML vacío
+                raise ValueError(
+                    "No se han podido extraer coordenadas del XML. "
+                    "Comprueba los nombres y namespaces."
+                )
+    except FileNotFoundError:
+        print(f"Error: No se encuentra el archivo {in_xml}", file=sys.stderr)
+        sys.exit(1)
+    except ET.ParseError as e:
+        print(f"Error al parsear XML: {e}", file=sys.stderr)
+        sys.exit(1)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+    print(f"Generado {out_kml} con {num_coords} puntos (incluido origen).", file=out)
+    print("Abrir en Google Earth: Archivo -> Abrir archivo KML local.", file=out)
     print(
-        "Para crear planimetria.pdf: ajustar vista y 'Imprimir' -> Guardar como PDF en Google Earth o usar navegador/visor de KML."
+        "Para crear planimetria.pdf: ajustar vista y 'Imprimir' -> Guardar como PDF en Google Earth o usar navegador/visor de KML.",
+        file=out,
     )
+    profiler.finish()
 
 
 if __name__ == "__main__":
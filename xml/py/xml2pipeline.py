@@ -0,0 +1,239 @@
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+from build_cache import CACHE_FILENAME, BuildCache
+from circuit_model import parse_circuit
+from output import write_artifact
+from xml2all import output_keys, write_outputs
+from xml2batch import (
+    add_build_arguments,
+    find_inputs,
+    options_from_args,
+    output_paths,
+    print_summary,
+)
+
+# Operaciones de E/S simultáneas por defecto (lecturas y escrituras)
+DEFAULT_READS = 8
+DEFAULT_WRITES = 8
+
+
+class _Collector:
+    """Sustituto de open_artifact que guarda cada salida en memoria"""
+
+    def __init__(self):
+        self.textos = {}
+
+    @contextlib.contextmanager
+    def open(self, path):
+        buffer = io.StringIO()
+        yield buffer
+        self.textos[path] = buffer.getvalue()
+
+
+def render_circuit(datos, in_xml, pendientes, outputs, options):
+    """Trabajo de un proceso del pool: parsea el XML (bytes) y genera las salidas.
+
+    No escribe nada en disco: devuelve los tiempos de cada etapa y un
+    diccionario {ruta: texto} con todas las salidas (incluidas las páginas
+    adicionales del HTML) para que el bucle de eventos las escriba.
+    """
+    inicio = time.perf_counter()
+    circuito = parse_circuit(io.BytesIO(datos))
+    tiempos = {"parse": time.perf_counter() - inicio}
+
+    if not circuito.coordenadas():
+        raise ValueError(
+            "No se han podido extraer coordenadas del XML. Comprueba los nombres y namespaces."
+        )
+
+    collector = _Collector()
+    tiempos.update(
+        write_outputs(
+            circuito, in_xml, pendientes, *outputs, options, open_sink=collector.open
+        )
+    )
+    return tiempos, collector.textos
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class Pipeline:
+    """Pipeline asíncrono de lectura, render y escritura de varios circuitos.
+
+    Cada circuito pasa por tres etapas que se solapan con las de los demás:
+    la lectura del XML y la escritura de las salidas se hacen en hilos (con
+    a lo sumo reads y writes operaciones simultáneas), y el parseo y render,
+    limitados por la CPU, en un pool de jobs procesos. Las salidas se
+    escriben de forma atómica (fichero temporal y renombrado), de modo que
+    nunca se sirve un fichero a medio escribir.
+    """
+
+    def __init__(
+        self,
+        out_dir,
+        patterns,
+        jobs=None,
+        reads=DEFAULT_READS,
+        writes=DEFAULT_WRITES,
+        cache=None,
+        options=None,
+    ):
+        self.out_dir = out_dir
+        self.patterns = patterns
+        self.jobs = jobs
+        self.reads = reads
+        self.writes = writes
+        self.cache = cache
+        self.options = options or {}
+        # Desde Python 3.10 los semáforos se asocian al bucle en el primer uso,
+        # así que pueden crearse aquí, fuera de asyncio.run
+        self._lecturas = asyncio.Semaphore(reads)
+        self._escrituras = asyncio.Semaphore(writes)
+
+    async def _write(self, path, texto):
+        async with self._escrituras:
+            await asyncio.to_thread(
+                write_artifact,
+                path,
+                texto,
+                self.options.get("minify", False),
+                self.options.get("precompress", False),
+            )
+
+    async def build_one(self, in_xml, executor):
+        """Lee, genera y escribe las salidas de un circuito; devuelve (in_xml, tiempos, error)"""
+        inicio = time.perf_counter()
+        outputs = output_paths(in_xml, self.out_dir, *self.patterns)
+        tiempos = {
+            "read": 0.0,
+            "parse": 0.0,
+            "kml": 0.0,
+            "svg": 0.0,
+            "html": 0.0,
+            "write": 0.0,
+            "cached": 0,
+        }
+        try:
+            async with self._lecturas:
+                datos = await asyncio.to_thread(_read, in_xml)
+            tiempos["read"] = time.perf_counter() - inicio
+
+            pendientes = list(outputs)
+            keys = None
+            if self.cache is not None:
+                digest = hashlib.sha256(datos).hexdigest()
+                keys = output_keys(in_xml, *outputs, self.options, digest)
+                pendientes = [o for o in outputs if not self.cache.is_fresh(o, keys[o])]
+                tiempos["cached"] = len(outputs) - len(pendientes)
+
+            if pendientes:
+                loop = asyncio.get_running_loop()
+                render, textos = await loop.run_in_executor(
+                    executor,
+                    render_circuit,
+                    datos,
+                    in_xml,
+                    pendientes,
+                    outputs,
+                    self.options,
+                )
+                tiempos.update(render)
+
+                inicio_escritura = time.perf_counter()
+                await asyncio.gather(
+                    *(self._write(path, texto) for path, texto in textos.items())
+                )
+                tiempos["write"] = time.perf_counter() - inicio_escritura
+
+                if keys is not None:
+                    for output in pendientes:
+                        self.cache.update(output, keys[output])
+            error = None
+        except (OSError, ET.ParseError, ValueError) as e:
+            error = str(e)
+        tiempos["total"] = time.perf_counter() - inicio
+        return in_xml, tiempos, error
+
+    async def run(self, inputs):
+        """Procesa todos los circuitos; devuelve los resultados en el orden de entrada"""
+        os.makedirs(self.out_dir, exist_ok=True)
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            return await asyncio.gather(
+                *(self.build_one(in_xml, executor) for in_xml in inputs)
+            )
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog="xml2pipeline.py",
+        description=(
+            "Genera KML, altimetría SVG y HTML de varios circuitos solapando "
+            "lectura, render y escritura"
+        ),
+    )
+    parser.add_argument(
+        "inputs", nargs="*", default=["."], help="XML, directorios o patrones glob"
+    )
+    parser.add_argument("-o", "--out-dir", default=".", help="directorio de salida")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="procesos de render (por defecto, nº de CPUs)",
+    )
+    parser.add_argument(
+        "--reads", type=int, default=DEFAULT_READS, help="lecturas simultáneas"
+    )
+    parser.add_argument(
+        "--writes", type=int, default=DEFAULT_WRITES, help="escrituras simultáneas"
+    )
+    add_build_arguments(parser)
+    args = parser.parse_args(argv[1:])
+
+    if args.reads < 1 or args.writes < 1:
+        print("Error: --reads y --writes deben ser al menos 1")
+        sys.exit(1)
+
+    inputs = find_inputs(args.inputs)
+    if not inputs:
+        print("No se han encontrado XML de circuitos")
+        sys.exit(1)
+
+    cache_path = os.path.join(args.out_dir, CACHE_FILENAME)
+    cache = None if args.no_cache else BuildCache.load(cache_path)
+    pipeline = Pipeline(
+        args.out_dir,
+        (args.kml, args.svg, args.html),
+        jobs=args.jobs,
+        reads=args.reads,
+        writes=args.writes,
+        cache=cache,
+        options=options_from_args(args),
+    )
+
+    inicio = time.perf_counter()
+    resultados = asyncio.run(pipeline.run(inputs))
+    print_summary(resultados, time.perf_counter() - inicio)
+
+    if cache is not None:
+        cache.save()
+
+    if any(error for _, _, error in resultados):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
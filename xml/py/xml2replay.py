@@ -0,0 +1,319 @@
+import colorsys
+import csv
+import math
+import os
+import sys
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
+
+from circuit_model import read_event
+from cli import pop_option, reject_unknown_options
+from number_format import DEGREE_DIGITS, METER_DIGITS, format_fixed
+from output import message_stream, open_artifact
+from profiling import configure, profiler
+from track_analytics import analyze_columns
+from tramo_cache import load_tramos
+
+# Puntos del trazado por vuelta en las animaciones (el tamaño del KML crece
+# linealmente con pilotos x vueltas x muestras)
+DEFAULT_SAMPLES = 60
+
+
+def parse_lap_time(texto):
+    """Segundos de un tiempo de vuelta "m:ss.sss" o "ss.sss" """
+    texto = texto.strip()
+    minutos, _, segundos = texto.rpartition(":")
+    valor = float(segundos) + (int(minutos) * 60 if minutos else 0)
+    if valor <= 0 or math.isnan(valor) or math.isinf(valor):
+        raise ValueError(f"Tiempo de vuelta no válido: {texto}")
+    return valor
+
+
+def _laps_from_csv(path):
+    """Vueltas de un CSV con cabecera piloto,vuelta,tiempo"""
+    pilotos = {}
+    with open(path, encoding="utf-8", newline="") as f:
+        for fila in csv.DictReader(f):
+            try:
+                numero = int(fila["vuelta"])
+                tiempo = parse_lap_time(fila["tiempo"])
+                pilotos.setdefault(fila["piloto"].strip(), {})[numero] = tiempo
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(f"Fila no válida en {path}: {fila} ({e})") from e
+    return None, pilotos
+
+
+def _laps_from_xml(path):
+    """Vueltas de un XML <sesion inicio="..."><piloto nombre="..."><vuelta numero tiempo/>"""
+    raiz = ET.parse(path).getroot()
+    pilotos = {}
+    for piloto in raiz.iter():
+        if piloto.tag.rpartition("}")[2] != "piloto":
+            continue
+        vueltas = pilotos.setdefault(piloto.get("nombre", "").strip(), {})
+        for vuelta in piloto:
+            if vuelta.tag.rpartition("}")[2] != "vuelta":
+                continue
+            try:
+                vueltas[int(vuelta.get("numero"))] = parse_lap_time(vuelta.get("tiempo"))
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Vuelta no válida de {piloto.get('nombre')}: {e}") from e
+    return raiz.get("inicio"), pilotos
+
+
+def load_laps(path):
+    """Lee los tiempos de vuelta de un CSV o XML.
+
+    Devuelve (inicio, pilotos): inicio es la hora de salida indicada en el
+    XML (o None) y pilotos asocia cada piloto con la lista de sus tiempos de
+    vuelta en segundos, en orden de vuelta. Las vueltas deben ser
+    consecutivas desde la 1; lanza ValueError si el fichero no es válido.
+    """
+    if path.lower().endswith(".xml"):
+        inicio, pilotos = _laps_from_xml(path)
+    else:
+        inicio, pilotos = _laps_from_csv(path)
+
+    resultado = {}
+    for piloto, vueltas in pilotos.items():
+        if not piloto:
+            raise ValueError(f"Piloto sin nombre en {path}")
+        numeros = sorted(vueltas)
+        if numeros != list(range(1, len(numeros) + 1)):
+            raise ValueError(f"Vueltas no consecutivas de {piloto}: {numeros}")
+        resultado[piloto] = [vueltas[n] for n in numeros]
+    return inicio, resultado
+
+
+def race_start(inicio, evento):
+    """Hora de salida: la del fichero de vueltas o la fecha y hora del evento"""
+    texto = inicio or f"{evento['fecha']}T{evento['hora'] or '00:00:00'}"
+    try:
+        return datetime.fromisoformat(texto.replace("Z", "+00:00"))
+    except ValueError as e:
+        raise ValueError(f"Hora de salida no válida: {texto}") from e
+
+
+def sample_track(tramos, muestras):
+    """Muestrea el trazado en puntos a intervalos regulares de distancia.
+
+    Devuelve (coordenadas, fracciones): las coordenadas "lon lat alt" de
+    gx:coord, ya formateadas, y la fracción de la vuelta recorrida en cada
+    punto (0 en el primero). Los puntos son vértices del trazado, de modo
+    que la animación sigue la geometría del circuito.
+    """
+    lons = list(tramos.longitud)
+    lats = list(tramos.latitud)
+    alts = list(tramos.altitud)
+    longitudes = analyze_columns(tramos)["longitud"]
+    if tramos.origen is not None:
+        lons.insert(0, tramos.origen.longitud)
+        lats.insert(0, tramos.origen.latitud)
+        alts.insert(0, tramos.origen.altitud)
+    else:
+        longitudes = longitudes[1:]
+
+    acumuladas = [0.0]
+    for longitud in map(float, longitudes):
+        # NaN: tramo sin longitud calculable (el primero si no hay origen)
+        acumuladas.append(acumuladas[-1] + (0.0 if math.isnan(longitud) else longitud))
+    total = acumuladas[-1]
+    if len(lons) < 2 or total <= 0:
+        raise ValueError("El trazado no tiene longitud suficiente para animarlo")
+
+    # Primer vértice a partir de cada distancia objetivo (sin repetir)
+    indices = []
+    objetivo = 0
+    paso = total / muestras
+    for i, distancia in enumerate(acumuladas):
+        if distancia >= objetivo * paso and (not indices or indices[-1] != i):
+            indices.append(i)
+            objetivo = math.floor(distancia / paso) + 1
+    # El último vértice cierra la vuelta (fracción 1) y no se incluye: la
+    # vuelta siguiente empieza en el primero
+
+    coordenadas = [
+        f"{format_fixed(lons[i], DEGREE_DIGITS)} {format_fixed(lats[i], DEGREE_DIGITS)} "
+        f"{format_fixed(alts[i], METER_DIGITS)}"
+        for i in indices
+    ]
+    fracciones = [acumuladas[i] / total for i in indices]
+    if fracciones[-1] >= 1:
+        coordenadas.pop()
+        fracciones.pop()
+    return coordenadas, fracciones
+
+
+def rider_color(i, total):
+    """Color KML (aabbggrr) del piloto i, repartidos por el círculo cromático"""
+    r, g, b = colorsys.hsv_to_rgb(i / max(total, 1), 0.85, 0.95)
+    return f"ff{round(b * 255):02x}{round(g * 255):02x}{round(r * 255):02x}"
+
+
+def _when(instante):
+    return instante.isoformat(timespec="milliseconds")
+
+
+def write_replay_kml(nombre, coordenadas, fracciones, pilotos, salida, vueltas, sink):
+    """Escribe el KML de la carrera en el sink según se genera.
+
+    Cada piloto es un Placemark con un gx:Track (un when y un gx:coord por
+    muestra) y un TimeSpan de su carrera. Las coordenadas se formatean una
+    sola vez y se comparten entre pilotos y vueltas; el trazado estático se
+    escribe una única vez. La carpeta de vueltas marca en la línea de meta
+    el intervalo de cada vuelta del líder. Sólo se escriben las vueltas
+    hasta el número de vueltas del evento. Devuelve el número de muestras
+    escritas.
+    """
+    sink.write(
+        f"""<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">
+  <Document>
+    <name>{escape(nombre)} - Carrera</name>
+    <description>{len(pilotos)} pilotos, {vueltas} vueltas (xml2replay.py)</description>
+"""
+    )
+    for i in range(len(pilotos)):
+        sink.write(
+            f"""    <Style id="piloto{i}">
+      <IconStyle><color>{rider_color(i, len(pilotos))}</color><scale>0.8</scale></IconStyle>
+      <LineStyle><color>{rider_color(i, len(pilotos))}</color><width>2</width></LineStyle>
+    </Style>
+"""
+        )
+
+    # Inicio de cada vuelta de cada piloto (y fin de la última)
+    pasos = {}
+    for piloto, tiempos in pilotos.items():
+        instantes = [salida]
+        for tiempo in tiempos[:vueltas]:
+            instantes.append(instantes[-1] + timedelta(seconds=tiempo))
+        pasos[piloto] = instantes
+
+    # Trazado estático (una sola vez) bajo las animaciones
+    trazado = "\n".join(c.replace(" ", ",") for c in [*coordenadas, coordenadas[0]])
+    sink.write(
+        f"""    <Placemark>
+      <name>Trazado</name>
+      <LineString>
+        <tessellate>1</tessellate>
+        <coordinates>
+{trazado}
+        </coordinates>
+      </LineString>
+    </Placemark>
+"""
+    )
+
+    sink.write("    <Folder>\n      <name>Pilotos</name>\n")
+    muestras = 0
+    for i, (piloto, instantes) in enumerate(pasos.items()):
+        sink.write(
+            f"""      <Placemark>
+        <name>{escape(piloto)}</name>
+        <styleUrl>#piloto{i}</styleUrl>
+        <TimeSpan><begin>{_when(instantes[0])}</begin><end>{_when(instantes[-1])}</end></TimeSpan>
+        <gx:Track>
+"""
+        )
+        whens = []
+        coords = []
+        for inicio, fin in zip(instantes, instantes[1:]):
+            duracion = fin - inicio
+            whens.extend(_when(inicio + duracion * f) for f in fracciones)
+            coords.extend(coordenadas)
+        if len(instantes) > 1:
+            # Paso final por meta
+            whens.append(_when(instantes[-1]))
+            coords.append(coordenadas[0])
+        # gx:Track exige todos los when antes que las coordenadas
+        sink.write("".join([f"          <when>{w}</when>\n" for w in whens]))
+        sink.write("".join([f"          <gx:coord>{c}</gx:coord>\n" for c in coords]))
+        sink.write("        </gx:Track>\n      </Placemark>\n")
+        muestras += len(whens)
+    sink.write("    </Folder>\n")
+
+    # Vuelta en curso según el líder: de su paso por meta al siguiente
+    meta = coordenadas[0].replace(" ", ",")
+    completadas = max((len(p) - 1 for p in pasos.values()), default=0)
+    sink.write("    <Folder>\n      <name>Vueltas</name>\n")
+    for n in range(1, completadas + 1):
+        inicio = min(p[n - 1] for p in pasos.values() if len(p) > n)
+        fin = min(p[n] for p in pasos.values() if len(p) > n)
+        sink.write(
+            f"""      <Placemark>
+        <name>Vuelta {n}/{vueltas}</name>
+        <TimeSpan><begin>{_when(inicio)}</begin><end>{_when(fin)}</end></TimeSpan>
+        <Point><coordinates>{meta}</coordinates></Point>
+      </Placemark>
+"""
+        )
+    sink.write("    </Folder>\n  </Document>\n</kml>\n")
+    return muestras
+
+
+def create_replay(xml_file, laps_file, out_kml, muestras=DEFAULT_SAMPLES, inicio=None):
+    """Genera el KML animado de la carrera a partir del circuito y las vueltas.
+
+    El número de vueltas es el del evento (evento/numeroVueltas) o, si falta,
+    el mayor del fichero de vueltas. out_kml puede ser "-" (stdout) o un .kmz.
+    """
+    out = message_stream(out_kml)
+    try:
+        with profiler.stage("parse"):
+            tramos = load_tramos(xml_file)
+            evento = read_event(xml_file)
+            inicio_vueltas, pilotos = load_laps(laps_file)
+        if not pilotos:
+            raise ValueError(f"No hay vueltas en {laps_file}")
+        vueltas = int(evento["vueltas"] or max(len(t) for t in pilotos.values()))
+        salida = race_start(inicio or inicio_vueltas, evento)
+        with profiler.stage("sample"):
+            coordenadas, fracciones = sample_track(tramos, muestras)
+    except FileNotFoundError as e:
+        print(f"Error: No se encuentra el archivo {e.filename or e}", file=sys.stderr)
+        sys.exit(1)
+    except ET.ParseError as e:
+        print(f"Error al parsear XML: {e}", file=sys.stderr)
+        sys.exit(1)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    with profiler.stage("write"), open_artifact(out_kml) as sink:
+        total = write_replay_kml(
+            tramos.nombre, coordenadas, fracciones, pilotos, salida, vueltas, sink
+        )
+
+    print(f"Generado {out_kml}: {len(pilotos)} pilotos, {vueltas} vueltas", file=out)
+    print(f"Muestras por vuelta: {len(coordenadas)}; total: {total}", file=out)
+    if out_kml != "-" and os.path.exists(out_kml):
+        print(f"Tamaño: {os.path.getsize(out_kml) / 1e6:.2f} MB", file=out)
+
+
+def main(argv):
+    # Uso: xml2replay.py circuito.xml vueltas.csv|vueltas.xml [salida.kml|.kmz]
+    # --samples=N puntos del trazado por vuelta; --start=ISO hora de salida
+    # (por defecto, la del fichero de vueltas o la fecha y hora del evento);
+    # --profile[=FICHERO] (o XML2_PROFILE) emite un informe JSON de tiempos
+    argv = configure(argv, "xml2replay.py")
+    muestras, argv = pop_option(argv, "--samples", DEFAULT_SAMPLES, int)
+    inicio, argv = pop_option(argv, "--start")
+    reject_unknown_options(argv, "circuito.xml vueltas.csv|vueltas.xml [salida.kml]")
+
+    if len(argv) < 3:
+        print("Uso: xml2replay.py circuito.xml vueltas.csv|vueltas.xml [salida.kml]")
+        sys.exit(1)
+    if muestras < 2:
+        print("Error: --samples debe ser al menos 2")
+        sys.exit(1)
+    in_xml, laps_file = argv[1], argv[2]
+    out_kml = argv[3] if len(argv) > 3 else "carrera.kml"
+
+    create_replay(in_xml, laps_file, out_kml, muestras, inicio)
+    profiler.finish()
+
+
+if __name__ == "__main__":
+    main(sys.argv)
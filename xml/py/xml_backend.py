@@ -0,0 +1,129 @@
+import functools
+import os
+import xml.etree.ElementTree as ET
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:  # lxml es opcional: sin él se usa ElementTree sin validación
+    lxml_etree = None
+
+# Variable de entorno para forzar el backend ("lxml" o "etree")
+BACKEND_ENV = "XML2_BACKEND"
+# Esquema con el que se validan los documentos cuando se usa lxml
+SCHEMA_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "circuito.xsd"
+)
+
+
+class InvalidDocumentError(ET.ParseError):
+    """Documento bien formado que no cumple circuito.xsd o tiene valores no válidos.
+
+    Deriva de ET.ParseError para que los scripts lo traten como cualquier
+    otro XML que no se puede procesar.
+    """
+
+
+def backend():
+    """Nombre del backend en uso: "lxml" si está instalado y no se fuerza otro"""
+    elegido = os.environ.get(BACKEND_ENV, "").lower()
+    if lxml_etree is None or elegido == "etree":
+        return "etree"
+    return "lxml"
+
+
+@functools.lru_cache(maxsize=None)
+def load_schema(path=SCHEMA_PATH):
+    """Compila el esquema XSD una sola vez por proceso (requiere lxml)"""
+    return lxml_etree.XMLSchema(lxml_etree.parse(path))
+
+
+def _well_formed_error(xml_file):
+    """ET.ParseError si el documento no está bien formado; None si lo está"""
+    if hasattr(xml_file, "seek"):
+        xml_file.seek(0)
+    lxml_etree.clear_error_log()
+    try:
+        for _, elem in lxml_etree.iterparse(xml_file, remove_comments=True):
+            elem.clear()
+    except lxml_etree.XMLSyntaxError as e:
+        return ET.ParseError(str(e))
+    return None
+
+
+def _syntax_error(error, xml_file):
+    """Convierte un error de lxml en la excepción equivalente de ElementTree.
+
+    Los errores de sintaxis tienen prioridad sobre los de validación, que
+    suelen ser su consecuencia. La validación detiene el parseo en el primer
+    error de esquema (a veces en el elemento raíz), antes de que el parser
+    llegue a un error de sintaxis posterior, así que ante un error de
+    esquema se comprueba además que el documento esté bien formado.
+    """
+    errores = list(error.error_log)
+    if not errores or any(e.domain_name != "SCHEMASV" for e in errores):
+        return ET.ParseError(str(error))
+    sintaxis = _well_formed_error(xml_file)
+    if sintaxis is not None:
+        return sintaxis
+    primero = errores[0]
+    linea = f" (línea {primero.line})" if primero.line else ""
+    return InvalidDocumentError(
+        f"El documento no cumple circuito.xsd: {primero.message}{linea}"
+    )
+
+
+def parse(xml_file, validate=True):
+    """Parsea el documento completo y devuelve su elemento raíz.
+
+    Con lxml el documento se valida contra circuito.xsd (esquema precompilado
+    y en caché); con ElementTree no hay validación.
+    """
+    if backend() == "etree":
+        return ET.parse(xml_file).getroot()
+
+    parser = lxml_etree.XMLParser(
+        schema=load_schema() if validate else None, remove_comments=True
+    )
+    # El registro de errores de lxml es global (por hilo): sin vaciarlo, el
+    # error de un documento arrastraría los de los parseados antes
+    lxml_etree.clear_error_log()
+    try:
+        return lxml_etree.parse(xml_file, parser).getroot()
+    except OSError as e:
+        # lxml informa de los ficheros inexistentes como OSError genérico
+        if not os.path.exists(xml_file):
+            raise FileNotFoundError(xml_file) from e
+        raise
+    except lxml_etree.XMLSyntaxError as e:
+        raise _syntax_error(e, xml_file) from e
+
+
+def iterparse(xml_file, events=("end",), validate=True):
+    """iterparse del backend activo; con lxml valida mientras se lee.
+
+    Si el consumidor deja de leer antes del final sólo se valida la parte leída.
+    """
+    if backend() == "etree":
+        yield from ET.iterparse(xml_file, events=events)
+        return
+
+    if isinstance(xml_file, (str, os.PathLike)) and not os.path.exists(xml_file):
+        raise FileNotFoundError(xml_file)
+    lxml_etree.clear_error_log()
+    contexto = lxml_etree.iterparse(
+        xml_file,
+        events=events,
+        schema=load_schema() if validate else None,
+        remove_comments=True,
+    )
+    try:
+        yield from contexto
+    except lxml_etree.XMLSyntaxError as e:
+        raise _syntax_error(e, xml_file) from e
+
+
+def tostring(elem):
+    """Serializa un elemento de cualquiera de los dos backends"""
+    if lxml_etree is not None and isinstance(elem, lxml_etree._Element):
+        return lxml_etree.tostring(elem)
+    return ET.tostring(elem)